@@ -0,0 +1,618 @@
+#    Copyright 2016 Parinz Ameri, Haipeng Guan
+#
+#    This file is part of Nowog.
+#
+#    Nowog is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Nowog is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Nowog.  If not, see <http://www.gnu.org/licenses/>
+
+"""Execution backends
+
+Executor only uses a small part of a pymongo Database:
+
+	db.command(cmd)                  execute one command (SON), return the result (dict)
+	db.collection_names()            names of all collections
+	db.create_collection(name, **kwargs)
+	db.set_profiling_level(level)
+	db[name]                         collection with .name, .database and .drop()
+
+connect() returns such a database of one of the backends:
+
+	mongodb   pymongo Database of a MongoClient, i.e. a real MongoDB server
+	null      NullDatabase, only counts commands, e.g. to measure the maximum
+	          dispatch rate of NoWog itself
+	memory    MemoryDatabase, applies find, insert, update and delete commands to
+	          documents in Python dicts, with simple field indexes, e.g. to check
+	          commands on a machine without MongoDB
+
+MemoryDatabase supports the query operators generated by NoWog ($eq, $ne, $gt,
+$gte, $lt, $lte, $in, $nin, $exists, $elemMatch, $all, $size, $and, $or, $nor)
+and the update operators $set, $unset, $inc, $push, $addToSet and $pull. Errors
+are raised as OperationFailure with the error code of MongoDB, e.g. 11000 for a
+duplicate _id, so they are classified like errors of pymongo (see retry.py).
+Unsupported operators (e.g. $near, which requires a geospatial index) raise
+OperationFailure as well.
+
+Example:
+	>>> db = connect('memory', None, 'NoWog', indexes=['A4'])
+	>>> db.command(SON([('insert', 'c'), ('documents', [{'A4': 1}])]))
+	{'ok': 1.0, 'n': 1}
+	>>> db.command(SON([('find', 'c'), ('filter', {'A4': 1})]))['cursor']['firstBatch']
+	[{'A4': 1, '_id': ObjectId('...')}]
+"""
+
+import threading
+from collections import Counter, OrderedDict
+
+from sessionfile import decodeCommand
+
+BACKENDS = ['mongodb', 'null', 'memory']
+
+def connect(backend, MongoDB_URL, db_name, indexes=(), **kwargs):
+	"""Database db_name of backend.
+
+	Args:
+		backend (str): {mongodb, null, memory}
+		MongoDB_URL (str): URL of MongoDB, only for mongodb
+		indexes [str]: indexed fields (e.g. 'A12.A4') of all collections, only for memory
+		**kwargs: passed to MongoClient, e.g. maxPoolSize, only for mongodb
+	"""
+	if backend == 'mongodb':
+		from pymongo import MongoClient
+		client = MongoClient(MongoDB_URL, serverSelectionTimeoutMS=1, **kwargs)
+		client.server_info() # force to connect
+		return client[db_name]
+	if backend == 'null':
+		return NullDatabase(db_name)
+	if backend == 'memory':
+		return MemoryDatabase(db_name, indexes)
+	raise ValueError('Unknown backend: [%s]. Available backends include: {%s}' % (backend, ', '.join(BACKENDS)))
+
+class OperationFailure(Exception):
+	"""Error of a command, named after pymongo.errors.OperationFailure for retry.classify()"""
+	def __init__(self, message, code=None):
+		Exception.__init__(self, message)
+		self.code = code
+
+class Collection(object):
+	"""Collection of NullDatabase and MemoryDatabase"""
+	def __init__(self, database, name):
+		self.database = database
+		self.name = name
+
+	def drop(self):
+		self.database.drop_collection(self.name)
+
+class NullDatabase(object):
+	"""Database which executes nothing, and only counts commands of each type
+
+	Attributes:
+		name (str): name of the database
+		counts Counter({str: int}): amount of received commands of each type
+	"""
+	def __init__(self, name):
+		self.name = name
+		self.names = set()
+		self.counts = Counter()
+		self.lock = threading.Lock()
+
+	def __getitem__(self, name):
+		return Collection(self, name)
+
+	def command(self, cmd):
+		cmd_type = next(iter(cmd))
+		with self.lock:
+			self.counts[cmd_type] += 1
+		if cmd_type == 'find':
+			return {'cursor': {'firstBatch': [], 'id': 0, 'ns': '%s.%s' % (self.name, cmd['find'])}, 'ok': 1.0}
+		return {'n': 0, 'ok': 1.0}
+
+	def collection_names(self):
+		return sorted(self.names)
+
+	def create_collection(self, name, **kwargs):
+		self.names.add(name)
+
+	def drop_collection(self, name):
+		self.names.discard(name)
+
+	def set_profiling_level(self, level):
+		pass
+
+	def stats(self):
+		return {'commands': dict(self.counts)}
+
+class MemoryDatabase(NullDatabase):
+	"""Database of MemoryCollection, executing commands one at a time
+
+	Attributes:
+		indexes [str]: indexed fields of every collection
+		collections {str: MemoryCollection}
+	"""
+	def __init__(self, name, indexes=()):
+		NullDatabase.__init__(self, name)
+		self.indexes = list(indexes)
+		self.collections = {}
+
+	def getCollection(self, name):
+		if name not in self.collections:
+			self.collections[name] = MemoryCollection(self.indexes)
+			self.names.add(name)
+		return self.collections[name]
+
+	def command(self, cmd):
+		cmd = decodeCommand(cmd) # raw BSON of session files
+		cmd_type = next(iter(cmd))
+		handler = getattr(self, 'command_' + cmd_type, None)
+		if handler is None:
+			raise OperationFailure('no such command: [%s]' % cmd_type, 59)
+		with self.lock:
+			self.counts[cmd_type] += 1
+			return handler(self.getCollection(cmd[cmd_type]), cmd)
+
+	def command_find(self, coll, cmd):
+		docs = coll.find(cmd.get('filter') or {})
+		if cmd.get('sort'):
+			for field, direction in reversed(cmd['sort'].items()):
+				docs.sort(key=lambda doc: sortKey(getValues(doc, field), direction), reverse=direction < 0)
+		docs = docs[cmd.get('skip', 0):]
+		if cmd.get('limit'):
+			docs = docs[:abs(cmd['limit'])]
+		return {'cursor': {'firstBatch': docs, 'id': 0, 'ns': '%s.%s' % (self.name, cmd['find'])}, 'ok': 1.0}
+
+	def command_insert(self, coll, cmd):
+		n, write_errors = 0, []
+		for i, doc in enumerate(cmd['documents']):
+			try:
+				coll.insert(doc)
+				n += 1
+			except OperationFailure, e:
+				write_errors.append({'index': i, 'code': e.code, 'errmsg': str(e)})
+				if cmd.get('ordered', True):
+					break
+		return self.writeResult({'n': n}, write_errors)
+
+	def command_update(self, coll, cmd):
+		n, modified, upserted, write_errors = 0, 0, [], []
+		for i, statement in enumerate(cmd['updates']):
+			try:
+				matched, changed, _id = coll.update(statement['q'], statement['u'],
+												statement.get('multi', False), statement.get('upsert', False))
+			except OperationFailure, e:
+				write_errors.append({'index': i, 'code': e.code, 'errmsg': str(e)})
+				if cmd.get('ordered', True):
+					break
+				continue
+			n += matched
+			modified += changed
+			if _id is not None:
+				upserted.append({'index': i, '_id': _id})
+				n += 1
+		res = {'n': n, 'nModified': modified}
+		if upserted:
+			res['upserted'] = upserted
+		return self.writeResult(res, write_errors)
+
+	def command_delete(self, coll, cmd):
+		n, write_errors = 0, []
+		for i, statement in enumerate(cmd['deletes']):
+			try:
+				n += coll.delete(statement['q'], statement.get('limit', 0))
+			except OperationFailure, e:
+				write_errors.append({'index': i, 'code': e.code, 'errmsg': str(e)})
+				if cmd.get('ordered', True):
+					break
+		return self.writeResult({'n': n}, write_errors)
+
+	def command_createIndexes(self, coll, cmd):
+		for index in cmd['indexes']:
+			for field in index['key']:
+				coll.createIndex(field)
+		return {'ok': 1.0}
+
+	def writeResult(self, res, write_errors):
+		if write_errors:
+			res['writeErrors'] = write_errors
+		res['ok'] = 1.0
+		return res
+
+	def drop_collection(self, name):
+		with self.lock:
+			self.collections.pop(name, None)
+			NullDatabase.drop_collection(self, name)
+
+	def stats(self):
+		res = NullDatabase.stats(self)
+		res['documents'] = {name: len(coll.documents) for name, coll in self.collections.items()}
+		return res
+
+class MemoryCollection(object):
+	"""Documents in a dict, with simple field indexes
+
+	An index maps each scalar value of a field (each element, if the value is an
+	array) to the keys of the documents with this value. Queries whose top level
+	has an equality or $in of scalar values on an indexed field only match the
+	documents found in the index, all other queries scan all documents.
+
+	Attributes:
+		documents OrderedDict({key: dict}): documents in insertion order, key is hashKey(_id)
+		order {key: int}: insertion number of each document, index lookups return documents in this order
+		indexes {str: {key: set(key)}}: {field: {hashKey(value): keys of documents}}
+	"""
+	def __init__(self, indexes=()):
+		self.documents = OrderedDict()
+		self.order = {}
+		self.inserted = 0
+		self.indexes = {}
+		for field in indexes:
+			self.createIndex(field)
+
+	def createIndex(self, field):
+		if field in self.indexes or field == '_id':
+			return
+		self.indexes[field] = index = {}
+		for key, doc in self.documents.items():
+			for value in indexValues(doc, field):
+				index.setdefault(value, set()).add(key)
+
+	def addToIndexes(self, key, doc):
+		for field, index in self.indexes.items():
+			for value in indexValues(doc, field):
+				index.setdefault(value, set()).add(key)
+
+	def removeFromIndexes(self, key, doc):
+		for field, index in self.indexes.items():
+			for value in indexValues(doc, field):
+				keys = index.get(value)
+				if keys is not None:
+					keys.discard(key)
+					if not keys:
+						del index[value]
+
+	def candidates(self, query):
+		"""Keys of documents which may match query, using _id and field indexes. None means all documents"""
+		res = None
+		for field, cond in query.items():
+			if field != '_id' and field not in self.indexes:
+				continue
+			values = indexedValues(cond)
+			if values is None:
+				continue
+			if field == '_id':
+				keys = set(key for key in values if key in self.documents)
+			else:
+				keys = set()
+				for value in values:
+					keys.update(self.indexes[field].get(value, ()))
+			res = keys if res is None else res & keys
+		return res
+
+	def iterMatch(self, query):
+		"""Iterate over (key, doc) of documents matching query"""
+		checkQuery(query)
+		conditions = query.items()
+		keys = self.candidates(query)
+		if keys is None:
+			docs = self.documents.iteritems()
+		else:
+			docs = ((key, self.documents[key]) for key in sorted(keys, key=self.order.get))
+		for key, doc in docs:
+			if matchConditions(doc, conditions):
+				yield key, doc
+
+	def find(self, query):
+		return [copyValue(doc) for _, doc in self.iterMatch(query)]
+
+	def insert(self, doc):
+		doc = copyValue(doc)
+		if '_id' not in doc:
+			from bson.objectid import ObjectId
+			doc = OrderedDict([('_id', ObjectId())] + doc.items())
+		key = hashKey(doc['_id'])
+		if key in self.documents:
+			raise OperationFailure('E11000 duplicate key error index: _id_ dup key: { : %r }' % (doc['_id'],), 11000)
+		self.documents[key] = doc
+		self.order[key] = self.inserted
+		self.inserted += 1
+		self.addToIndexes(key, doc)
+		return doc['_id']
+
+	def update(self, query, update, multi=False, upsert=False):
+		"""Apply update to the first (or every, if multi) document matching query
+
+		Returns:
+			(amount of matched documents, amount of modified documents, _id of upserted document or None)
+		"""
+		matched = 0
+		modified = 0
+		for key, doc in list(self.iterMatch(query)):
+			new = applyUpdate(doc, update)
+			matched += 1
+			if new != doc:
+				if hashKey(new.get('_id')) != key:
+					raise OperationFailure('the (immutable) field \'_id\' was found to have been altered', 66)
+				self.removeFromIndexes(key, doc)
+				self.documents[key] = new
+				self.addToIndexes(key, new)
+				modified += 1
+			if not multi:
+				break
+		if matched == 0 and upsert:
+			equalities = OrderedDict((k, v) for k, v in query.items() if not k.startswith('$') and not isOperator(v))
+			base = applyUpdate(OrderedDict(), {'$set': equalities}) if equalities else OrderedDict()
+			return 0, 0, self.insert(applyUpdate(base, update))
+		return matched, modified, None
+
+	def delete(self, query, limit=0):
+		"""Delete documents matching query, at most one if limit is 1. Return the amount of deleted documents"""
+		n = 0
+		for key, doc in list(self.iterMatch(query)):
+			self.removeFromIndexes(key, doc)
+			del self.documents[key]
+			del self.order[key]
+			n += 1
+			if limit == 1:
+				break
+		return n
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# documents and values
+
+def copyValue(value):
+	"""Deep copy of a document (SON, dict), array or value"""
+	if isinstance(value, dict):
+		return OrderedDict((k, copyValue(v)) for k, v in value.items())
+	if isinstance(value, list):
+		return [copyValue(v) for v in value]
+	return value
+
+def hashKey(value):
+	"""Hashable key of a value, where booleans are not equal to numbers"""
+	if isinstance(value, dict):
+		return ('doc', tuple((k, hashKey(v)) for k, v in value.items()))
+	if isinstance(value, list):
+		return ('array', tuple(hashKey(v) for v in value))
+	return (isinstance(value, bool), value)
+
+def isScalar(value):
+	return not isinstance(value, (dict, list))
+
+def isOperator(value):
+	"""True if value is a document of operators, e.g. {'$gte': 1, '$lt': 5}"""
+	return isinstance(value, dict) and len(value) > 0 and all(k.startswith('$') for k in value)
+
+def getValues(doc, path):
+	"""[values] of a dotted path in doc. Arrays on the path are traversed, so there can be several values"""
+	values = [doc]
+	for part in path.split('.'):
+		res = []
+		for value in values:
+			if isinstance(value, dict):
+				if part in value:
+					res.append(value[part])
+			elif isinstance(value, list):
+				if part.isdigit() and int(part) < len(value):
+					res.append(value[int(part)])
+				res.extend(v[part] for v in value if isinstance(v, dict) and part in v)
+		values = res
+	return values
+
+def expand(values):
+	"""values and the elements of all arrays in values"""
+	res = []
+	for value in values:
+		res.append(value)
+		if isinstance(value, list):
+			res.extend(value)
+	return res
+
+def indexValues(doc, field):
+	"""Keys of the scalar values (and scalar elements of arrays) of field in doc"""
+	return set(hashKey(v) for v in expand(getValues(doc, field)) if isScalar(v))
+
+def indexedValues(cond):
+	"""Keys of the values which a document must have to match cond, or None if an index does not help"""
+	if isScalar(cond):
+		return [hashKey(cond)]
+	if isOperator(cond) and len(cond) == 1:
+		op, arg = cond.items()[0]
+		if op == '$eq' and isScalar(arg):
+			return [hashKey(arg)]
+		if op == '$in' and isinstance(arg, list) and all(isScalar(v) for v in arg):
+			return [hashKey(v) for v in arg]
+	return None
+
+def equal(a, b):
+	return hashKey(a) == hashKey(b)
+
+# order of types in comparison and sorting, as in MongoDB
+def typeOrder(value):
+	if value is None: return 1
+	if isinstance(value, bool): return 8
+	if isinstance(value, (int, long, float)): return 2
+	if isinstance(value, basestring): return 3
+	if isinstance(value, dict): return 4
+	if isinstance(value, list): return 5
+	return 9
+
+def compare(a, b):
+	"""cmp() of values of the same type order, None if they are not comparable"""
+	if typeOrder(a) != typeOrder(b):
+		return None
+	return cmp(a, b)
+
+def sortKey(values, direction):
+	"""Sort key of the values of a field: the smallest (ascending) or largest (descending) element"""
+	values = [v for v in expand(values) if not isinstance(v, list)] or [None]
+	keys = [(typeOrder(v), v) for v in values]
+	return min(keys) if direction > 0 else max(keys)
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# query
+
+QUERY_OPERATORS = set(['$eq', '$ne', '$gt', '$gte', '$lt', '$lte', '$in', '$nin', '$exists', '$elemMatch', '$all', '$size'])
+GEO_OPERATORS = set(['$near', '$nearSphere', '$geoWithin', '$geoIntersects'])
+
+def checkQuery(query):
+	"""Raise OperationFailure for unknown or unsupported operators in query, as MongoDB does before
+	matching any document"""
+	for field, cond in query.items():
+		if field in ('$and', '$or', '$nor'):
+			for q in cond:
+				checkQuery(q)
+		elif field.startswith('$'):
+			raise OperationFailure('unknown top level operator: %s' % field, 2)
+		elif isOperator(cond):
+			for op, arg in cond.items():
+				if op in GEO_OPERATORS:
+					raise OperationFailure('%s is not supported by the memory backend (requires a geospatial index)' % op, 291)
+				if op not in QUERY_OPERATORS:
+					raise OperationFailure('unknown operator: %s' % op, 2)
+				if op == '$elemMatch' and isinstance(arg, dict) and not isOperator(arg):
+					checkQuery(arg)
+
+def match(doc, query):
+	"""True if doc matches query"""
+	return matchConditions(doc, query.items())
+
+def matchConditions(doc, conditions):
+	"""True if doc matches all (field, cond) of conditions, i.e. the items of a query"""
+	for field, cond in conditions:
+		if field == '$and':
+			if not all(match(doc, q) for q in cond): return False
+		elif field == '$or':
+			if not any(match(doc, q) for q in cond): return False
+		elif field == '$nor':
+			if any(match(doc, q) for q in cond): return False
+		elif not matchField(getValues(doc, field), cond):
+			return False
+	return True
+
+def matchField(values, cond):
+	"""True if values (see getValues()) of a field match cond, a value or a document of operators"""
+	if not isOperator(cond):
+		return any(equal(v, cond) for v in expand(values))
+	return all(matchOperator(values, op, arg) for op, arg in cond.items())
+
+def matchOperator(values, op, arg):
+	if op == '$eq':
+		return any(equal(v, arg) for v in expand(values))
+	if op == '$ne':
+		return not matchOperator(values, '$eq', arg)
+	if op in COMPARISONS:
+		test = COMPARISONS[op]
+		return any(compare(v, arg) is not None and test(compare(v, arg)) for v in expand(values))
+	if op == '$in':
+		return any(matchOperator(values, '$eq', x) for x in arg)
+	if op == '$nin':
+		return not matchOperator(values, '$in', arg)
+	if op == '$exists':
+		return bool(values) == bool(arg)
+	if op == '$elemMatch':
+		for array in values:
+			if isinstance(array, list):
+				for element in array:
+					if isOperator(arg) and matchField([element], arg):
+						return True
+					if isinstance(element, dict) and not isOperator(arg) and match(element, arg):
+						return True
+		return False
+	if op == '$all':
+		return all(matchOperator(values, '$eq', x) for x in arg)
+	if op == '$size':
+		return any(isinstance(v, list) and len(v) == arg for v in values)
+	raise OperationFailure('unknown operator: %s' % op, 2)
+
+COMPARISONS = {
+	'$gt': lambda c: c > 0,
+	'$gte': lambda c: c >= 0,
+	'$lt': lambda c: c < 0,
+	'$lte': lambda c: c <= 0,
+}
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# update
+
+def applyUpdate(doc, update):
+	"""New document of doc updated by update, a document of update operators or a replacement"""
+	if not isOperator(update):
+		if any(k.startswith('$') for k in update):
+			raise OperationFailure('unknown modifier in: %r' % update.keys(), 9)
+		new = OrderedDict([('_id', doc['_id'])]) if '_id' in doc else OrderedDict()
+		new.update(copyValue(update))
+		return new
+	new = copyValue(doc)
+	for op, fields in update.items():
+		if op not in UPDATES:
+			raise OperationFailure('Unknown modifier: %s' % op, 9)
+		for path, arg in fields.items():
+			parent, name = getParent(new, path, op != '$unset')
+			if parent is not None:
+				UPDATES[op](parent, name, copyValue(arg))
+	return new
+
+def getParent(doc, path, create):
+	"""(parent document, last part) of a dotted path, creating missing documents if create"""
+	parts = path.split('.')
+	for part in parts[:-1]:
+		if isinstance(doc, list) and part.isdigit() and int(part) < len(doc):
+			doc = doc[int(part)]
+			continue
+		if not isinstance(doc, dict):
+			raise OperationFailure('Cannot create field \'%s\' in element %r' % (part, doc), 28)
+		if part not in doc:
+			if not create:
+				return None, None
+			doc[part] = OrderedDict()
+		doc = doc[part]
+	if not isinstance(doc, dict):
+		raise OperationFailure('Cannot create field \'%s\' in element %r' % (parts[-1], doc), 28)
+	return doc, parts[-1]
+
+def updateInc(parent, name, arg):
+	value = parent.get(name, 0)
+	if typeOrder(value) != 2 or typeOrder(arg) != 2:
+		raise OperationFailure('Cannot apply $inc to a value of non-numeric type', 14)
+	parent[name] = value + arg
+
+def updateArray(parent, name, op):
+	value = parent.setdefault(name, [])
+	if not isinstance(value, list):
+		raise OperationFailure('The field \'%s\' must be an array to apply %s' % (name, op), 2)
+	return value
+
+def updatePush(parent, name, arg):
+	array = updateArray(parent, name, '$push')
+	if isinstance(arg, dict) and '$each' in arg:
+		array.extend(arg['$each'])
+	else:
+		array.append(arg)
+
+def updateAddToSet(parent, name, arg):
+	array = updateArray(parent, name, '$addToSet')
+	for x in (arg['$each'] if isinstance(arg, dict) and '$each' in arg else [arg]):
+		if not any(equal(x, y) for y in array):
+			array.append(x)
+
+def updatePull(parent, name, arg):
+	if name in parent:
+		array = updateArray(parent, name, '$pull')
+		array[:] = [x for x in array if not matchField([x], arg)]
+
+UPDATES = {
+	'$set': lambda parent, name, arg: parent.__setitem__(name, arg),
+	'$unset': lambda parent, name, arg: parent.pop(name, None),
+	'$inc': updateInc,
+	'$push': updatePush,
+	'$addToSet': updateAddToSet,
+	'$pull': updatePull,
+}
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+
+#    Copyright 2016 Parinz Ameri, Haipeng Guan
+#
+#    This file is part of Nowog.
+#
+#    Nowog is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Nowog is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Nowog.  If not, see <http://www.gnu.org/licenses/>
+
+"""Benchmarks of NoWog itself, no database is required.
+
+Usage example:
+	Compare the rate of command generation of recursive mapping(), compiled
+	Template (one command at a time) and Template batch (all commands at once)
+	for each rule in inputs/all_cases.txt
+
+		$ python benchmark.py mapping --in inputs/all_cases.txt --size 10000
+
+	Besides the full rate, the rate of "structure only" is measured with all
+	random value generators replaced by constants, i.e. the part of work
+	which Template saves.
+
+	Measure the maximum dispatch rate of Executor, all operations of all rules
+	of inputs/all_cases.txt are sent at once to the null backend (nothing is
+	executed) or to the in-memory stand-in of MongoDB (see backends.py)
+
+		$ python benchmark.py dispatch --backend null --size 10000 --threads 4
+
+	Measure the wall time of main.py in each mode (mapping only, --show, --try and
+	--run), run as a new process with the null backend and 100 operations
+
+		$ python benchmark.py startup --repeat 5
+
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import parser
+import mapping
+import backends
+
+
+def mappingPairs(db_cmd, parser_result):
+	"""[(SON, dictionary)] mapped for one command of a rule, as in DBCommand"""
+	read, write = parser_result['read'], parser_result['write']
+	pairs = []
+	if read != [] and read[0] != 'ALL':
+		pairs.append((mapping.makeSON(mapping.unpack(read)), db_cmd.query_dict))
+	if db_cmd.isUpdate(read, write):
+		pairs.append((mapping.makeSON(mapping.unpack(write)), db_cmd.update_dict))
+	elif db_cmd.isInsert(read, write):
+		pairs.append((mapping.makeSON(write), db_cmd.document_dict))
+	return pairs
+
+def rate(func, size):
+	"""Calls of func per second"""
+	begin = time.time()
+	for _ in xrange(size):
+		func()
+	return size / (time.time() - begin)
+
+def constant(dictionary):
+	"""Copy of dictionary with all value functions replaced by a constant"""
+	return {k: (op, lambda: 0, lambda n: [0] * n) for k, (op, _, _) in dictionary.items()}
+
+def benchMapping(rulesetStr, size, seed=0):
+	"""Rate (commands/sec) of mapping(), Template and Template batch of each rule.
+	mapping() and Template.make() draw single values by random.Random, batches by numpy
+
+	Returns:
+		[(ID, [rates of full, rates of structure])], rates are [mapping, Template, batch]
+	"""
+	db_cmd = mapping.DBCommand(seed)
+	res = []
+	for ID, rule in sorted(parser.parse_rulesetStr(rulesetStr).items()):
+		rates = []
+		for structure_only in (False, True):
+			pairs = mappingPairs(db_cmd, rule['parser_result'])
+			if structure_only:
+				pairs = [(data, constant(dictionary)) for data, dictionary in pairs]
+			def recursive():
+				for data, dictionary in pairs:
+					mapping.mapping(data, dictionary)
+			templates = [mapping.Template(data, dictionary).make for data, dictionary in pairs]
+			def compiled():
+				for make in templates:
+					make()
+			batches = [mapping.Template(data, dictionary).makeBatch for data, dictionary in pairs]
+			def batch():
+				for makeBatch in batches:
+					makeBatch(size)
+			rates.append([rate(recursive, size), rate(compiled, size), rate(batch, 1) * size])
+		res.append((ID, rates))
+	return res
+
+def benchDispatch(rulesetStr, size, backend='null', threads=0, indexes=(), seed=0):
+	"""Rate (operations/sec) of Executor sending size operations of each rule, all scheduled at 0.
+	indexes are the indexed fields of the memory backend.
+
+	Returns:
+		(amount of operations, seconds, rate, Executor, database)
+	"""
+	import executor
+	db = backends.connect(backend, None, 'NoWog_bench', indexes)
+	exe = executor.Executor(db['bench'], threads=threads, telemetry_interval=0)
+	db_cmd = mapping.DBCommand(seed)
+	total = 0
+	for ID, rule in sorted(parser.parse_rulesetStr(rulesetStr).items()):
+		result = rule['parser_result']
+		cmds = db_cmd.makeCommands(result['read'], result['write'], result['sort'], size, 'bench')
+		exe.addSession(ID, [0.0] * size, cmds)
+		total += size
+	begin = time.time()
+	exe.execute(begin)
+	seconds = time.time() - begin
+	return total, seconds, total / seconds, exe, db
+
+# command line options of main.py in each mode
+STARTUP_MODES = [
+	('mapping', []),
+	('show', ['--show']),
+	('try', ['--try']),
+	('run', ['--run']),
+]
+
+# 100 operations in 1 second, scaled to 10 ms by time_scale_factor
+STARTUP_RULES = """{
+	STARTUP: { {(A1: num_match)}, {}, NULL, 0 - 1 = uniform(100) };
+}
+"""
+
+# no caches, no outputs except reports, which are saved instead of being displayed
+STARTUP_CONFIG = """[inputs]
+input_files = rules.txt
+[outputs]
+report_path = report
+[connection]
+backend = null
+[seed]
+seed = 0
+[scale_factor]
+size_scale_factor = 1.0
+time_scale_factor = 0.01
+"""
+
+def benchStartup(repeat=5):
+	"""Wall time (sec) of main.py in each mode, run as a new process in a temporary
+	directory with the null backend and a tiny rule file, i.e. mostly startup time.
+	--run also waits for executor.START_DELAY before the first operation.
+
+	Returns:
+		[(mode, [seconds of each repeat])]
+	"""
+	main_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+	work_dir = tempfile.mkdtemp()
+	try:
+		with open(os.path.join(work_dir, 'rules.txt'), 'w') as f:
+			f.write(STARTUP_RULES)
+		with open(os.path.join(work_dir, 'config.ini'), 'w') as f:
+			f.write(STARTUP_CONFIG)
+		res = []
+		for mode, options in STARTUP_MODES:
+			times = []
+			for _ in xrange(repeat):
+				begin = time.time()
+				process = subprocess.Popen([sys.executable, main_py] + options, cwd=work_dir,
+											stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+				out = process.communicate()[0]
+				times.append(time.time() - begin)
+				# main.py exits with status 0 after logging an error
+				if process.returncode or ' - ERROR - ' in out:
+					raise RuntimeError('main.py %s failed:\n%s' % (' '.join(options), out))
+			res.append((mode, times))
+	finally:
+		shutil.rmtree(work_dir)
+	return res
+
+
+if __name__ == '__main__':
+	arg_parser = argparse.ArgumentParser(description='Benchmarks of NoWog')
+	subparsers = arg_parser.add_subparsers(dest='bench')
+	mapping_parser = subparsers.add_parser('mapping', help='rate of command generation of mapping(), Template and Template batch')
+	mapping_parser.add_argument('--in', dest='infile', help='input BNF file. Default is inputs/all_cases.txt', default='inputs/all_cases.txt')
+	mapping_parser.add_argument('--size', help='amount of commands of each rule. Default is 10000', type=int, default=10000)
+	dispatch_parser = subparsers.add_parser('dispatch', help='maximum dispatch rate of Executor with the null or memory backend')
+	dispatch_parser.add_argument('--in', dest='infile', help='input BNF file. Default is inputs/all_cases.txt', default='inputs/all_cases.txt')
+	dispatch_parser.add_argument('--size', help='amount of operations of each rule. Default is 10000', type=int, default=10000)
+	dispatch_parser.add_argument('--backend', help='backend: {null, memory}. Default is null', choices=['null', 'memory'], default='null')
+	dispatch_parser.add_argument('--threads', help='worker threads of Executor. Default is 0', type=int, default=0)
+	dispatch_parser.add_argument('--indexes', help='indexed fields of the memory backend, e.g. A4 A12.A4', nargs='*', default=[])
+	startup_parser = subparsers.add_parser('startup', help='wall time of main.py in each mode with a tiny rule file and the null backend')
+	startup_parser.add_argument('--repeat', help='amount of measurements of each mode. Default is 5', type=int, default=5)
+	args = arg_parser.parse_args()
+
+	if args.bench == 'mapping':
+		with open(args.infile, 'r') as f:
+			rulesetStr = f.read()
+		columns = ('mapping', 'Template', 'batch')
+		print '%-12s %-27s | %s' % ('', 'full', 'structure')
+		print '%-12s %8s %8s %9s | %8s %8s %9s' % (('rule',) + columns + columns)
+		for ID, (full, structure) in benchMapping(rulesetStr, args.size):
+			print '%-12s %8.0f %8.0f %9.0f | %8.0f %8.0f %9.0f' % tuple([ID] + full + structure)
+		print 'rates in commands/sec'
+	elif args.bench == 'dispatch':
+		with open(args.infile, 'r') as f:
+			rulesetStr = f.read()
+		total, seconds, rate, exe, db = benchDispatch(rulesetStr, args.size, args.backend, args.threads, args.indexes)
+		print '%d operations in %.3f sec: %.0f operations/sec (backend %s, %d threads)' % (total, seconds, rate, args.backend, args.threads)
+		print 'backend:', db.stats()
+		errors = sum(sum(c.values()) for c in exe.error_count.values())
+		if errors:
+			print 'errors:', dict(sum(exe.error_count.values(), Counter()))
+	elif args.bench == 'startup':
+		import executor
+		print '%-10s %8s %8s' % ('mode', 'min', 'median')
+		for mode, times in benchStartup(args.repeat):
+			print '%-10s %8.3f %8.3f' % (mode, min(times), sorted(times)[len(times)//2])
+		print 'wall time of main.py in seconds, run includes a start delay of %g sec' % executor.START_DELAY
@@ -16,8 +16,18 @@
 #    along with Nowog.  If not, see <http://www.gnu.org/licenses/>
 
 
+import math
+from itertools import chain
 import numpy as np
 
+import seeds
+
+# amount of samples generated at once by iterSamples()
+CHUNK_SIZE = 65536
+
+# amount of grid points used for inverting the CDF of polynomial distribution
+POLY_GRID = 4096
+
 class Distribution(object):
 	"""Draw samples under specific type of distribution
 
@@ -26,14 +36,34 @@ class Distribution(object):
 		by numpy.linspace, in order to provide a more evenly distributed
 		samples
 
+		Samples of normal, exponential, linear and polynomial distribution are drawn
+		by inverse transform sampling of their CDF truncated to [low, high),
+		applied to sorted uniform samples. All of them are vectorized, and
+		samples are ascending without sorting. The sorted uniform samples are
+		drawn in chunks (see iterSortedUniform()), so all types are generated
+		chunk by chunk by iterSamples().
+
+		poisson, piecewise and burst are arrival processes (Poisson process,
+		non-homogeneous Poisson process with piecewise constant rate and
+		two-state Markov modulated Poisson process). Since the amount of
+		samples (total) is given, they are sampled conditioned on size
+		arrivals in [low, high), i.e. as independent arrival times whose
+		density is proportional to the arrival rate. Inter-arrival times are
+		random, unlike "uniform".
+
+	Attributes:
+		rand (RandomState): random state of this instance, independent of numpy.random
+			and of other instances
+
 	"""
 
 	def __init__(self, seed=None):
+		self.rand = np.random.RandomState()
 		self.seed(seed)
 
 	def seed(self, seed=None):
-		"""Change the seed in numpy.random"""
-		np.random.seed(seed)
+		"""Change the seed (int) of the RandomState of this instance"""
+		self.rand.seed(None if seed is None else seeds.stateWords(seed))
 
 	def drawSamples(self, d_type, low, high, size, *args):
 		"""Draw samples based on distribution type (d_type)
@@ -42,54 +72,368 @@ class Distribution(object):
 			It should be the only interface that this generator should use
 
 		Args:
-			d_type (str): distribution type: {uniform, normal}
+			d_type (str): distribution type: {uniform, normal, exponential, linear, polynomial, poisson, piecewise, burst, rate}
 			low (float/int): Lower boundary of the output samples.
 							 All values generated will be greater than or equal to low
 			high (float/int): Upper boundary of the output samples.
 								All values generated will be less than high.
 			size: (int): total amount of output samples
 			*args: [float]: additional arguments required by different distribution
+				uniform: no argument
+				normal: sigma, and optionally mu. Default mu is the middle of [low, high)
+				exponential: scale, i.e. 1/rate. Negative scale means growing instead of decaying load.
+				linear: relative density at low and at high
+				polynomial: coefficients c0, c1, ..., cn of the relative density
+							c0 + c1*x + ... + cn*x**n, where x is scaled from [low, high) to [0, 1)
+				poisson: no argument
+				piecewise: relative rates r1, r2, ..., rn of n periods of equal length in [low, high)
+				burst: mean length of on periods, mean length of off periods, and the ratio
+						between the rates in on and off periods (at least 1)
+				rate: a rate profile, see rateProfile()
+
+		Returns:
+			numpy array of float
+		"""
+		return joinChunks(self.iterChunks(d_type, low, high, size, *args))
+
+	def iterSamples(self, d_type, low, high, size, *args):
+		"""Iterate over samples in ascending order, the lazy version of drawSamples()
+
+		Samples are generated in chunks of CHUNK_SIZE, so memory usage does not depend
+		on size (burst keeps its on/off periods, whose amount depends on high - low).
+		The samples are the same as those of drawSamples() with the same seed.
+		Errors of arguments are raised immediately.
+
+		Args:
+			The same as drawSamples()
+
+		Returns:
+			iterator of float
 		"""
+		return chain.from_iterable(chunk.tolist() for chunk in self.iterChunks(d_type, low, high, size, *args))
+
+	def iterChunks(self, d_type, low, high, size, *args):
+		"""Iterate over the samples of drawSamples() as numpy arrays of at most CHUNK_SIZE samples"""
 		if d_type == 'uniform':
-			return self.linspace(low, high, size)
+			return self.iterLinspace(low, high, size)
 			# return self.uniform(low, high, size)
-		# elif d_type == 'linspace':
-		# 	return self.linspace(low, high, size)
 		elif d_type == 'normal':
-			return self.normal(low, high, size, args[0])
+			if len(args) not in (1, 2):
+				raise ValueError('[normal] distribution requires 1 or 2 arguments, %d given' % len(args))
+			return self.normal(low, high, size, *args)
+		elif d_type == 'exponential':
+			checkArguments(d_type, args, 1)
+			return self.exponential(low, high, size, args[0])
+		elif d_type == 'linear':
+			checkArguments(d_type, args, 2)
+			return self.linear(low, high, size, args[0], args[1])
+		elif d_type == 'polynomial':
+			return self.polynomial(low, high, size, *args)
+		elif d_type == 'poisson':
+			checkArguments(d_type, args, 0)
+			return self.poisson(low, high, size)
+		elif d_type == 'piecewise':
+			return self.piecewise(low, high, size, *args)
+		elif d_type == 'burst':
+			checkArguments(d_type, args, 3)
+			return self.burst(low, high, size, *args)
+		elif d_type == 'rate':
+			return self.rate(low, high, size, *args)
 		else:
-			raise KeyError('Unknown distribution type: [%s]. Available types include: {uniform, normal}' % d_type)
+			raise KeyError('Unknown distribution type: [%s]. Available types include: {uniform, normal, exponential, linear, polynomial, poisson, piecewise, burst, rate}' % d_type)
+
+	def iterLinspace(self, low, high, size):
+		"""Iterate over chunks of linspace(low, high, size)"""
+		step = (high - low) / float(size) if size else 0
+		for i in xrange(0, size, CHUNK_SIZE):
+			yield low + step * np.arange(i, min(i+CHUNK_SIZE, size))
 
 	def uniform(self, low, high, size):
-		return sorted(np.random.uniform(low, high, size))
+		return sorted(self.rand.uniform(low, high, size))
 
-	def linspace(self, low, high, size):
-		return np.linspace(low, high, size, endpoint=False)
+	def normal(self, low, high, size, sigma, mu=None):
+		"""Chunks of samples of normal distribution truncated to [low, high)
+
+		Sorted uniform samples between CDF(low) and CDF(high) are mapped by the
+		inverse CDF, so every sample falls into [low, high) in a single pass, no
+		matter how wide sigma is.
 
-	def normal(self, low, high, size, sigma):
-		"""Draw sample from normal distribution
 		Note:
-			mu will be generated automatically. Only sigma is required.
+			If mu is not given, it is the middle of [low, high).
+		"""
+		if sigma <= 0:
+			raise ValueError('sigma of normal distribution must be greater than 0')
+		if mu is None:
+			mu = (low + high) / 2.0
+		a, b = (low - mu) / float(sigma), (high - mu) / float(sigma)
+		# sample in the lower tail, where CDF has full precision, and mirror back
+		mirror = a + b > 0
+		if mirror:
+			a, b = -b, -a
+		cdf_a, cdf_b = normCDF(a), normCDF(b)
+		def transform(u):
+			# descending uniform samples give ascending samples after mirroring
+			v, w = (1 - u, u) if mirror else (u, 1 - u)
+			if cdf_b > cdf_a:
+				z = normPPF(cdf_a + v * (cdf_b - cdf_a))
+			else:
+				# CDF underflows far in the tail (b < -37), where the density is
+				# proportional to exp(b * (b - z)), i.e. an exponential distribution
+				z = b + np.log1p(w * np.expm1(b * (b - a))) / -b
+			return np.clip(mu + sigma * (-z if mirror else z), low, np.nextafter(high, low))
+		return (transform(u) for u in self.iterSortedUniform(size))
+
+	def sortedUniform(self, size):
+		"""size samples of uniform distribution in [0, 1), in ascending order.
+
+		The sorted samples (order statistics) are drawn directly as normalized
+		cumulative sums of exponential samples, which is O(size) instead of sorting.
+		"""
+		spacings = np.cumsum(self.rand.exponential(1.0, size + 1))
+		return spacings[:-1] / spacings[-1]
+
+	def iterSortedUniform(self, size):
+		"""Iterate over sortedUniform(size) in chunks of CHUNK_SIZE samples
+
+		The last sample of a chunk is the CHUNK_SIZE-th smallest of the remaining
+		samples in [begin, 1), which is begin + (1 - begin) * Beta(CHUNK_SIZE, left - CHUNK_SIZE + 1).
+		The other samples of the chunk are sorted uniform samples below it.
+		"""
+		begin, left = 0.0, size
+		while left > CHUNK_SIZE:
+			end = begin + (1 - begin) * self.rand.beta(CHUNK_SIZE, left - CHUNK_SIZE + 1)
+			yield np.append(begin + (end - begin) * self.sortedUniform(CHUNK_SIZE - 1), end)
+			begin, left = end, left - CHUNK_SIZE
+		if left > 0:
+			yield begin + (1 - begin) * self.sortedUniform(left)
+
+	def exponential(self, low, high, size, scale):
+		"""Chunks of samples of exponential distribution truncated to [low, high)
+
+		The density is proportional to exp(-(x - low) / scale). With negative scale,
+		the density grows towards high: samples of the decaying distribution with
+		scale -scale are reflected at the middle of [low, high), since
+		exp(rate * (high - low)) overflows for a long growing load.
+		"""
+		if scale == 0:
+			raise ValueError('scale of exponential distribution must not be 0')
+		rate = 1.0 / abs(scale)
+		tail = np.expm1(-rate * (high - low))
+		def transform(u):
+			if scale > 0:
+				# inverse CDF: low - log(1 - u * (1 - exp(-rate * (high - low)))) / rate
+				x = low - np.log1p(u * tail) / rate
+			else:
+				# the inverse CDF of 1 - u, reflected
+				x = high + np.log(1 + tail - u * tail) / rate
+			return np.clip(x, low, np.nextafter(high, low))
+		return (transform(u) for u in self.iterSortedUniform(size))
+
+	def linear(self, low, high, size, start, end):
+		"""Chunks of samples of a distribution whose density changes linearly in [low, high)
+
+		The density is proportional to start at low and to end at high. E.g.
+		linear(0, 1) is a linear ramp-up of load, linear(1, 0) a linear decay.
+		"""
+		if start < 0 or end < 0 or start + end == 0:
+			raise ValueError('density of linear distribution must be non-negative and not always 0')
+		return (np.clip(low + linearInverse(u, start, end) * (high - low), low, np.nextafter(high, low))
+				for u in self.iterSortedUniform(size))
+
+	def polynomial(self, low, high, size, *coefficients):
+		"""Chunks of samples of a distribution whose density is a polynomial in [low, high)
+
+		The density is proportional to c0 + c1*t + ... + cn*t**n, where t is
+		(x - low) / (high - low). The CDF is inverted by interpolation on a grid,
+		refined by Newton's method.
+		"""
+		if not coefficients:
+			raise ValueError('polynomial distribution requires at least one coefficient')
+		polyval = np.polynomial.polynomial.polyval
+		pdf = np.asarray(coefficients, dtype=float)
+		cdf = np.polynomial.polynomial.polyint(pdf)
+		grid = np.linspace(0, 1, POLY_GRID + 1)
+		total = polyval(1.0, cdf)
+		if (polyval(grid, pdf) < 0).any() or total <= 0:
+			raise ValueError('density of polynomial distribution must be non-negative in [low, high) and not always 0')
+		grid_cdf = polyval(grid, cdf)
+		def chunks():
+			last = 0.0
+			for u in self.iterSortedUniform(size):
+				target = u * total
+				t = np.interp(target, grid_cdf, grid)
+				for _ in xrange(2):
+					density = polyval(t, pdf)
+					with np.errstate(divide='ignore', invalid='ignore'):
+						t = np.where(density > 0, t - (polyval(t, cdf) - target) / density, t)
+					t = np.clip(t, 0, 1)
+				# Newton steps may break the order where density is close to 0
+				t = np.maximum.accumulate(np.maximum(t, last))
+				last = t[-1]
+				yield np.clip(low + t * (high - low), low, np.nextafter(high, low))
+		return chunks()
+
+	def poisson(self, low, high, size):
+		"""Arrival times of a Poisson process with size arrivals in [low, high)
+
+		Inter-arrival times are exponentially distributed.
+		"""
+		return (low + u * (high - low) for u in self.iterSortedUniform(size))
+
+	def piecewise(self, low, high, size, *rates):
+		"""Arrival times of a Poisson process whose rate is piecewise constant
+
+		[low, high) is split into len(rates) periods of equal length, the arrival
+		rate of each period is proportional to its rate. A rate can be 0.
+		"""
+		if not rates:
+			raise ValueError('piecewise distribution requires at least one rate')
+		return self.piecewiseConstant(np.linspace(low, high, len(rates) + 1), rates, size)
+
+	def burst(self, low, high, size, on, off, ratio):
+		"""Arrival times of an on/off (two-state Markov modulated) Poisson process
+
+		The process alternates between on and off periods with exponentially
+		distributed lengths of mean on and off. The arrival rate in on periods
+		is ratio times the rate in off periods. The first period is on with
+		probability on / (on + off).
+		"""
+		if on <= 0 or off <= 0:
+			raise ValueError('mean length of on and off periods of burst distribution must be greater than 0')
+		if ratio < 1:
+			raise ValueError('ratio of burst distribution must be equal or greater than 1')
+		first_on = self.rand.uniform() < on / float(on + off)
+		lengths = np.empty(0)
+		# each round draws the periods of about twice the window
+		n = int(2 * (high - low) / (on + off)) + 2
+		while lengths.sum() < high - low:
+			means = np.where((np.arange(len(lengths), len(lengths) + n) % 2 == 0) == first_on, on, off)
+			lengths = np.concatenate([lengths, self.rand.exponential(means)])
+		edges = low + np.concatenate([[0], np.cumsum(lengths)])
+		count = np.searchsorted(edges, high) # amount of periods starting before high
+		edges = np.concatenate([edges[:count], [high]])
+		states_on = (np.arange(count) % 2 == 0) == first_on
+		return self.piecewiseConstant(edges, np.where(states_on, float(ratio), 1.0), size)
+
+	def rate(self, low, high, size, *profile):
+		"""Evenly spaced samples following a target rate profile (see rateProfile())
+
+		Like "uniform", samples are not random: the i-th sample is where the
+		integral of the rate profile reaches i/size of its total, so the rate of
+		samples follows the profile, scaled to size samples in [low, high).
 		"""
-		mu = (low + high) / 2.0
-		res = []
-		while len(res) < size:
-			temp = np.random.normal(mu, sigma, size)
-			temp = filter(lambda x: low <= x < high, temp)
-			res.extend(temp)
-		return sorted(res[:size])
+		x, r = rateProfile(low, high, *profile)
+		mass = np.concatenate([[0], np.cumsum((r[:-1] + r[1:]) / 2.0 * np.diff(x))])
+		def transform(begin):
+			target = np.arange(begin, min(begin + CHUNK_SIZE, size)) * (mass[-1] / size)
+			# segments without mass are skipped, since target is never less than their end
+			i = np.clip(np.searchsorted(mass, target, side='right') - 1, 0, len(x) - 2)
+			with np.errstate(divide='ignore', invalid='ignore'):
+				u = np.where(mass[i+1] > mass[i], (target - mass[i]) / (mass[i+1] - mass[i]), 0.0)
+			t = linearInverse(u, r[i], r[i+1])
+			return np.clip(x[i] + t * (x[i+1] - x[i]), low, np.nextafter(high, low))
+		return (transform(begin) for begin in xrange(0, size, CHUNK_SIZE))
+
+	def piecewiseConstant(self, edges, rates, size):
+		"""Chunks of samples of the density proportional to rates[i] in [edges[i], edges[i+1])"""
+		rates = np.asarray(rates, dtype=float)
+		if (rates < 0).any() or rates.sum() == 0:
+			raise ValueError('rates must be non-negative and not all 0')
+		mass = np.concatenate([[0], np.cumsum(rates * np.diff(edges))])
+		def transform(u):
+			target = u * mass[-1]
+			# periods of rate 0 are skipped, since target is never less than their end
+			i = np.clip(np.searchsorted(mass, target, side='right') - 1, 0, len(rates) - 1)
+			with np.errstate(divide='ignore', invalid='ignore'):
+				x = edges[i] + np.where(rates[i] > 0, (target - mass[i]) / rates[i], 0.0)
+			return np.clip(x, edges[0], np.nextafter(edges[-1], edges[0]))
+		return (transform(u) for u in self.iterSortedUniform(size))
+
+def joinChunks(chunks):
+	"""Concatenate an iterator of numpy arrays into one array of float"""
+	chunks = list(chunks)
+	return np.concatenate(chunks) if chunks else np.empty(0)
+
+def linearInverse(u, start, end):
+	"""Inverse CDF in [0, 1) of the density which changes linearly from start to end"""
+	# root of the quadratic CDF start*t + (end-start)*t**2/2 = u*(start+end)/2,
+	# written in a form which is stable also for start == end
+	num = u * (start + end)
+	den = start + np.sqrt(start**2 + u * (end**2 - start**2))
+	with np.errstate(divide='ignore', invalid='ignore'):
+		return np.where(den > 0, num / den, 0.0)
+
+def rateProfile(low, high, *profile):
+	"""Knots of a piecewise linear rate profile in [low, high)
+
+	Args:
+		profile [float]: either one rate (operations/sec), constant in [low, high),
+						or pairs of (time, rate), where time is counted from low. The rate
+						changes linearly between two pairs, and is constant before the first
+						and after the last pair. Two pairs with the same time are a step.
+
+	Returns:
+		(x, r): numpy arrays of times and rates of all knots, from low to high
+	"""
+	if len(profile) == 1:
+		times, rates = np.zeros(1), np.asarray(profile, dtype=float)
+	elif profile and len(profile) % 2 == 0:
+		times, rates = np.asarray(profile[0::2], dtype=float), np.asarray(profile[1::2], dtype=float)
+	else:
+		raise ValueError('rate profile must be one rate or pairs of time and rate')
+	if (np.diff(times) < 0).any():
+		raise ValueError('times in rate profile must be in ascending order')
+	if (rates < 0).any():
+		raise ValueError('rates in rate profile must be non-negative')
+	inside = (times > 0) & (times < high - low)
+	x = np.concatenate([[low], low + times[inside], [high]])
+	r = np.concatenate([[np.interp(0, times, rates)], rates[inside], [np.interp(high - low, times, rates)]])
+	if ((r[:-1] + r[1:]) * np.diff(x)).sum() <= 0:
+		raise ValueError('rate profile must not be always 0')
+	return x, r
+
+def rateTotal(low, high, *profile):
+	"""Amount of operations of a rate profile in [low, high), see rateProfile()"""
+	x, r = rateProfile(low, high, *profile)
+	return int(round(((r[:-1] + r[1:]) / 2.0 * np.diff(x)).sum()))
+
+def normCDF(z):
+	"""CDF of standard normal distribution"""
+	return 0.5 * math.erfc(-z / math.sqrt(2))
 
-	def exponential(self):
-		pass
+# coefficients of the rational approximation of normPPF() by Peter J. Acklam
+PPF_A = [-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+		1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00]
+PPF_B = [-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+		6.680131188771972e+01, -1.328068155288572e+01, 1.0]
+PPF_C = [-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+		-2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00]
+PPF_D = [7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00,
+		3.754408661907416e+00, 1.0]
+PPF_LOW = 0.02425
 
-	def linear(self):
-		pass
+def normPPF(p):
+	"""Inverse CDF of standard normal distribution of numpy array p, relative error < 1.2e-9"""
+	p = np.clip(p, np.finfo(float).tiny, 1 - np.finfo(float).eps / 2)
+	z = np.empty_like(p)
+	lower, upper = p < PPF_LOW, p > 1 - PPF_LOW
+	central = ~(lower | upper)
+	q = p[central] - 0.5
+	r = q * q
+	z[central] = q * np.polyval(PPF_A, r) / np.polyval(PPF_B, r)
+	q = np.sqrt(-2 * np.log(p[lower]))
+	z[lower] = np.polyval(PPF_C, q) / np.polyval(PPF_D, q)
+	q = np.sqrt(-2 * np.log1p(-p[upper]))
+	z[upper] = -np.polyval(PPF_C, q) / np.polyval(PPF_D, q)
+	return z
 
-	def polynomial(self):
-		pass
+def checkArguments(d_type, args, amount):
+	if len(args) != amount:
+		raise ValueError('[%s] distribution requires %d arguments, %d given' % (d_type, amount, len(args)))
 
 
 _inst = Distribution()
 drawSamples = _inst.drawSamples
+iterSamples = _inst.iterSamples
 seed = _inst.seed
 
@@ -46,7 +46,17 @@ sort_sample = '''{
 '''
 
 absolute_uniform_sample = 'uniform(1000)' # case insensitive
-absolute_normal_sample = 'Normal(0.1, 1000)' # Normal(sigma, total)
+absolute_normal_sample = 'Normal(0.1, 1000)' # Normal(sigma, total), mu is the middle of time period
+absolute_normal_mu_sample = 'Normal(0.1, 20, 1000)' # Normal(sigma, mu, total)
+absolute_exponential_sample = 'Exponential(10, 1000)' # Exponential(scale, total), decaying load. Negative scale for growing load
+absolute_linear_sample = 'Linear(0, 1, 1000)' # Linear(density at start, density at end, total), ramp-up of load
+absolute_polynomial_sample = 'Polynomial(1, -2, 1, 1000)' # Polynomial(c0, c1, ..., cn, total), density c0 + c1*t + ... + cn*t^n, t in [0, 1)
+absolute_poisson_sample = 'Poisson(1000)' # Poisson(total), exponential inter-arrival times
+absolute_piecewise_sample = 'Piecewise(1, 5, 0, 2, 1000)' # Piecewise(r1, r2, ..., rn, total), relative rates of n equal periods
+absolute_burst_sample = 'Burst(2, 10, 20, 1000)' # Burst(mean on length, mean off length, on/off rate ratio, total)
+absolute_rate_sample = 'Rate(200)' # Rate(operations/sec), total is derived from the time period
+absolute_rate_profile_sample = 'Rate(0: 200, 600: 200, 900: 400)' # Rate(time: operations/sec, ...), time counted from start of time period.
+													# Rate changes linearly between points, e.g. hold 200 for 600 sec then ramp to 400
 
 
 rule_sample = '''
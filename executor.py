@@ -15,10 +15,26 @@
 #    You should have received a copy of the GNU General Public License
 #    along with Nowog.  If not, see <http://www.gnu.org/licenses/>
 
-import sched, time
+import time
+import heapq
 import logging
-from datetime import datetime
-import matplotlib.pyplot as plt
+import threading
+import Queue
+import json
+from array import array
+from itertools import chain, izip
+from collections import Counter
+
+import mapping
+import sessionfile
+from histogram import Histogram
+import report
+import retry
+import windows
+from telemetry import Telemetry
+
+# delay (sec) between calling run() and the first scheduled operation
+START_DELAY = 3
 
 class Executor(object):
 	"""MongoDB operation executor
@@ -27,16 +43,54 @@ class Executor(object):
 	Each session consist of an ID, a list of operation and their corresponding
 	execution time.
 
-	It use sched.scheduler to arrange the execution.
-	It can also display histogram of number of operation across a time interval.
+	All sessions are merged into one time line (ordered by execution time) and
+	dispatched when run() is called, in one of two modes:
+
+		- open: the dispatching thread only waits for the scheduled time and hands
+				the operation to a pool of worker threads, which share the connection
+				pool of one MongoClient. Operations are sent regardless of whether
+				earlier operations are completed, and latency is measured from the
+				scheduled time, so a slow database shows up as latency instead of
+				silently delaying the schedule.
+		- closed: a fixed number (threads, at least 1) of operations are outstanding.
+				Each worker takes the next operation from the time line, waits for its
+				scheduled time and sends it after its previous operation is completed.
+				Latency is measured from the actual sending time, and the delay of
+				sending is reported separately as lateness.
+				With threads == 0 every operation is executed by the dispatching
+				thread itself, i.e. one slow command delays all following operations.
+
+	Latency and lateness of each operation are recorded in fixed memory histograms
+	of each session and each operation type. The scheduled, sent and completed time
+	of each operation are only kept if keep_records is True.
+	Scheduled, sent and completed operations of each session are counted in time
+	bins of fixed width (report_bin), which are displayed or saved as report
+	(planned and actual amount of operations over time), see report.py.
+	During execution, throughput and latency of each session and operation type
+	are reported every telemetry_interval seconds, see telemetry.py.
+	A failed operation never stops the execution: errors are counted by class
+	(e.g. duplicate_key, timeout, not_master) and session, and operations failed
+	by a transient error are sent again up to retries times after a backoff
+	delay, by the threads of a Retrier instead of the dispatching thread, see retry.py.
+	Operations of the warm-up (scheduled within the first warmup seconds, or the
+	first warmup_ops operations of each session) are executed, but not recorded
+	in any histogram, time bin or report, so they count neither in latency nor in
+	the target and achieved rate. Operations are also recorded in the histograms of each
+	labeled measurement window containing their scheduled time, and counted as
+	achieved throughput of each window containing their completion time, see windows.py.
 
 	Attributes:
 
 		logger (Logger): internal logger.
-		sche (sched.scheduler): scheduler for all MongoDB operations
-		sessions_queue {str: {float: SON}}: Queue for all sessions added into executor
-											It's structure is {ID: {delay: cmd,....}}.
-		db (pymongo.database.Database): MongoDB database instance.
+		sessions_queue {str: (array, [SON])}: Queue for all sessions added into executor
+											It's structure is {ID: (delays, cmds)}, delays are
+											in ascending order and cmds[i] is executed at delays[i].
+		sessions_stream {str: iterator}: sessions added by addSessionStream(). Each one is
+										an iterator of (delay, cmd) in ascending order of delay.
+		sessions_file {str: SessionFile}: sessions added by addSessionFile(). Commands are read
+										from the memory mapped session file during execution.
+		session_size {str: int}: amount of operations of each session.
+		db (pymongo.database.Database): MongoDB database instance, or a database of another backend, see backends.py.
 		collection (pymongo.collection.Collection): The collection in which all workload will be executed
 		type_cache (dict): cache all operation types when adding into executor. Used for displaying.
 		reset_prof (bool): If True, disable, drop and enable system.profile before try_run() and run(). Default is False
@@ -44,34 +98,133 @@ class Executor(object):
 		drop_coll (bool): If True, drop designed collection before try_run() and run(). Default is False.
 		creat_coll (bool): If True, create designed collection if not exist before try_run() and run(). Default is True.
 		DB_initialized (bool): True when collection is set.
-		bins (int): bins used in matplotlib.pyplot.hist()
+		report_bin (float): width (sec) of time bins of all counters and reports. Default is 1.
+		report_path (str): If not empty, reports are saved in this directory as files instead of
+							being displayed in a window. Default is ''.
+		report_formats [str]: formats of saved reports: {png, svg, csv, json}. Default is all of them.
+		histtype (str): histogram type of reports: {'bar', 'barstacked', 'step', 'stepfilled'}. Default is 'step'.
+		threads (int): Number of worker threads executing operations. 0 means executing in the dispatching thread. Default is 0.
+		mode (str): execution mode: {open, closed}. Default is open if threads > 0, otherwise closed.
+		latency {str: Histogram}: latency of operations of each session. Latency is counted from
+									the scheduled time in open mode and from the sent time in closed mode.
+		lateness {str: Histogram}: delay between scheduled and sent time of operations of each session.
+		type_latency {str: Histogram}: latency of operations of each type: {find, insert, update, delete}
+		sent_count {str: Counter}: amount of operations of each session sent in each time bin of execution.
+		keep_records (bool): If True, keep (scheduled_at, sent_at, completed_at) of each operation in records. Default is False.
+		records {str: [(float, float, float)]}: (scheduled_at, sent_at, completed_at) of each executed
+												operation of each session, all in time.time().
+		latency_result_path (str): If not empty, save summary of all latency histograms as json file after run(). Default is ''.
+		batch_window (float): If greater than 0, insert, update and delete operations of one session whose scheduled
+							time fall within batch_window (sec) are sent in one command, at the scheduled time of
+							its last operation. Default is 0, i.e. no batching.
+		batch_size (int): maximum amount of operations in one batch. Default is 1000.
+		ordered (bool): "ordered" option of batched commands. Default is True.
+		target_count {str: Counter}: amount of operations of each session scheduled in each time bin of
+									execution, i.e. the target rate.
+		achieved_count {str: Counter}: amount of operations of each session completed in each time bin of
+									execution, i.e. the achieved rate.
+		start (float): the time (time.time()) from which all delays are counted in the last execute().
+		pre_encode (bool): If True, commands are encoded into BSON when they are added (or generated,
+							for streams) instead of when they are sent, see sessionfile.encodeCommand().
+							Commands of sessions in file are always sent as raw BSON. Default is False.
+		telemetry (Telemetry): live telemetry during execute(), None if telemetry_interval is 0.
+							telemetry_interval (sec, default 1), telemetry_path (JSON lines file,
+							default '') and telemetry_port (HTTP port, default 0) are passed to Telemetry.
+		error_count {str: Counter}: amount of failed attempts of operations of each session by error class,
+									including write errors reported in the result of a command.
+		failed_count {str: Counter}: amount of operations of each session given up (not retried, or
+									failed after retries) by the class of their last error.
+		retries (int): maximum amount of retries of an operation failed by a transient error. Default is 0.
+		retry_backoff (float): delay (sec) before the first retry, doubled for each further retry. Default is 0.1.
+		retry_backoff_max (float): maximum delay (sec) before a retry. Default is 10.
+		retrier (Retrier): executes retries in max(threads, 1) threads of its own, None if retries is 0.
+		warmup (float): operations scheduled within warmup seconds after the start are not recorded in
+						histograms, time bins and windows. Default is 0.
+		warmup_ops (int): the first warmup_ops operations of each session are not recorded in histograms,
+						time bins and windows. Default is 0.
+		warmup_count Counter({str: int}): amount of operations of the warm-up of each session.
+		windows [Window]: labeled measurement windows, parsed from a str, e.g. 'ramp:0-60, steady:60-'.
+						Default is no window.
 
 
 	Args:
 		collection (pymongo.collection.Collection): The collection in which all workload will be executed
-		**kwargs: Initialize some attributes including: reset_profiling, profile_size, drop_collection, create_collection and bins
+		**kwargs: Initialize some attributes including: reset_profiling, profile_size, drop_collection, create_collection, report_bin, report_path, report_formats, histtype, threads, mode, keep_records, latency_result_path, batch_window, batch_size, ordered, pre_encode, telemetry_interval, telemetry_path, telemetry_port, retries, retry_backoff, retry_backoff_max, warmup, warmup_ops and windows
 
 	"""
 	def __init__(self, collection=None, **kwargs):
 		self.logger = logging.getLogger('executor')
 		self.logger.setLevel(logging.INFO)
-		self.sche = sched.scheduler(time.time, time.sleep)
-		self.sessions_queue = {} # {ID: {delay: cmd, delay2: cmd2, ....}}
+		self.sessions_queue = {} # {ID: (array('d', [delay, delay2, ....]), [cmd, cmd2, ....])}
+		self.sessions_stream = {} # {ID: iter([(delay, cmd), (delay2, cmd2), ....])}
+		self.sessions_file = {} # {ID: SessionFile}
+		self.session_size = {} # {ID: amount of operations}
+		self.priority = {} # {ID: priority}
 		self.setCollection(collection)
 		self.reset_prof = kwargs.get('reset_profiling', False)
 		self.profile_size = int(kwargs.get('profile_size', 1)) # 1 MB by default
 		self.drop_coll = kwargs.get('drop_collection', False)
 		self.creat_coll = kwargs.get('create_collection', True)
-		self.bins = int(kwargs.get('bins', 20))
+		self.report_bin = float(kwargs.get('report_bin', 1.0))
+		if self.report_bin <= 0:
+			raise ValueError('[report_bin] must be greater than 0')
+		self.report_path = kwargs.get('report_path', '')
+		self.report_formats = report.parseFormats(kwargs.get('report_formats', ','.join(report.FORMATS)))
 		self.time_scale_factor = float(kwargs.get('time_scale_factor', 1.0))
 		self.histtype = kwargs.get('histtype', 'step')
-		self.exec_time_cache = {} # for display execution result
+		self.threads = int(kwargs.get('threads', 0))
+		if self.threads < 0:
+			raise ValueError('[threads] must be equal or greater than 0')
+		self.mode = kwargs.get('mode', 'open' if self.threads > 0 else 'closed')
+		if self.mode not in ('open', 'closed'):
+			raise ValueError('Unknown execution mode: [%s]. Available modes include: {open, closed}' % self.mode)
+		if self.mode == 'open' and self.threads == 0:
+			raise ValueError('[threads] must be greater than 0 in open mode')
+		self.keep_records = kwargs.get('keep_records', False)
+		self.latency_result_path = kwargs.get('latency_result_path', '')
+		self.batch_window = float(kwargs.get('batch_window', 0))
+		self.batch_size = int(kwargs.get('batch_size', 1000))
+		if self.batch_size < 1:
+			raise ValueError('[batch_size] must be equal or greater than 1')
+		self.ordered = kwargs.get('ordered', True)
+		self.pre_encode = kwargs.get('pre_encode', False)
+		self.records = {} # {ID: [(scheduled_at, sent_at, completed_at), ...]}
+		self.sent_count = {} # {ID: Counter({bin: amount of sent operations})}
+		self.latency = {} # {ID: Histogram}
+		self.lateness = {} # {ID: Histogram}
+		self.session_type = {} # {ID: cmd_type}
+		self.stream_head = {} # {ID: first cmd of stream}, used by try_run()
+		self.record_lock = threading.Lock()
+		self.target_count = {} # {ID: Counter({bin: amount of scheduled operations})}
+		self.achieved_count = {} # {ID: Counter({bin: amount of completed operations})}
+		self.start = None
+		self.telemetry = None
+		if float(kwargs.get('telemetry_interval', 1.0)) > 0:
+			self.telemetry = Telemetry(kwargs.get('telemetry_interval', 1.0), kwargs.get('telemetry_path', ''),
+										kwargs.get('telemetry_port', 0))
+		self.error_count = {} # {ID: Counter({error_class: amount of failed attempts})}
+		self.failed_count = {} # {ID: Counter({error_class: amount of failed operations})}
+		self.retries = int(kwargs.get('retries', 0))
+		if self.retries < 0:
+			raise ValueError('[retries] must be equal or greater than 0')
+		self.retry_backoff = float(kwargs.get('retry_backoff', 0.1))
+		self.retry_backoff_max = float(kwargs.get('retry_backoff_max', 10))
+		self.retrier = retry.Retrier(self.tryRunCommand, self.threads) if self.retries > 0 else None
+		self.warmup = float(kwargs.get('warmup', 0))
+		self.warmup_ops = int(kwargs.get('warmup_ops', 0))
+		if self.warmup < 0 or self.warmup_ops < 0:
+			raise ValueError('[warmup] and [warmup_ops] must be equal or greater than 0')
+		self.warmup_count = Counter() # {ID: amount of operations of the warm-up}
+		self.windows = windows.parseWindows(kwargs.get('windows', ''))
+		if self.telemetry:
+			self.telemetry.phase = self.phaseOf
 		self.type_cache = { # caching for display
 			'find' : [], # [ID(str), ...]
 			'insert' : [],
 			'update' : [],
 			'delete' : []
 		}
+		self.type_latency = {cmd_type: Histogram() for cmd_type in self.type_cache}
 
 	def setCollection(self, collection=None):
 		if collection:
@@ -81,43 +234,359 @@ class Executor(object):
 		else:
 			self.DB_initialized = False
 
-	def addSession(self, ID, time_table, priority=1):
+	def addSession(self, ID, times, cmds, priority=1):
 		"""Add a session into executor.
 
 		Args:
 			ID (str): session ID
-			time_table::
-				{
-					time(float): cmd(SON),
-					time(float): cmd(SON),
-					time(float): cmd(SON),
-					.....
-				}
-			priority (int): the priority of execution of this session
+			times [float]: time of each operation in ascending order. Several operations
+							can have the same time.
+			cmds [SON]: operations, cmds[i] is executed at times[i]
+			priority (int): the priority of execution of this session, when
+							operations of different sessions are scheduled at the same time.
+							Lower number means higher priority.
 
 		Note:
-			"time" in time_table represent the delay of execution after executor begin.
-			When duration of certain operation is too long, whole execution will delay.
-			Read more about scheduler in: https://docs.python.org/2/library/sched.html
+			"time" in times represent the delay of execution after executor begin.
+			In closed mode, when duration of certain operation is too long, following operations will delay.
 
 		"""
-		if ID in self.sessions_queue:
+		if len(times) != len(cmds):
+			raise ValueError('Session [%s] has %d times but %d commands' % (ID, len(times), len(cmds)))
+		if len(cmds) == 0:
+			self.logger.warning('Session [%s] has no operation' % ID)
+			return
+		times = array('d', (t*self.time_scale_factor for t in times))
+		if self.pre_encode:
+			cmds = map(sessionfile.encodeCommand, cmds)
+		self.initSession(ID, cmds[0].keys()[0], len(cmds), priority)
+		self.sessions_queue[ID] = (times, list(cmds))
+
+	def addSessionStream(self, ID, stream, size, priority=1):
+		"""Add a session whose operations are generated during execution.
+
+		Operations of a stream are only generated just before they are dispatched,
+		so memory usage does not depend on the size of the session. A stream can
+		only be executed once, and is not available in show() and get_session_queue().
+
+		Args:
+			ID (str): session ID
+			stream: iterator of (time(float), cmd(SON)) in ascending order of time.
+			size (int): amount of operations in stream
+			priority (int): the same as in addSession()
+		"""
+		stream = iter(stream)
+		head = next(stream, None)
+		if head is None:
+			self.logger.warning('Session [%s] has no operation' % ID)
+			return
+		scale = self.time_scale_factor
+		stream = ((t*scale, cmd) for t, cmd in chain([head], stream))
+		if self.pre_encode:
+			# encoded when generated, i.e. before waiting for the scheduled time
+			stream = ((t, sessionfile.encodeCommand(cmd)) for t, cmd in stream)
+		self.initSession(ID, head[1].keys()[0], size, priority)
+		self.sessions_stream[ID] = stream
+		self.stream_head[ID] = head[1]
+
+	def addSessionFile(self, ID, session_file, priority=1):
+		"""Add a session saved in a binary session file.
+
+		Commands are read from the memory mapped file just before they are
+		dispatched, and sent as raw BSON without decoding (see sessionfile.py).
+
+		Args:
+			ID (str): session ID in session_file
+			session_file (SessionFile): opened session file
+			priority (int): the same as in addSession()
+		"""
+		if session_file.getSize(ID) == 0:
+			self.logger.warning('Session [%s] has no operation' % ID)
+			return
+		self.initSession(ID, session_file.getType(ID), session_file.getSize(ID), priority)
+		self.sessions_file[ID] = session_file
+
+	def initSession(self, ID, cmd_type, size, priority):
+		"""Initialize caches of a new session"""
+		if ID in self.priority:
 			# raise KeyError('ID [%s] already exist!' % ID)
-			logger.warning('ID [%s] already exist in executor\'s session queue!' % ID)
-			logger.warning('New operation will overwrite old one')
-		time_table = {t*self.time_scale_factor: time_table[t] for t in time_table}
-		self.exec_time_cache[ID] = []
-		self.sessions_queue[ID] = time_table
-		cmd_type = time_table.values()[0].keys()[0]
+			self.logger.warning('ID [%s] already exist in executor\'s session queue!' % ID)
+			self.logger.warning('New operation will overwrite old one')
+			self.removeSession(ID)
+		self.records[ID] = []
+		self.sent_count[ID] = Counter()
+		self.target_count[ID] = Counter()
+		self.achieved_count[ID] = Counter()
+		self.error_count[ID] = Counter()
+		self.failed_count[ID] = Counter()
+		self.latency[ID] = Histogram()
+		self.lateness[ID] = Histogram()
+		self.priority[ID] = priority
+		self.session_size[ID] = size
+		self.session_type[ID] = cmd_type
 		if cmd_type in self.type_cache:
 			self.type_cache[cmd_type].append(ID)
-		for t in time_table:
-			self.sche.enter(t+3, priority, self.runCommand, [ID, time_table[t]])
 
-	def runCommand(self, ID, cmd):
-		self.exec_time_cache[ID].append(datetime.now())
-		self.logger.info('Running: [%s]' % ID)
-		return self.db.command(cmd)
+	def getSessionIDs(self):
+		"""IDs of all sessions, including streams"""
+		return self.priority.keys()
+
+	def runCommand(self, ID, cmd, scheduled_at=None, batch=None, index=None):
+		"""Execute one command of session ID and record its timing.
+
+		Args:
+			ID (str): session ID
+			cmd (SON): MongoDB command
+			scheduled_at (float): the time (time.time()) at which the command should be sent.
+								Default is the actual sending time.
+			batch [float]: If cmd is a batch of operations, the scheduled time (time.time())
+							of each operation. Timing is recorded for each operation.
+			index (int): index of the (first) operation in session ID, see iterSchedule().
+		"""
+		self.logger.debug('Running: [%s]', ID)
+		sent_at = time.time()
+		res = self.db.command(cmd)
+		completed_at = time.time()
+		if 'writeErrors' in res or 'writeConcernError' in res:
+			self.recordWriteErrors(ID, res)
+		if batch:
+			for k, item_scheduled_at in enumerate(batch):
+				self.record(ID, item_scheduled_at, sent_at, completed_at, None if index is None else index + k)
+			return res
+		if scheduled_at is None:
+			scheduled_at = sent_at
+		self.record(ID, scheduled_at, sent_at, completed_at, index)
+		return res
+
+	def record(self, ID, scheduled_at, sent_at, completed_at, index=None):
+		"""Record timing of one operation of session ID, index is its index in the session.
+
+		Operations of the warm-up are not counted in time bins and not recorded in
+		histograms and windows, they are only kept in records (if keep_records).
+		"""
+		latency = completed_at - (scheduled_at if self.mode == 'open' else sent_at)
+		lateness = sent_at - scheduled_at
+		t = scheduled_at - self.start if self.start is not None else None
+		cmd_type = self.session_type[ID]
+		with self.record_lock:
+			if self.keep_records:
+				self.records[ID].append((scheduled_at, sent_at, completed_at))
+			if self.isWarmup(t, index):
+				self.warmup_count[ID] += 1
+			else:
+				if self.start is not None:
+					self.sent_count[ID][self.timeBin(sent_at - self.start)] += 1
+					self.achieved_count[ID][self.timeBin(completed_at - self.start)] += 1
+				self.latency[ID].record(latency)
+				self.lateness[ID].record(lateness)
+				if cmd_type in self.type_latency:
+					self.type_latency[cmd_type].record(latency)
+				if t is not None:
+					completed = completed_at - self.start
+					for window in self.windows:
+						if window.contains(t):
+							window.record(cmd_type, t, latency, lateness)
+						if window.contains(completed):
+							window.complete(completed)
+		if self.telemetry:
+			self.telemetry.record(ID, cmd_type, latency, lateness)
+
+	def isWarmup(self, t, index):
+		"""True if an operation scheduled at t (sec from start) with index in its session belongs to the warm-up.
+		t and index are None if unknown, e.g. in try_run()"""
+		return (t is not None and t < self.warmup) or (index is not None and index < self.warmup_ops)
+
+	def phaseOf(self, t):
+		"""Label of the phase of execution at t (sec from start): 'warm-up', or labels of windows containing t"""
+		if t < self.warmup:
+			return 'warm-up'
+		return ', '.join(window.label for window in self.windows if window.contains(t))
+
+	def tryRunCommand(self, ID, cmd, scheduled_at=None, batch=None, index=None, attempt=0):
+		"""runCommand() which never raises: errors are counted, and an operation failed by a
+		transient error is handed to the retrier, unless it has been retried retries times.
+
+		Args:
+			attempt (int): amount of previous attempts of this operation
+			Other args are the same as in runCommand()
+		"""
+		try:
+			self.runCommand(ID, cmd, scheduled_at, batch, index)
+		except Exception, e:
+			error_class, transient = retry.classify(e)
+			retried = transient and attempt < self.retries
+			self.countError(ID, error_class, len(batch) if batch else 1, str(e), not retried)
+			if retried:
+				self.retrier.add(time.time() + retry.backoff(self.retry_backoff, self.retry_backoff_max, attempt),
+								(ID, cmd, scheduled_at, batch, index, attempt + 1))
+
+	def recordWriteErrors(self, ID, res):
+		"""Count write errors reported in the result of a write command. They are not retried"""
+		for error in res.get('writeErrors', []):
+			self.countError(ID, retry.classifyWriteError(error)[0], 1, error.get('errmsg', ''), True)
+		if 'writeConcernError' in res:
+			error = res['writeConcernError']
+			self.countError(ID, retry.classifyWriteError(error, 'write_concern')[0], 1, error.get('errmsg', ''), True)
+
+	def countError(self, ID, error_class, n, message, failed):
+		"""Count n failed operations of session ID, failed is False if they are retried.
+
+		Errors are logged at ERROR level only when their count of the session and
+		error class reaches 1, 10, 100, ..., so an error storm does not flood the log.
+		"""
+		with self.record_lock:
+			before = self.error_count[ID][error_class]
+			self.error_count[ID][error_class] += n
+			if failed:
+				self.failed_count[ID][error_class] += n
+		if self.telemetry:
+			self.telemetry.recordError(ID, error_class, n)
+		if before == 0 or len(str(before)) != len(str(before + n)):
+			self.logger.error('Failed to run command of [%s] (%s, %d so far): %s' % (ID, error_class, before + n, message))
+
+	def iterSchedule(self):
+		"""Iterate over all operations of all sessions in order of execution time.
+
+		Yields:
+			(delay(float), priority(int), ID(str), index(int), cmd(SON), items([float]))
+			index is the index of the (first) operation in its session.
+			items is None for a single operation, or delay of each operation in a batch.
+		"""
+		def session_stream(ID):
+			priority = self.priority[ID]
+			if ID in self.sessions_stream:
+				ops = self.sessions_stream[ID]
+			elif ID in self.sessions_file:
+				scale = self.time_scale_factor
+				ops = ((t*scale, cmd) for t, cmd in self.sessions_file[ID].iterSession(ID))
+			else:
+				ops = izip(*self.sessions_queue[ID])
+			if self.batch_window > 0 and self.session_type[ID] in mapping.BATCH_FIELDS:
+				ops = self.iterBatches(ops)
+			else:
+				ops = ((t, cmd, None) for t, cmd in ops)
+			i = 0
+			for t, cmd, items in ops:
+				yield (t, priority, ID, i, cmd, items)
+				i += len(items) if items else 1
+		return heapq.merge(*[session_stream(ID) for ID in self.getSessionIDs()])
+
+	def iterBatches(self, ops):
+		"""Group operations of one session into batches.
+
+		A batch consist of operations scheduled within batch_window after its first
+		operation, and at most batch_size operations. It is scheduled at the time
+		of its last operation, so no operation is sent before its scheduled time.
+
+		Args:
+			ops: iterator of (delay, cmd) in ascending order of delay.
+
+		Yields:
+			(delay(float), cmd(SON), items([float]))
+		"""
+		batch = []
+		for t, cmd in ops:
+			if batch and (t - batch[0][0] > self.batch_window or len(batch) >= self.batch_size):
+				yield self.makeBatch(batch)
+				batch = []
+			batch.append((t, cmd))
+		if batch:
+			yield self.makeBatch(batch)
+
+	def makeBatch(self, batch):
+		"""Merge [(delay, cmd)] into (delay, cmd, items), see iterBatches()"""
+		if len(batch) == 1:
+			return batch[0][0], batch[0][1], None
+		cmd = mapping.mergeCommands([cmd for _, cmd in batch], self.ordered)
+		return batch[-1][0], cmd, [t for t, _ in batch]
+
+	def timeBin(self, t):
+		"""Index of the time bin of t (sec from start)"""
+		return int(t / self.report_bin)
+
+	def countTarget(self, ID, t, items, index=None):
+		"""Count an operation (or each operation of a batch) of session ID, except operations
+		of the warm-up, in the time bin and the windows it is scheduled"""
+		for k, x in enumerate(items or [t]):
+			if self.isWarmup(x, None if index is None else index + k):
+				continue
+			self.target_count[ID][self.timeBin(x)] += 1
+			for window in self.windows:
+				if window.contains(x):
+					window.scheduled += 1
+
+	def startThreads(self, target):
+		"""Start self.threads threads running target, return the list of threads"""
+		pool = [threading.Thread(target=target, name='executor-worker-%d' % i) for i in xrange(self.threads)]
+		for th in pool:
+			th.daemon = True
+			th.start()
+		return pool
+
+	def dispatch_closed(self, start):
+		"""Closed-loop execution: at most max(threads, 1) outstanding operations.
+
+		Each worker takes the next operation from the time line, waits until its
+		scheduled time and executes it. When threads == 0, all operations are
+		executed in the dispatching thread.
+
+		Args:
+			start (float): the time (time.time()) from which all delays are counted.
+		"""
+		schedule = self.iterSchedule()
+		lock = threading.Lock()
+		def next_operation():
+			with lock:
+				op = next(schedule, None)
+				if op is not None:
+					self.countTarget(op[2], op[0], op[5], op[3])
+				return op
+		def worker(run):
+			while True:
+				op = next_operation()
+				if op is None:
+					break
+				t, _, ID, index, cmd, items = op
+				scheduled_at = start + t
+				delay = scheduled_at - time.time()
+				if delay > 0:
+					time.sleep(delay)
+				run(ID, cmd, scheduled_at, items and [start + x for x in items], index)
+		if self.threads == 0:
+			worker(self.tryRunCommand)
+			return
+		for th in self.startThreads(lambda: worker(self.tryRunCommand)):
+			th.join()
+
+	def dispatch_open(self, start):
+		"""Open-loop execution: send each operation at its scheduled time.
+
+		The dispatching thread only waits for the scheduled time of each
+		operation and hands it to a pool of worker threads, so a slow command
+		neither delays the schedule nor hides its latency.
+
+		Args:
+			start (float): the time (time.time()) from which all delays are counted.
+		"""
+		task_queue = Queue.Queue()
+		def worker():
+			while True:
+				task = task_queue.get()
+				if task is None:
+					break
+				self.tryRunCommand(*task)
+		pool = self.startThreads(worker)
+		for t, _, ID, index, cmd, items in self.iterSchedule():
+			self.countTarget(ID, t, items, index)
+			scheduled_at = start + t
+			delay = scheduled_at - time.time()
+			if delay > 0:
+				time.sleep(delay)
+			task_queue.put((ID, cmd, scheduled_at, items and [start + x for x in items], index))
+		for _ in pool:
+			task_queue.put(None)
+		for th in pool:
+			th.join()
 
 
 	def init_execution(self):
@@ -140,7 +609,7 @@ class Executor(object):
 		if self.reset_prof:
 			self.logger.info('Reset profiling')
 			self.db.set_profiling_level(0)
-			self.db.system.profile.drop()
+			self.db['system.profile'].drop()
 			self.logger.info('Creating system.profile with [%d] MB' % self.profile_size)
 			self.db.create_collection( "system.profile", capped=True, size=1024*1024*self.profile_size)
 			self.db.set_profiling_level(2)
@@ -152,10 +621,38 @@ class Executor(object):
 			self.logger.error('execution initialization failed! execution stop!')
 			return
 		self.logger.info('# # # # # # # # Start execution # # # # # # # # #')
-		self.sche.run()
+		self.execute(time.time() + START_DELAY)
 		self.logger.info('# # # # # # # # Execution finish # # # # # # # # #')
+		self.show_latency()
+		self.show_rate()
+		self.save_latency()
 		self.show_exec_time()
 
+	def execute(self, start):
+		"""Execute all sessions, without initialization and displaying.
+
+		Args:
+			start (float): the time (time.time()) from which all delays are counted.
+							Executors in different processes use the same start to
+							align their time line.
+		"""
+		self.logger.info('Execution mode: [%s] with [%d] threads' % (self.mode, self.threads))
+		self.start = start
+		if self.telemetry:
+			self.telemetry.start(start)
+		if self.retrier:
+			self.retrier.start()
+		try:
+			if self.mode == 'open':
+				self.dispatch_open(start)
+			else:
+				self.dispatch_closed(start)
+		finally:
+			if self.retrier:
+				self.retrier.stop()
+			if self.telemetry:
+				self.telemetry.stop()
+
 
 	def try_run(self):
 		try:
@@ -165,26 +662,237 @@ class Executor(object):
 			return
 		self.logger.info('# # # # # # # # Trying to execute # # # # # # # # #')
 		for ID in self.sessions_queue:
-			self.runCommand(ID, self.sessions_queue[ID].values()[0])
+			self.tryCommand(ID, self.sessions_queue[ID][1][0])
+		for ID in self.stream_head:
+			self.tryCommand(ID, self.stream_head[ID])
+		for ID in self.sessions_file:
+			self.tryCommand(ID, self.sessions_file[ID].getCommand(ID, 0))
 		self.logger.info('# # # # # # # # Try_run finish # # # # # # # # #')
 
+	def tryCommand(self, ID, cmd):
+		"""Execute one command of session ID in try_run(). It is not recorded in histograms,
+		records, time bins, error counts or telemetry, so it does not distort the results of run()"""
+		self.logger.info('Running: [%s]' % ID)
+		res = self.db.command(cmd)
+		for error in res.get('writeErrors', []) + filter(None, [res.get('writeConcernError')]):
+			self.logger.warning('[%s] write error: %s' % (ID, error.get('errmsg', '')))
+		return res
+
+	def removeSession(self, ID):
+		"""Remove a session and all its caches from executor"""
+		self.sessions_queue.pop(ID, None)
+		self.sessions_stream.pop(ID, None)
+		self.sessions_file.pop(ID, None)
+		self.stream_head.pop(ID, None)
+		del self.session_size[ID]
+		del self.priority[ID]
+		del self.records[ID]
+		del self.sent_count[ID]
+		del self.target_count[ID]
+		del self.achieved_count[ID]
+		del self.error_count[ID]
+		del self.failed_count[ID]
+		del self.latency[ID]
+		del self.lateness[ID]
+		del self.session_type[ID]
+		for IDs in self.type_cache.values():
+			if ID in IDs:
+				IDs.remove(ID)
+
+	def get_results(self):
+		"""Return all execution results, which can be merged into another executor by merge_results()"""
+		return {
+			'records': self.records,
+			'sent_count': self.sent_count,
+			'latency': self.latency,
+			'lateness': self.lateness,
+			'type_latency': self.type_latency,
+			'target_count': self.target_count,
+			'achieved_count': self.achieved_count,
+			'error_count': self.error_count,
+			'failed_count': self.failed_count,
+			'warmup_count': self.warmup_count,
+			'windows': self.windows,
+		}
+
+	def merge_results(self, results):
+		"""Merge execution results (from get_results() of another executor) into this executor"""
+		for ID in results['records']:
+			self.records.setdefault(ID, []).extend(results['records'][ID])
+		for key in ('latency', 'lateness', 'type_latency'):
+			hists = getattr(self, key)
+			for k, hist in results[key].items():
+				hists.setdefault(k, Histogram()).merge(hist)
+		for key in ('sent_count', 'target_count', 'achieved_count', 'error_count', 'failed_count'):
+			counters = getattr(self, key)
+			for ID, counter in results[key].items():
+				counters.setdefault(ID, Counter()).update(counter)
+		self.warmup_count.update(results['warmup_count'])
+		for window, other in izip(self.windows, results['windows']):
+			window.merge(other)
+
+	def get_latency(self):
+		"""Return summary (count, min, mean, p50, p90, p99, p99.9 and max in seconds) of all histograms,
+		target and achieved rate of each second, errors and failed operations of each session by error class,
+		the warm-up and the summary of each measurement window, see Window.summary()
+		"""
+		return {
+			'mode': self.mode,
+			'rate': self.get_rate(),
+			'sessions': {ID: {
+					'latency': self.latency[ID].summary(),
+					'lateness': self.lateness[ID].summary(),
+					'errors': dict(self.error_count.get(ID, {})),
+					'failed': dict(self.failed_count.get(ID, {})),
+				} for ID in self.latency},
+			'types': {cmd_type: {
+					'latency': self.type_latency[cmd_type].summary(),
+				} for cmd_type in self.type_latency},
+			'warmup': {
+				'time': self.warmup,
+				'ops': self.warmup_ops,
+				'excluded': sum(self.warmup_count.values()),
+			},
+			'windows': {window.label: window.summary() for window in self.windows},
+		}
+
+	def save_latency(self):
+		"""Save get_latency() in latency_result_path, if specified"""
+		if self.latency_result_path == '':
+			return
+		self.logger.info('Saving latency result in [%s]' % self.latency_result_path)
+		with open(self.latency_result_path, 'w') as f:
+			json.dump(self.get_latency(), f, indent=4, sort_keys=True)
+
+	def show_latency(self):
+		"""Log lateness and latency of the operations of each session and each type, and errors of each session.
+
+		lateness is the delay between scheduled and sent time. Latency is counted
+		from the scheduled time in open mode and from the sent time in closed mode.
+		"""
+		def log(name, hist):
+			s = hist.summary()
+			self.logger.info('[%s] latency of %d operations: p50 %.4f, p90 %.4f, p99 %.4f, p99.9 %.4f, max %.4f sec'
+				% (name, s['count'], s['p50'], s['p90'], s['p99'], s['p99.9'], s['max']))
+		for ID in sorted(self.latency):
+			if self.latency[ID].total == 0: continue
+			log(ID, self.latency[ID])
+			self.logger.info('[%s] lateness: mean %.4f, max %.4f sec' % (ID, self.lateness[ID].mean(), self.lateness[ID].max / 1000000.0))
+		for cmd_type in sorted(self.type_latency):
+			if self.type_latency[cmd_type].total == 0: continue
+			log(cmd_type, self.type_latency[cmd_type])
+		if self.warmup_count:
+			self.logger.info('%d operations of the warm-up are excluded' % sum(self.warmup_count.values()))
+		for window in self.windows:
+			s = window.summary()
+			name = 'window %s %g-%s sec' % (window.label, window.begin, '' if window.end is None else '%g' % window.end)
+			if s['completed'] == 0:
+				self.logger.info('[%s] no operation' % name)
+				continue
+			log(name, window.latency)
+			self.logger.info('[%s] rate: target %.1f, achieved %.1f ops/sec, lateness: mean %.4f sec'
+				% (name, s['target_rate'] or 0, s['achieved_rate'] or 0, s['lateness']['mean']))
+		def classes(counter):
+			return ', '.join('%s %d' % (k, counter[k]) for k in sorted(counter))
+		for ID in sorted(self.error_count):
+			if not self.error_count[ID]: continue
+			self.logger.warning('[%s] %d errors (%s), %d operations failed (%s)'
+				% (ID, sum(self.error_count[ID].values()), classes(self.error_count[ID]),
+					sum(self.failed_count[ID].values()), classes(self.failed_count[ID])))
+
+	def get_rate(self):
+		"""Target (scheduled) and achieved (completed) operations/sec of all sessions in each time bin of execution"""
+		res = {'bin': self.report_bin}
+		for key, counters in (('target', self.target_count), ('achieved', self.achieved_count)):
+			counts = report.sumLines(map(report.counterToList, counters.values()) + [[]])
+			res[key] = [x / self.report_bin for x in counts]
+		length = max(len(res['target']), len(res['achieved']))
+		for key in ('target', 'achieved'):
+			res[key] += [0.0] * (length - len(res[key]))
+		return res
+
+	def show_rate(self):
+		"""Log achieved rate compared with target rate"""
+		rate = self.get_rate()
+		target, achieved = rate['target'], rate['achieved']
+		busy = filter(lambda i: target[i], xrange(len(target)))
+		if not busy:
+			return
+		behind = filter(lambda i: achieved[i] < 0.9 * target[i], busy)
+		self.logger.info('rate: target %.1f ops/sec, achieved %.1f ops/sec in %d time bins of %g sec'
+			% (sum(target) / float(len(busy)), sum(achieved[i] for i in busy) / float(len(busy)), len(busy), self.report_bin))
+		if behind:
+			self.logger.warning('rate: achieved less than 90%% of target in %d of %d time bins, first at %g sec'
+				% (len(behind), len(busy), behind[0] * self.report_bin))
+
+	def make_reports(self, title, IDs, planned, actual):
+		"""Reports of planned and actual time lines ({ID: [count of each bin]}) of sessions IDs,
+		and of their sum of each operation type
+
+		Returns:
+			[(str, Report)]: name and report, of sessions and of operation types
+		"""
+		by_session = report.Report(title + ' of each session', self.report_bin, self.histtype)
+		for ID in IDs:
+			by_session.add(ID, planned.get(ID), actual.get(ID))
+		by_type = report.Report(title + ' of each operation type', self.report_bin, self.histtype)
+		for cmd_type in sorted(self.type_cache):
+			members = [ID for ID in IDs if self.session_type[ID] == cmd_type]
+			if members:
+				by_type.addSum(cmd_type, [by_session.series[ID] for ID in members])
+		for r in (by_session, by_type):
+			if self.warmup > 0:
+				r.addMarker(self.warmup, 'warm-up end')
+			for window in self.windows:
+				r.addMarker(window.begin, window.label)
+				if window.end is not None:
+					r.addMarker(window.end, window.label + ' end')
+		return [('session', by_session), ('type', by_type)]
+
+	def output_reports(self, name, reports):
+		"""Save reports as files in report_path, or display them if report_path is empty"""
+		for suffix, r in reports:
+			if self.report_path != '':
+				files = r.save(self.report_path, '%s_%s' % (name, suffix), self.report_formats)
+				self.logger.info('report saved in %s' % ', '.join(files))
+			else:
+				r.show()
+
 	def show_exec_time(self):
+		"""Display or save planned (scheduled) and actual (sent) operations of each time bin of execution"""
 		self.logger.info('displaying execution result.....')
-		start_dt = min(min(self.exec_time_cache.values()))
-		for ID in self.exec_time_cache:
-			self.exec_time_cache[ID] = [(dt - start_dt).total_seconds() for dt in self.exec_time_cache[ID]]
-		plt.hist(self.exec_time_cache.values(), self.bins*len(self.exec_time_cache), label=self.exec_time_cache.keys(), histtype=self.histtype)
-		plt.xlabel('time (sec)')
-		plt.ylabel('number of query')
-		plt.title('Execution Result')
-		plt.legend()
-		plt.show()
+		IDs = sorted(filter(lambda ID: self.sent_count[ID], self.sent_count.keys()))
+		if not IDs:
+			self.logger.warning('No operation executed after the warm-up' if self.warmup_count else 'No operation executed')
+			return
+		planned = {ID: report.counterToList(self.target_count[ID]) for ID in IDs}
+		actual = {ID: report.counterToList(self.sent_count[ID]) for ID in IDs}
+		self.output_reports('execution', self.make_reports('Execution result', IDs, planned, actual))
 
 	def get_session_queue(self):
-		return self.sessions_queue
+		"""All sessions except streams as {ID: {'times': [delay], 'commands': [cmd]}}
+
+		Commands of sessions in file and pre-encoded commands are decoded.
+		"""
+		res = {}
+		for ID, (times, cmds) in self.sessions_queue.items():
+			if self.pre_encode:
+				cmds = map(sessionfile.decodeCommand, cmds)
+			res[ID] = {'times': times.tolist(), 'commands': cmds}
+		scale = self.time_scale_factor
+		for ID, session_file in self.sessions_file.items():
+			times, cmds = session_file.getSession(ID)
+			res[ID] = {'times': [t*scale for t in times], 'commands': cmds}
+		return res
+
+	def getDelays(self, ID):
+		"""Delays of all operations of session ID, except streams"""
+		if ID in self.sessions_file:
+			return self.sessions_file[ID].getTimes(ID) * self.time_scale_factor
+		return self.sessions_queue[ID][0]
 
 	def show(self, showType, showID):
-		"""Display histogram of operation
+		"""Display (or save, see report_path) histogram of scheduled operations of each session and operation type
 		Args:
 			showType (str): Type of displaying operation: {all, find, update, insert, delete}.
 			showID [str]: A list of ID which specifically want to display.
@@ -198,10 +906,10 @@ class Executor(object):
 
 		if showType == 'all':
 			title = 'Workload schedule of all operation'
-			target_ID = self.sessions_queue.keys()
+			target_ID = self.sessions_queue.keys() + self.sessions_file.keys()
 		elif showType in self.type_cache:
 			title = 'Workload schedule of [%s] operations' % showType
-			target_ID = self.type_cache[showType]
+			target_ID = filter(lambda ID: ID not in self.sessions_stream, self.type_cache[showType])
 		else:
 			# raise KeyError('Unknown command type: %s' % showType)
 			self.logger.error('Unknown command type: %s' % showType)
@@ -218,11 +926,6 @@ class Executor(object):
 			# raise RuntimeError('No [%s] operation found. Stop displaying' % (showType))
 			self.logger.error('No [%s] operation found. Stop displaying' % (showType))
 			return
-		all_samples = [self.sessions_queue[ID].keys() for ID in target_ID]
-		plt.hist(all_samples, self.bins*len(target_ID), label=target_ID, histtype=self.histtype)
-		plt.xlabel('time (sec)')
-		plt.ylabel('number of query')
-		plt.title(title)
-		plt.legend()
-		plt.show()
+		planned = {ID: report.binCounts(self.getDelays(ID), self.report_bin) for ID in target_ID}
+		self.output_reports('schedule', self.make_reports(title, sorted(target_ID), planned, {}))
 
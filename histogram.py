@@ -0,0 +1,129 @@
+#    Copyright 2016 Parinz Ameri, Haipeng Guan
+#
+#    This file is part of Nowog.
+#
+#    Nowog is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Nowog is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Nowog.  If not, see <http://www.gnu.org/licenses/>
+
+"""Latency histogram
+
+A log-bucketed histogram in the style of HdrHistogram. Values are recorded in
+microseconds. Below 2**sub_bits every microsecond has its own bucket; above it,
+every power of two is split into 2**(sub_bits-1) buckets of equal width, so the
+relative error of all reported values is less than 2**(1-sub_bits).
+
+Memory is fixed by the highest trackable value, recording is O(1), and two
+histograms with the same settings can be merged by adding their counts.
+
+Example:
+	>>> h = Histogram()
+	>>> h.record(0.0123) # seconds
+	>>> h.percentile(99)
+	0.0123
+
+"""
+
+PERCENTILES = [50, 90, 99, 99.9]
+
+class Histogram(object):
+	"""Fixed memory latency histogram
+
+	Attributes:
+		sub_bits (int): precision of buckets. Default is 7, i.e. relative error less than 1.6%.
+		max_value (int): highest trackable value in microseconds. Larger values are counted
+						in the last bucket, but still reported correctly as max. Default is one hour.
+		counts [int]: amount of values in each bucket.
+		total (int): amount of all recorded values.
+		min (int): smallest recorded value in microseconds.
+		max (int): largest recorded value in microseconds.
+		sum (int): sum of all recorded values in microseconds.
+
+	"""
+	def __init__(self, sub_bits=7, max_value=3600*1000*1000):
+		self.sub_bits = sub_bits
+		self.max_value = max_value
+		self.counts = [0] * (self.index(max_value) + 1)
+		self.total = 0
+		self.min = None
+		self.max = 0
+		self.sum = 0
+
+	def index(self, value):
+		"""Bucket index of value (int, microseconds)"""
+		shift = value.bit_length() - self.sub_bits
+		if shift <= 0:
+			return value
+		return (shift << (self.sub_bits - 1)) + (value >> shift)
+
+	def bucket_range(self, index):
+		"""[lowest, highest] value (microseconds) of bucket index"""
+		if index < (1 << self.sub_bits):
+			return index, index
+		half = 1 << (self.sub_bits - 1)
+		shift = index // half - 1
+		low = (index - shift * half) << shift
+		return low, low + (1 << shift) - 1
+
+	def record(self, seconds):
+		"""Record one value given in seconds. Negative values are counted as 0"""
+		value = max(int(seconds * 1000000), 0)
+		self.counts[self.index(min(value, self.max_value))] += 1
+		self.total += 1
+		self.sum += value
+		if value > self.max:
+			self.max = value
+		if self.min is None or value < self.min:
+			self.min = value
+
+	def merge(self, other):
+		"""Add all values recorded in other into this histogram"""
+		if (other.sub_bits, other.max_value) != (self.sub_bits, self.max_value):
+			raise ValueError('Unable to merge histograms with different settings')
+		for i, count in enumerate(other.counts):
+			if count:
+				self.counts[i] += count
+		self.total += other.total
+		self.sum += other.sum
+		self.max = max(self.max, other.max)
+		if other.min is not None and (self.min is None or other.min < self.min):
+			self.min = other.min
+
+	def percentile(self, p):
+		"""Value (seconds) below or equal to which p percent of all values fall"""
+		if self.total == 0:
+			return None
+		target = max(int(round(self.total * p / 100.0)), 1)
+		cumulative = 0
+		for i, count in enumerate(self.counts):
+			cumulative += count
+			if cumulative >= target:
+				return min(self.bucket_range(i)[1], self.max) / 1000000.0
+		return self.max / 1000000.0
+
+	def mean(self):
+		"""Mean of all values in seconds"""
+		if self.total == 0:
+			return None
+		return self.sum / float(self.total) / 1000000.0
+
+	def summary(self):
+		"""Return a dict of count, min, mean, percentiles and max. All values in seconds"""
+		res = {
+			'count': self.total,
+			'min': self.min / 1000000.0 if self.min is not None else None,
+			'mean': self.mean(),
+			'max': self.max / 1000000.0 if self.total else None,
+		}
+		for p in PERCENTILES:
+			res['p%s' % p] = self.percentile(p)
+		return res
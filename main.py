@@ -56,6 +56,21 @@ Usage example:
 
 		$ python main.py --run
 
+	Generate operations just before execution, without temporary file and
+	sessions file. Memory usage does not depend on the amount of operations.
+
+		$ python main.py --run --stream
+
+	Split all sessions into 4 processes, each with its own executor and database
+	connection. All processes start at the same time.
+
+		$ python main.py --run --workers 4
+
+	Generate operations of the mapping stage in 4 processes, the result does not
+	depend on the amount of processes. Default is the number of CPUs.
+
+		$ python main.py --mapworkers 4
+
 
 Note:
 	NoWog required MongoDB Version 3.2
@@ -72,16 +87,24 @@ __maintainer__ 	= "Haipeng Guan, Parinaz Ameri"
 __email__ 		= "guanhaipeng@gmail.com, parinaz.ameri@kit.edu"
 __status__ 		= "beta"
 
-from bson.son import SON
 import ConfigParser
 import argparse
+import hashlib
 import logging
 import json
+import multiprocessing
+import Queue
+import time
+import os
+from itertools import izip, imap, islice
 
 import distribution
 import mapping
 import parser
 import executor
+import backends
+import sessionfile
+import seeds
 
 # global logger
 logger = logging.getLogger('NoWog')
@@ -91,6 +114,9 @@ CONFIG_FILE = 'config.ini'
 
 TEMP_DATE_FILE = 'temp.dat'
 
+# amount of commands generated by one task of the mapping stage
+MAPPING_CHUNK_SIZE = 100000
+
 def init_logger():
 	ch = logging.StreamHandler()
 	formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -116,9 +142,17 @@ def init_config(config_file):
 		'input_files': [],
 		'parser_result_path': '',
 		'sessions_file_path': '',
+		'latency_result_path': '',
+		'report_path': '',
+		'report_formats': 'png, svg, csv, json',
+		'session_cache_path': '',
+		'parser_cache_path': '',
+		'telemetry_path': '',
 		'db_name': 'NoWog',
 		'coll_name': 'NoWog_test',
 		'URL': 'mongodb://localhost',
+		'backend': 'mongodb',
+		'memory_indexes': '',
 		'seed': None,
 		'time_scale_factor': 1.0,
 	}
@@ -131,44 +165,274 @@ def init_config(config_file):
 
 
 
-def makeTimeTable(d_info, parser_result, db_cmd):
-	"""Generate execution time table.
-	Use distribution information to generate time stamps.
-	Use parse result to generate MongoDB operations, a.k.a parameter for runCommand()
-	"""
-	read, write, sort = parser_result.values()
-	samples = distribution.drawSamples(d_info['type'],
+def drawTimes(d_info, seed_seq):
+	"""Draw time stamps of a session in ascending order from the stream of seed_seq (SeedSequence of the session)"""
+	dist = distribution.Distribution(seed_seq.spawn('times').getSeed())
+	try:
+		return dist.drawSamples(d_info['type'],
 										d_info['time_period'][0], d_info['time_period'][1],
 										d_info['total'], *d_info['parameters'])
+	except (KeyError, ValueError), e:
+		logger.error('failed to draw samples: %s' % str(e))
+		logger.error('program exit with error')
+		exit()
+
+def initMapping(values_kwargs, coll_name):
+	"""Initialize the mapping module of the current (worker) process, see mapChunk()"""
+	global mapping_db_cmd, mapping_coll_name
+	mapping_db_cmd = mapping.DBCommand(None, **values_kwargs)
+	mapping_coll_name = coll_name
+
+def mapChunk(task):
+	"""Generate commands of one chunk of a session, encoded into BSON.
+
+	Args:
+		task (parser_result, size, seed): parser result of the session, amount of commands
+			and the seed of this chunk. The commands only depend on task, not on the process
+			or on other chunks.
+
+	Returns:
+		(str, [int]): concatenated BSON and the length of each command, see sessionfile.encodeCommands()
+	"""
+	parser_result, size, seed = task
+	mapping_db_cmd.values.seed(seed)
+	cmds = mapping_db_cmd.makeCommands(parser_result['read'], parser_result['write'],
+										parser_result['sort'], size, mapping_coll_name)
+	return sessionfile.encodeCommands(cmds)
+
+def generatorHash():
+	"""Hash of the source of the modules generating sessions, part of the key of cached sessions.
+	A change of the samplers, value generators, mapping or seed derivation invalidates the cache"""
+	h = hashlib.sha256()
+	for module in (distribution, mapping.values, mapping, seeds):
+		with open(os.path.splitext(module.__file__)[0] + '.py', 'rb') as f:
+			h.update(f.read())
+	return h.hexdigest()
+
+def mapSessions(sessions, seed_seq, writer, values_kwargs, coll_name, processes=1, cache=None):
+	"""Map all sessions and write them into writer (SessionWriter).
+
+	Each session is split into chunks of MAPPING_CHUNK_SIZE commands, which are
+	generated by a pool of processes, one task per chunk. Time stamps are drawn in
+	this process. Time stamps of every session and values of every chunk have their
+	own independent stream spawned from seed_seq (SeedSequence) by session ID, so
+	the result of a session is the same with any amount of processes and does not
+	depend on other sessions.
+
+	If cache (SessionCache) is given, sessions are looked up by a key of their rule,
+	value settings, seed, collection name, chunk size and the source of the generating
+	modules (generatorHash()), which is all the mapping of a session depends on. Cached
+	sessions are copied from the cache, the others are mapped and saved in the cache.
+	"""
+	IDs = sorted(sessions)
+	cached = set()
+	if cache:
+		keys = {}
+		generator = generatorHash()
+		for ID in IDs:
+			keys[ID] = cache.key(ID, sessions[ID], values_kwargs, seed_seq.entropy, coll_name, MAPPING_CHUNK_SIZE, generator)
+			if cache.has(keys[ID]):
+				cached.add(ID)
+		logger.info('[%d] of [%d] sessions are reused from cache [%s]' % (len(cached), len(IDs), cache.path))
+	mapped = [ID for ID in IDs if ID not in cached]
+	times = {}
+	for ID in mapped:
+		times[ID] = drawTimes(sessions[ID]['distribution'], seed_seq.spawn(ID))
+	sizes = {ID: len(times[ID]) for ID in mapped}
+	tasks = ((sessions[ID]['parser_result'], min(MAPPING_CHUNK_SIZE, sizes[ID] - begin), seed_seq.spawn(ID, 'values', begin).getSeed())
+				for ID in mapped for begin in xrange(0, sizes[ID], MAPPING_CHUNK_SIZE))
+	if processes > 1 and mapped:
+		logger.info('mapping sessions in [%d] processes' % processes)
+		pool = multiprocessing.Pool(processes, initMapping, (values_kwargs, coll_name))
+		chunks = pool.imap(mapChunk, tasks)
+	else:
+		pool = None
+		initMapping(values_kwargs, coll_name)
+		chunks = imap(mapChunk, tasks)
 	try:
-		cmds = db_cmd.makeCommands(read, write, sort, len(samples), coll_name)
+		for ID in IDs:
+			if ID in cached:
+				session_file = cache.load(keys[ID])
+			else:
+				logger.info('mapping session [%s]' % ID)
+				session_chunks = islice(chunks, -(-sizes[ID] // MAPPING_CHUNK_SIZE))
+				if not cache:
+					writer.addEncodedSession(ID, times.pop(ID), session_chunks)
+					continue
+				session_file = cache.save(keys[ID], ID, times.pop(ID), session_chunks)
+			writer.addEncodedSession(ID, session_file.getTimes(ID), session_file.iterChunks(ID))
+			session_file.close()
 	except TypeError, e:
 		logger.error('failed to mapping into MongoDB command: %s' % str(e))
 		logger.error('program exit with error')
+		if pool:
+			pool.terminate()
 		exit()
-	res = {}
-	for i in xrange(len(samples)):
-		res[samples[i]] = cmds[i]
-	# res = {samples[i]: cmds[i] for i in xrange(len(samples))}
-	assert(len(res) == d_info['total'])
-	return res
+	if pool:
+		pool.close()
+		pool.join()
+
+def makeStream(d_info, parser_result, seed_seq, values_kwargs, coll_name):
+	"""Lazy version of mapSessions() for one session: an iterator of (time, cmd) in ascending order of time.
+	Time stamps and MongoDB operations are only generated when the iterator is consumed.
+	Both are drawn from the streams of seed_seq (SeedSequence of the session), so they
+	do not depend on the order in which the streams of all sessions are consumed.
+	Commands are made in chunks of MAPPING_CHUNK_SIZE with the seeds of the chunks of
+	mapSessions(), so the session is the same as without [--stream].
+	"""
+	dist = distribution.Distribution(seed_seq.spawn('times').getSeed())
+	db_cmd = mapping.DBCommand(None, **values_kwargs)
+	try:
+		samples = dist.iterSamples(d_info['type'],
+											d_info['time_period'][0], d_info['time_period'][1],
+											d_info['total'], *d_info['parameters'])
+	except (KeyError, ValueError), e:
+		logger.error('failed to draw samples: %s' % str(e))
+		logger.error('program exit with error')
+		exit()
+	try:
+		db_cmd.checkType(parser_result['read'], parser_result['write'])
+	except TypeError, e:
+		logger.error('failed to mapping into MongoDB command: %s' % str(e))
+		logger.error('program exit with error')
+		exit()
+	def iterCommands():
+		for begin in xrange(0, d_info['total'], MAPPING_CHUNK_SIZE):
+			db_cmd.values.seed(seed_seq.spawn('values', begin).getSeed())
+			for cmd in db_cmd.makeCommands(parser_result['read'], parser_result['write'], parser_result['sort'],
+											min(MAPPING_CHUNK_SIZE, d_info['total'] - begin), coll_name):
+				yield cmd
+	return izip(samples, iterCommands())
+
 
+def connectDB(connection, **kwargs):
+	"""Connect to the database of a backend (see backends.py).
 
-def connectDB(MongoDB_URL):
-	from pymongo import MongoClient
+	Args:
+		connection (dict): backend, URL, db_name and memory_indexes of [connection] in config.ini
+		**kwargs: passed to MongoClient, e.g. maxPoolSize
+	"""
+	indexes = filter(None, [x.strip() for x in connection['memory_indexes'].split(',')])
 	try:
-		client = MongoClient(MongoDB_URL, serverSelectionTimeoutMS=1)
-		client.server_info() # force to connect
+		db = backends.connect(connection['backend'], connection['URL'], connection['db_name'], indexes, **kwargs)
 	except Exception, e:
 		logger.error('Unable to connect to database: %s' % str(e))
 		logger.error('program exit with error')
 		exit()
 		# raise e
-	logger.info('connection established')
-	return client
+	logger.info('connection established (backend [%s])' % connection['backend'])
+	return db
+
 
 
 
+def shardSessions(session_sizes, n):
+	"""Split sessions into at most n groups with balanced amount of operations.
+
+	Args:
+		session_sizes {str: int}: amount of operations of each session ID
+		n (int): amount of groups
+
+	Returns:
+		[[str]]: lists of session IDs. Empty groups are dropped.
+	"""
+	groups = [[] for _ in xrange(n)]
+	loads = [0]*n
+	for ID in sorted(session_sizes, key=session_sizes.get, reverse=True):
+		i = loads.index(min(loads))
+		groups[i].append(ID)
+		loads[i] += session_sizes[ID]
+	return filter(None, groups)
+
+def getFromProcesses(queue, procs):
+	"""Get one item from queue, stop waiting if any process exit with error"""
+	while True:
+		try:
+			return queue.get(timeout=1)
+		except Queue.Empty:
+			failed = filter(lambda p: p.exitcode not in (None, 0), procs)
+			if failed:
+				raise RuntimeError('process [%s] exit with code [%d]' % (failed[0].name, failed[0].exitcode))
+
+def executeShard(exe, index, IDs, connection, coll_name, ready, go, start, results):
+	"""Worker process of runProcesses(): execute sessions IDs of exe as worker index"""
+	if exe.telemetry:
+		exe.telemetry.setWorker(index)
+	for ID in exe.getSessionIDs():
+		if ID not in IDs:
+			exe.removeSession(ID)
+	db = connectDB(connection, maxPoolSize=max(100, exe.threads))
+	exe.setCollection(db[coll_name])
+	ready.put(os.getpid())
+	go.wait()
+	exe.execute(start.value)
+	results.put(exe.get_results())
+
+def runProcesses(exe, workers, connection, coll_name):
+	"""Execute all sessions of exe in several processes.
+
+	Sessions are split into workers groups, each group is executed by an Executor
+	with its own MongoClient in a separate process. The database is initialized
+	only once in the main process. All processes wait until every process is
+	connected, and then count their delays from the same start time. Execution
+	results of all processes are merged into exe.
+	"""
+	try:
+		exe.init_execution()
+	except Exception, e:
+		logger.error('execution initialization failed! execution stop!')
+		return
+	groups = shardSessions(exe.session_size, workers)
+	ready = multiprocessing.Queue()
+	results = multiprocessing.Queue()
+	go = multiprocessing.Event()
+	start = multiprocessing.Value('d', 0.0)
+	procs = []
+	for i, IDs in enumerate(groups):
+		logger.info('process [%d] executes sessions %r' % (i, IDs))
+		procs.append(multiprocessing.Process(target=executeShard, name='NoWog-worker-%d' % i,
+						args=(exe, i, IDs, connection, coll_name, ready, go, start, results)))
+	for p in procs:
+		p.start()
+	try:
+		for _ in procs:
+			getFromProcesses(ready, procs)
+		start.value = time.time() + executor.START_DELAY
+		go.set()
+		logger.info('# # # # # # # # Start execution in [%d] processes # # # # # # # # #' % len(procs))
+		for _ in procs:
+			exe.merge_results(getFromProcesses(results, procs))
+	except RuntimeError, e:
+		logger.error('execution failed: %s' % str(e))
+		for p in procs:
+			p.terminate()
+		return
+	for p in procs:
+		p.join()
+	logger.info('# # # # # # # # Execution finish # # # # # # # # #')
+	exe.show_latency()
+	exe.show_rate()
+	exe.save_latency()
+	exe.show_exec_time()
+
+def executeSessions(exe, try_run, run, workers, connection, coll_name):
+	"""Connect to the database of the backend, then try (--try) and run (--run) all sessions of exe.
+	Statistics of the null and memory backend are logged, if sessions are executed in this process"""
+	logger.info('Connecting to database')
+	# all threads share the connection pool of one client
+	db = connectDB(connection, maxPoolSize=max(100, exe.threads))
+	exe.setCollection(db[coll_name])
+
+	if try_run:
+		exe.try_run()
+	if run:
+		if workers > 1:
+			runProcesses(exe, workers, connection, coll_name)
+		else:
+			exe.run()
+	# any attribute of a pymongo Database is a Collection, check the class instead of hasattr()
+	if isinstance(db, backends.NullDatabase) and (workers <= 1 or not run):
+		logger.info('backend [%s]: %s' % (connection['backend'], json.dumps(db.stats(), sort_keys=True)))
 
 def open_file(file_name, mode):
 	try:
@@ -186,12 +450,23 @@ if __name__ == '__main__':
 	arg_parser = argparse.ArgumentParser(description='Given no arguments, the program will stop after saving session file')
 	arg_parser.add_argument('-t','--try', dest='try_run',help='execute each command once. In order to make sure all commands are runnable', action='store_true')
 	arg_parser.add_argument('-r','--run',help='run all commands under schedule', action='store_true')
+	arg_parser.add_argument('--stream',help='generate operations during execution, instead of saving them in temporary file and sessions file', action='store_true')
+	arg_parser.add_argument('--workers',help='number of processes executing sessions in --run. Default is 1', type=int, default=1)
+	arg_parser.add_argument('--mapworkers',help='number of processes generating operations in the mapping stage. Default is the number of CPUs', type=int, default=multiprocessing.cpu_count())
 	arg_parser.add_argument('--show',dest='showType',help='Display workload schedule diagram of specific operation type. Default is "all" operation', choices=['all', 'find', 'insert', 'update', 'delete'], nargs='?', const='all')
 	arg_parser.add_argument('--showid',help='Display workload schedule diagram of specific ID',nargs='+')
 	args = arg_parser.parse_args()
 	logger = init_logger()
 	if not (args.try_run or args.run or args.showType or args.showid):
 		logger.warning('Given no arguments, the program will stop after saving session file')
+	if args.workers < 1 or args.mapworkers < 1:
+		logger.error('[--workers] and [--mapworkers] must be equal or greater than 1')
+		logger.error('Program exit with error')
+		exit()
+	if args.stream and (args.showType or args.showid):
+		logger.error('[--show] and [--showid] are not available with [--stream]')
+		logger.error('Program exit with error')
+		exit()
 
 	# # ---------------------------------------------
 	# # # # # #  handle configuration file  # # # # #
@@ -201,10 +476,12 @@ if __name__ == '__main__':
 	BNF_infiles = filter(None, [x.strip() for x in config.get('inputs', 'input_files').split(',')])
 	parser_result_path = config.get('outputs', 'parser_result_path')
 	sessions_file = config.get('outputs', 'sessions_file_path')
-	db_name   = config.get('connection', 'db_name')
+	latency_result_path = config.get('outputs', 'latency_result_path')
+	session_cache_path = config.get('outputs', 'session_cache_path')
+	parser_cache_path = config.get('outputs', 'parser_cache_path')
 	coll_name = config.get('connection', 'coll_name')
 	seed = config.getint('seed', 'seed')
-	MongoDB_URL = config.get('connection', 'URL')
+	connection = {key: config.get('connection', key) for key in ('backend', 'URL', 'db_name', 'memory_indexes')}
 	size_scale_factor = config.getfloat('scale_factor', 'size_scale_factor')
 	values_kwargs = {}
 	exec_kwargs = {}
@@ -220,6 +497,10 @@ if __name__ == '__main__':
 			exec_kwargs[k] = str_to_bool(v)
 		# exec_kwargs = {k: str_to_bool(v) for k,v in exec_kwargs.items()}
 	exec_kwargs['time_scale_factor'] = config.getfloat('scale_factor', 'time_scale_factor')
+	exec_kwargs['latency_result_path'] = latency_result_path
+	exec_kwargs['report_path'] = config.get('outputs', 'report_path')
+	exec_kwargs['report_formats'] = config.get('outputs', 'report_formats')
+	exec_kwargs['telemetry_path'] = config.get('outputs', 'telemetry_path')
 
 
 	# # ---------------------------------------------
@@ -230,9 +511,7 @@ if __name__ == '__main__':
 	if BNF_infiles != []:
 		for bnf_file in BNF_infiles:
 			logger.info('Parse BNF files [%s]' % bnf_file)
-			with open(bnf_file, 'r') as f:
-				rulesetStr = f.read()
-			sessions.update(parser.parse_rulesetStr(rulesetStr))
+			sessions.update(parser.parse_file(bnf_file, parser_cache_path))
 
 		# saving parser result
 		if parser_result_path != '':
@@ -244,24 +523,34 @@ if __name__ == '__main__':
 
 		# Mapping BNF into parameters of runCommand
 		logger.info('=== Mapping stage ===')
-		logger.info('initializing distribution seed: [%r]' % seed)
-		distribution.seed(seed)
+		seed_seq = seeds.SeedSequence(seed)
+		logger.info('initializing seed: [%r]' % seed_seq.entropy)
 		try:
 			logger.info('initializing mapping module')
-			db_cmd = mapping.DBCommand(seed, **values_kwargs)
+			mapping.DBCommand(None, **values_kwargs)
 		except ValueError, e:
 			logger.error('initialize mapping module failed: %s' % str(e))
 			logger.error('Program exit with error')
 			exit()
-		# save each session (mapping result) one by one into temp_data_file
-		f = open_file(TEMP_DATE_FILE, 'w')
 		for ID in sessions:
-			logger.info('mapping session [%s]' % ID)
 			sessions[ID]['distribution']['total'] = int(sessions[ID]['distribution']['total']*size_scale_factor)
-			new_time_table = makeTimeTable(sessions[ID]['distribution'], sessions[ID]['parser_result'], db_cmd)
-			f.write("{}\n".format(json.dumps({ID: new_time_table})))
-		f.close()
-		del sessions
+		if args.stream:
+			# operations are generated during execution
+			streams = {}
+			for ID in sessions:
+				logger.info('mapping session [%s] as stream' % ID)
+				streams[ID] = makeStream(sessions[ID]['distribution'], sessions[ID]['parser_result'], seed_seq.spawn(ID), values_kwargs, coll_name)
+		else:
+			# save each session (mapping result) one by one into temp_data_file
+			cache = None
+			if session_cache_path != '':
+				cache = sessionfile.SessionCache(session_cache_path)
+			else:
+				logger.warning('No session cache will be used')
+			writer = sessionfile.SessionWriter(open_file(TEMP_DATE_FILE, 'wb'))
+			mapSessions(sessions, seed_seq, writer, values_kwargs, coll_name, args.mapworkers, cache)
+			writer.close()
+			del sessions
 	else:
 		logger.error('No input files')
 		logger.error('Program exit with error')
@@ -272,20 +561,28 @@ if __name__ == '__main__':
 	# # # # # # # # # execution! # # # # # # # # #
 	# # ---------------------------------------------
 	logger.info('initializing executor')
-	exe = executor.Executor(**exec_kwargs)
-
-	# read all sessions (mapping result) from temp_data_file
-	f = open_file(TEMP_DATE_FILE, 'r')
-	for line in f:
-		a_session = json.loads(line, object_pairs_hook=SON)
-		ID = a_session.keys()[0]
-		# logger.info('reading [%s] from file [%s]' % (ID, sessions_file))
-		a_session[ID] = {float(t): a_session[ID][t] for t in a_session[ID]}
-		logger.info('Add session [%s] into executor' % ID)
-		exe.addSession(ID, a_session[ID])
-	f.close()
-
-	if sessions_file != '':
+	try:
+		exe = executor.Executor(**exec_kwargs)
+	except ValueError, e:
+		logger.error('initialize executor failed: %s' % str(e))
+		logger.error('Program exit with error')
+		exit()
+
+	if args.stream:
+		for ID in streams:
+			logger.info('Add session [%s] into executor as stream' % ID)
+			exe.addSessionStream(ID, streams[ID], sessions[ID]['distribution']['total'])
+		del sessions
+	else:
+		# map all sessions (mapping result) from temp_data_file, commands are read during execution
+		session_file = sessionfile.SessionFile(open_file(TEMP_DATE_FILE, 'rb'))
+		for ID in session_file.getSessionIDs():
+			logger.info('Add session [%s] into executor' % ID)
+			exe.addSessionFile(ID, session_file)
+
+	if args.stream:
+		logger.warning('No sessions files will be saved with [--stream]')
+	elif sessions_file != '':
 		logger.info('saving sessions queue in [%s]' % sessions_file)
 		with open(sessions_file, 'w') as f:
 			json.dump(exe.get_session_queue(), f, indent=4)
@@ -298,14 +595,7 @@ if __name__ == '__main__':
 			exe.show(args.showType, args.showid)
 
 		if args.try_run or args.run:
-			logger.info('Connecting to database')
-			db = connectDB(MongoDB_URL)[db_name]
-			exe.setCollection(db[coll_name])
-
-			if args.try_run:
-				exe.try_run()
-			if args.run:
-				exe.run()
+			executeSessions(exe, args.try_run, args.run, args.workers, connection, coll_name)
 		logger.info('all executions finish')
 	else:
 		logger.info('No further execution arguments specified')
@@ -17,6 +17,7 @@
 
 import random
 import string
+from itertools import izip
 from bson.son import SON
 import values
 import logging
@@ -25,6 +26,8 @@ import logging
 This module is used for mapping parse result into MongoDB command.
 
 The core methods of mapping only include unpack(), makeSON() and mapping().
+Template is the compiled form of mapping(), used for generating many commands
+from the same rule.
 
 DBCommand class is specifically used for generate a instance of SON, which can be
 directly used in db.command().
@@ -69,91 +72,235 @@ def makeSON(lst):
 			res[l[0]] = '.'.join(l[1:])
 	return res
 
+# amount of commands made at once by the endless generators (iterCommands)
+BLOCK_SIZE = 4096
+
+# list of operations in each type of command which can be batched
+BATCH_FIELDS = {
+	'insert': 'documents',
+	'update': 'updates',
+	'delete': 'deletes',
+}
+
+def mergeCommands(cmds, ordered=True):
+	"""Merge insert, update or delete commands into one command.
+
+	All commands should be in the same type and collection.
+
+	Example:
+		[{'insert': 'c', 'documents': [d1]}, {'insert': 'c', 'documents': [d2]}]
+		--> {'insert': 'c', 'documents': [d1, d2], 'ordered': True}
+	"""
+	cmd_type = cmds[0].keys()[0]
+	field = BATCH_FIELDS[cmd_type]
+	res = SON([(cmd_type, cmds[0][cmd_type]), (field, [])])
+	for cmd in cmds:
+		res[field].extend(cmd[field])
+	res['ordered'] = ordered
+	return res
+
 def mapping(data, dictionary):
 	"""Mapping a dictionary (SON) into a a MongoDB command.
 
-	The idea is: all values are keywords of a lambda functions dictionary,
-	each function take attribute as the only argument. Each lambda function
-	will generate a SON file consist of proper form of MongoDB operation
-	and a random values in designated place.
+	The idea is: all values are keywords of a dictionary of (operator, function,
+	batch function). Each function take no argument and generate a random value
+	(or a proper form of MongoDB operation with random values), the batch
+	function is used by Template.makeBatch(). If operator is None, the value is
+	placed under the attribute, otherwise under {operator: {attribute: value}}.
 
 	Note:
-		please notice that same keyword might represent different lambda
-		function in different type of operation.
+		please notice that same keyword might represent different function
+		in different type of operation.
 		E.g. Array.Num in update and insert represent different operator.
 
 	Example:
-		{'A1.B1': 'num_match'} + {'num_match' : lambda attr: {attr: self.values.randInt()},}
+		{'A1.B1': 'num_match'} + {'num_match' : (None, self.values.randInt, self.values.randIntBatch)}
 		--> return {'A1.B1': 130416}
+		{'A1.B1': 'num_match'} + {'num_match' : ('$set', self.values.randInt, self.values.randIntBatch)}
+		--> return {'$set': {'A1.B1': 130416}}
 	"""
 	res = SON()
 	for attr,cmd in data.items():
 		if isinstance(cmd, dict): # nested document: {'A1': {'B1': 'num_match'}}
 			res[attr] = mapping(cmd, dictionary)
 		else:
-			new = dictionary[cmd](attr)
-			assert(len(new) == 1)
-			k, v = new.items()[0]
-			if k in res: # duplicate attribute -> operators in update, e.g. $set, $push
-				res[k].update(v)
+			op, func, _ = dictionary[cmd]
+			if op is None:
+				res[attr] = func()
+			elif op in res: # duplicate operators in update, e.g. $set, $push
+				res[op].update({attr: func()})
 			else:
-				res.update(new)
+				res[op] = {attr: func()}
 	return res
 
+def repeat(func):
+	"""Batch version of a function without randomness, e.g. a constant"""
+	return lambda n: [func() for _ in xrange(n)]
+
+
+class Template(object):
+	"""Compiled form of mapping(data, dictionary).
+
+	The structure of all commands made from the same data is identical, only
+	random values differ. Template walks data only once and flattens it into a
+	list of steps, each of which either creates a nested document or fills one
+	slot with a value function. make() only runs these steps, and gives the same
+	result (and consumes random values in the same order) as mapping().
+	makeBatch(n) runs these steps once for n commands, so every batch function is
+	called once for a whole batch.
+
+	Attributes:
+		steps [(int, int, str, function, function)]: (kind, index of parent document, key, value function,
+			batch function). kind is one of:
+				NODE: create a nested document parent[key]
+				VALUE: parent[key] = function()
+				OPERATOR: create parent[operator] = {attribute: function()}, key is (operator, attribute)
+				MERGE: add {key: function()} into parent, which is an operator document
+			batch(n) returns a list of n values.
+			The root document has index 0, each created document gets the next index.
+	"""
+	NODE, VALUE, OPERATOR, MERGE = range(4)
+
+	def __init__(self, data, dictionary):
+		self.steps = []
+		self.count = 1
+		self.compile(data, dictionary, 0)
+
+	def compile(self, data, dictionary, parent):
+		operators = {} # {operator: index of its document}
+		for attr,cmd in data.items():
+			if isinstance(cmd, dict):
+				node = self.addNode(self.NODE, parent, attr, None, None)
+				self.compile(cmd, dictionary, node)
+				continue
+			op, func, batch = dictionary[cmd]
+			if op is None:
+				self.steps.append((self.VALUE, parent, attr, func, batch))
+			elif op in operators:
+				self.steps.append((self.MERGE, operators[op], attr, func, batch))
+			else:
+				operators[op] = self.addNode(self.OPERATOR, parent, (op, attr), func, batch)
+
+	def addNode(self, kind, parent, key, func, batch):
+		self.steps.append((kind, parent, key, func, batch))
+		self.count += 1
+		return self.count - 1
+
+	def make(self):
+		"""Make one SON with new random values"""
+		nodes = [SON()]
+		append = nodes.append
+		VALUE, MERGE, NODE = self.VALUE, self.MERGE, self.NODE
+		for kind, parent, key, func, _ in self.steps:
+			if kind == VALUE:
+				nodes[parent][key] = func()
+			elif kind == MERGE:
+				nodes[parent].update({key: func()})
+			elif kind == NODE:
+				node = SON()
+				nodes[parent][key] = node
+				append(node)
+			else:
+				op, attr = key
+				node = {attr: func()}
+				nodes[parent][op] = node
+				append(node)
+		return nodes[0]
+
+	def makeBatch(self, n):
+		"""Make a list of n SON with new random values"""
+		nodes = [[SON() for _ in xrange(n)]]
+		append = nodes.append
+		VALUE, MERGE, NODE = self.VALUE, self.MERGE, self.NODE
+		for kind, parent, key, _, func in self.steps:
+			docs = nodes[parent]
+			if kind == VALUE:
+				for doc, v in izip(docs, func(n)):
+					doc[key] = v
+			elif kind == MERGE:
+				for doc, v in izip(docs, func(n)):
+					doc.update({key: v})
+			elif kind == NODE:
+				children = [SON() for _ in xrange(n)]
+				for doc, child in izip(docs, children):
+					doc[key] = child
+				append(children)
+			else:
+				op, attr = key
+				children = [{attr: v} for v in func(n)]
+				for doc, child in izip(docs, children):
+					doc[op] = child
+				append(children)
+		return nodes[0]
+
+	def iterMake(self, block=BLOCK_SIZE):
+		"""Endless generator of SON, made in batches of block"""
+		while True:
+			for doc in self.makeBatch(block):
+				yield doc
+
 
 class DBCommand(object):
 	"""Generate a instance of SON can be directly used by db.command()"""
 	def __init__(self, seed=None, **kwargs):
 		self.logger = logging.getLogger('DBCommand')
 		self.logger.setLevel(logging.INFO)
-		self.init_values(seed, **kwargs)
-		self.query_dict = { # used for find() and delete()
-			'True'  : lambda attr: {attr: True},
-			'False' : lambda attr: {attr: False},
-			'geo_op': lambda attr: {attr: {'$near': {'$geometry': {'type': 'Point', 'coordinates': [0, 0]},'$maxDistance': 50}}},
-			'num_match' : lambda attr: {attr: self.values.randInt()},
-			'text_read' : lambda attr: {attr: self.values.randStr()},
-			'range_op'  : lambda attr: {attr: self.values.randRangeDict()},
-			'arr_read_op' : lambda attr: {attr: self.values.randIntArray()},
-			'arr_read_op.Text' : lambda attr: {attr: self.values.randStrArray()},
-			'arr_read_op.Num'  : lambda attr: {attr: self.values.randIntArray()},
-			'arr_read_op.Bool' : lambda attr: {attr: self.values.randBoolArray()},
-			'arr_read_op.range_op' : lambda attr: {attr: {'$elemMatch': self.values.randRangeDict()}},
-		}
 		self.sort_dict = { # used for find()
 			'1' : 1,
 			'-1': -1
 		}
+		self.init_values(seed, **kwargs)
+
+	def init_values(self, seed=None, **kwargs):
+		self.values = values.Values(seed, **kwargs)
+		self.init_dictionaries()
+
+	def init_dictionaries(self):
+		"""Bind all mapping dictionaries to the single and batch value generators of self.values"""
+		v = self.values
+		true, false = (lambda: True), (lambda: False)
+		geo = lambda: {'$near': {'$geometry': {'type': 'Point', 'coordinates': [0, 0]},'$maxDistance': 50}}
+		self.query_dict = { # used for find() and delete()
+			'True'  : (None, true, repeat(true)),
+			'False' : (None, false, repeat(false)),
+			'geo_op': (None, geo, repeat(geo)),
+			'num_match' : (None, v.randInt, v.randIntBatch),
+			'text_read' : (None, v.randStr, v.randStrBatch),
+			'range_op'  : (None, v.randRangeDict, v.randRangeDictBatch),
+			'arr_read_op' : (None, v.randIntArray, v.randIntArrayBatch),
+			'arr_read_op.Text' : (None, v.randStrArray, v.randStrArrayBatch),
+			'arr_read_op.Num'  : (None, v.randIntArray, v.randIntArrayBatch),
+			'arr_read_op.Bool' : (None, v.randBoolArray, v.randBoolArrayBatch),
+			'arr_read_op.range_op' : (None, lambda: {'$elemMatch': v.randRangeDict()},
+				lambda n: [{'$elemMatch': r} for r in v.randRangeDictBatch(n)]),
+		}
 		self.update_dict = { # used for update()
-			'True' : lambda attr: {'$set': {attr: True}},
-			'False': lambda attr: {'$set': {attr: False}},
-			'num_match'  : lambda attr: {'$set': {attr: self.values.randInt()}},
-			'text_write' : lambda attr: {'$set': {attr: self.values.randStr()}},
-			'Array.Text' : lambda attr: {'$set': {attr: self.values.randStrArray()}},
-			'Array.Num'  : lambda attr: {'$set': {attr: self.values.randIntArray()}},
-			'Array.Bool' : lambda attr: {'$set': {attr: self.values.randBoolArray()}},
-
-			'arr_add_op.Text' : lambda attr: {'$push': {attr: self.values.randStr()}},
-			'arr_add_op.Num'  : lambda attr: {'$push': {attr: self.values.randInt()}},
-			'arr_add_op.Bool' : lambda attr: {'$push': {attr: self.values.randBool()}},
-
-			'arr_remove_op.Text' : lambda attr: {'$push': {attr: self.values.randStrArray()}},
-			'arr_remove_op.Num'  : lambda attr: {'$push': {attr: self.values.randIntArray()}},
-			'arr_remove_op.Bool' : lambda attr: {'$push': {attr: self.values.randBoolArray()}},
+			'True' : ('$set', true, repeat(true)),
+			'False': ('$set', false, repeat(false)),
+			'num_match'  : ('$set', v.randInt, v.randIntBatch),
+			'text_write' : ('$set', v.randStr, v.randStrBatch),
+			'Array.Text' : ('$set', v.randStrArray, v.randStrArrayBatch),
+			'Array.Num'  : ('$set', v.randIntArray, v.randIntArrayBatch),
+			'Array.Bool' : ('$set', v.randBoolArray, v.randBoolArrayBatch),
+
+			'arr_add_op.Text' : ('$push', v.randStr, v.randStrBatch),
+			'arr_add_op.Num'  : ('$push', v.randInt, v.randIntBatch),
+			'arr_add_op.Bool' : ('$push', v.randBool, v.randBoolBatch),
+
+			'arr_remove_op.Text' : ('$push', v.randStrArray, v.randStrArrayBatch),
+			'arr_remove_op.Num'  : ('$push', v.randIntArray, v.randIntArrayBatch),
+			'arr_remove_op.Bool' : ('$push', v.randBoolArray, v.randBoolArrayBatch),
 		}
 		self.document_dict = { # used for inert()
-			'True'  : lambda attr: {attr: True},
-			'False' : lambda attr: {attr: False},
-			'num_match'  : lambda attr: {attr: self.values.randInt()},
-			'text_write' : lambda attr: {attr: self.values.randStr()},
-			'Array.Text' : lambda attr: {attr: self.values.randStrArray()},
-			'Array.Num'  : lambda attr: {attr: self.values.randIntArray()},
-			'Array.Bool' : lambda attr: {attr: self.values.randBoolArray()},
+			'True'  : (None, true, repeat(true)),
+			'False' : (None, false, repeat(false)),
+			'num_match'  : (None, v.randInt, v.randIntBatch),
+			'text_write' : (None, v.randStr, v.randStrBatch),
+			'Array.Text' : (None, v.randStrArray, v.randStrArrayBatch),
+			'Array.Num'  : (None, v.randIntArray, v.randIntArrayBatch),
+			'Array.Bool' : (None, v.randBoolArray, v.randBoolArrayBatch),
 		}
 
-	def init_values(self, seed=None, **kwargs):
-		self.values = values.Values(seed, **kwargs)
-
 	def makeCommands(self, read, write, sort, size=1, coll_name='undefined'):
 		if self.isFind(read, write):
 			return self.makeFindCmds(read, sort, size, coll_name)
@@ -166,6 +313,22 @@ class DBCommand(object):
 		else:
 			self.hanlde_err_type(read, write)
 
+	def iterCommands(self, read, write, sort, coll_name='undefined'):
+		"""Endless generator of commands, the lazy version of makeCommands().
+
+		Operation type errors are raised immediately, not during iteration.
+		"""
+		if self.isFind(read, write):
+			return self.iterFindCmds(read, sort, coll_name)
+		elif self.isInsert(read, write):
+			return self.iterInsertCmds(write, coll_name)
+		elif self.isUpdate(read, write):
+			return self.iterUpdateCmds(read, write, coll_name)
+		elif self.isDelete(read, write):
+			return self.iterDeleteCmds(read, coll_name)
+		else:
+			self.hanlde_err_type(read, write)
+
 
 
 	# -------------------------------------------------------------------
@@ -185,6 +348,11 @@ class DBCommand(object):
 		return read == [] and write != [] and write[0] != 'NULL'
 	def isDelete(self, read, write):
 		return read != [] and read[0] != 'ALL' and write[0] == 'NULL'
+	def checkType(self, read, write):
+		"""Raise TypeError if read and write do not form an operation type"""
+		if not (self.isFind(read, write) or self.isInsert(read, write) or
+				self.isUpdate(read, write) or self.isDelete(read, write)):
+			self.hanlde_err_type(read, write)
 	def hanlde_err_type(self, read, write):
 		err_str = 'Operation type error: '
 		if read == [] and write == []:
@@ -201,36 +369,66 @@ class DBCommand(object):
 
 	def makeFindCmds(self, read, sort, size=1, coll_name='undefined'):
 		self.logger.info('making %d commands: [find]' % size)
-		queries = self.makeQuery(read, size)
 		sort = self.makeSort(sort)
-		return [self.getFindTemplate(q, sort, coll_name) for q in queries]
+		return [self.getFindTemplate(q, sort, coll_name) for q in self.makeQuery(read, size)]
 	def makeUpdateCmds(self, read, write, size=1, coll_name='undefined'):
 		self.logger.info('making %d commands: [update]' % size)
 		queries = self.makeQuery(read, size)
 		updates = self.makeUpdate(write, size)
-		return [self.getUpdateTemplate(queries[i], updates[i], coll_name) for i in xrange(size)]
+		return [self.getUpdateTemplate(q, u, coll_name) for q, u in izip(queries, updates)]
 	def makeInsertCmds(self, write, size=1, coll_name='undefined'):
 		self.logger.info('making %d commands: [insert]' % size)
-		documents = self.makeDocuments(write, size)
-		return [self.getInsertTemplate(d, coll_name) for d in documents]
+		return [self.getInsertTemplate(d, coll_name) for d in self.makeDocuments(write, size)]
 	def makeDeleteCmds(self, read, size=1, coll_name='undefined'):
 		self.logger.info('making %d commands: [delete]' % size)
-		queries = self.makeQuery(read, size)
-		return [self.getDeleteTemplate(q, coll_name) for q in queries]
+		return [self.getDeleteTemplate(q, coll_name) for q in self.makeQuery(read, size)]
 
+	def iterFindCmds(self, read, sort, coll_name='undefined'):
+		sort = self.makeSort(sort)
+		for q in self.iterQuery(read):
+			yield self.getFindTemplate(q, sort, coll_name)
+	def iterUpdateCmds(self, read, write, coll_name='undefined'):
+		for q, u in izip(self.iterQuery(read), self.iterUpdate(write)):
+			yield self.getUpdateTemplate(q, u, coll_name)
+	def iterInsertCmds(self, write, coll_name='undefined'):
+		for d in self.iterDocuments(write):
+			yield self.getInsertTemplate(d, coll_name)
+	def iterDeleteCmds(self, read, coll_name='undefined'):
+		for q in self.iterQuery(read):
+			yield self.getDeleteTemplate(q, coll_name)
+
+	# all values of a session are drawn at once by makeBatch(size)
 	def makeQuery(self, read, size=1):
-		if read[0] == 'ALL': return [SON()]*size
+		if read[0] == 'ALL':
+			return [SON() for _ in xrange(size)]
+		return self.queryTemplate(read).makeBatch(size)
+	def makeUpdate(self, write, size=1):
+		return self.updateTemplate(write).makeBatch(size)
+	def makeDocuments(self,write, size=1):
+		return self.documentTemplate(write).makeBatch(size)
+
+	def iterQuery(self, read):
+		if read[0] == 'ALL':
+			while True: yield SON()
+		for q in self.queryTemplate(read).iterMake():
+			yield q
+	def iterUpdate(self, write):
+		return self.updateTemplate(write).iterMake()
+	def iterDocuments(self, write):
+		return self.documentTemplate(write).iterMake()
+
+	def queryTemplate(self, read):
 		read_unpacked = unpack(read)
 		read_SON = makeSON(read_unpacked)
-		return [mapping(read_SON, self.query_dict) for _ in xrange(size)]
-	def makeUpdate(self, write, size=1):
+		return Template(read_SON, self.query_dict)
+	def updateTemplate(self, write):
 		write_unpacked = unpack(write)
 		write_SON = makeSON(write_unpacked)
-		return [mapping(write_SON, self.update_dict) for _ in xrange(size)]
-	def makeDocuments(self,write, size=1):
+		return Template(write_SON, self.update_dict)
+	def documentTemplate(self, write):
 		# NO unpack!!
 		write_SON = makeSON(write)
-		return [mapping(write_SON, self.document_dict) for _ in xrange(size)]
+		return Template(write_SON, self.document_dict)
 	def makeSort(self, sort):
 		if sort == [] or sort[0] == 'NULL': return None
 		else: return SON([ (lst[0], self.sort_dict[lst[1]]) for lst in sort ])
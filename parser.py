@@ -16,9 +16,14 @@
 #    along with Nowog.  If not, see <http://www.gnu.org/licenses/>
 
 from pyparsing import *
+import hashlib
 import json
+import os
+import re
 import argparse
 
+import distribution as dist
+
 LSQUARE, RSQUARE, SEMI, COLON, ASSIGN, COMMA, DOT = map(Suppress, '[];:=,.')
 LBRACE, RBRACE, LBRACK, RBRACK, MINUS = map(Suppress, '{}()-')
 
@@ -29,26 +34,24 @@ minute = Word(nums)('minute')
 session_ID = Word(alphas, alphanums+'_')
 
 distribution = (CaselessLiteral('uniform') | CaselessLiteral('normal') | CaselessLiteral('exponential')
-				| CaselessLiteral('linear') | CaselessLiteral('polynomial'))
+				| CaselessLiteral('linear') | CaselessLiteral('polynomial') | CaselessLiteral('poisson')
+				| CaselessLiteral('piecewise') | CaselessLiteral('burst'))
 total 	  = Word(nums)
 arguments = ZeroOrMore(floatNumber + COMMA) + total
-absolute  = distribution + LBRACK + Group(arguments)('arguments') + RBRACK
-
-arr_read_type 	 = Keyword('Bool') | Keyword('Num') | Keyword('Text') | Keyword('range_op')
-arr_write_type 	 = Keyword('Bool') | Keyword('Num') | Keyword('Text')
-array_read = Keyword('arr_read_op') + Optional(DOT + arr_read_type)
-array_write = (Keyword('arr_add_op') | Keyword('arr_remove_op') | Keyword('Array')) + DOT + arr_write_type
+rate_point = Group(floatNumber + COLON + floatNumber)
+rate_profile = CaselessLiteral('rate') + LBRACK + Group(delimitedList(rate_point) | floatNumber)('arguments') + RBRACK
+absolute  = rate_profile | (distribution + LBRACK + Group(arguments)('arguments') + RBRACK)
 
-num_match 	 = Keyword('num_match')
-geo_op 		 = Keyword('geo_op')
-range_op 	 = Keyword('range_op')
-number_read  = num_match | geo_op | range_op
-number_write = num_match
+# all terminal values of read and write phrases, matched by one Regex instead of trying
+# each Keyword. A value with a type (e.g. arr_read_op.Bool) is split into two tokens.
+def keywords(*alternatives):
+	pattern = r'(%s)(?![%s])' % ('|'.join(alternatives), re.escape(Keyword.DEFAULT_KEYWORD_CHARS))
+	return Regex(pattern).setParseAction(lambda t: t[0].split('.'))
 
-
-text_read  = Keyword('text_read')
-text_write = Keyword('text_write')
-bool_op = ( Keyword('True') | Keyword('False') )
+read_value  = keywords('True', 'False', 'text_read', 'num_match', 'geo_op', 'range_op',
+						r'arr_read_op(\.(Bool|Num|Text|range_op))?')
+write_value = keywords('True', 'False', 'text_write', 'num_match',
+						r'(arr_add_op|arr_remove_op|Array)\.(Bool|Num|Text)')
 
 document_read  = Forward()
 document_write = Forward()
@@ -60,8 +63,8 @@ write_phrase = Forward()
 document_read  << OneOrMore(Group(read_phrase))
 document_write << OneOrMore(Group(write_phrase))
 
-read_type  << (bool_op | text_read  | number_read  | array_read  | Group(document_read) )
-write_type << (bool_op | text_write | number_write | array_write | Group(document_write))
+read_type  << (read_value  | Group(document_read) )
+write_type << (write_value | Group(document_write))
 
 read_phrase  << ( LBRACK + attribute + COLON + (read_type )('read_type') + RBRACK )
 write_phrase << ( LBRACK + attribute + COLON + (write_type)('write_type')+ RBRACK )
@@ -73,32 +76,138 @@ time_period = minute + MINUS + minute
 
 quadruple = ( Group(read)('read') + COMMA + Group( write )('write') + COMMA + Group(sort)('sort') + COMMA + Group(time_period)('time_period') )
 rule 	  = session_ID + COLON + LBRACE + quadruple('quadruple') + ASSIGN + Group(absolute)('absolute') + RBRACE + SEMI
-ruleset   = (LBRACE + OneOrMore(Group(rule)) + RBRACE).ignore('#' + restOfLine)
-
-def parse_rulesetStr(rulesetStr):
-	ruleList = ruleset.parseString(rulesetStr).asList()
-	ruleset_dict = {}
-	for rule in ruleList:
-		[ID, read, write, sort, time_interval, absolute] = rule
-		time_interval = sorted([int(i) for i in time_interval])
-		disType = absolute[0].lower()
+# comments are removed by split_rules() before parsing, instead of .ignore('#' + restOfLine),
+# which is checked before every element of the grammar
+ruleset   = (LBRACE + OneOrMore(Group(rule)) + RBRACE)
+
+def split_rules(lines):
+	"""Iterate over (line number, text) of each rule of a ruleset, without comments.
+
+	Rules are split at ";" outside of their braces, so each of them can be parsed
+	on its own. Anything after the closing brace of the ruleset is ignored.
+
+	Args:
+		lines: iterable of str, e.g. a file opened for reading
+
+	Raises:
+		ParseException: if there is no ruleset, no rule in it, or it is not closed
+	"""
+	depth = 0
+	closed = False
+	count = 0
+	text = []
+	start = None
+	for line_no, line in enumerate(lines, 1):
+		if '#' in line:
+			line = line.split('#', 1)[0] + '\n'
+		for col, char in enumerate(line, 1):
+			if depth == 0:
+				if char == '{':
+					depth = 1
+				elif not char.isspace():
+					raise ParseException(line, col-1, 'Expected "{" of ruleset in line %d' % line_no)
+				continue
+			if char == '}' and depth == 1:
+				closed = True
+				break
+			if start is None:
+				if char.isspace():
+					continue
+				start = line_no
+			if char == '{':
+				depth += 1
+			elif char == '}':
+				depth -= 1
+			text.append(char)
+			if char == ';' and depth == 1:
+				count += 1
+				yield start, ''.join(text)
+				text = []
+				start = None
+		if closed:
+			break
+	if start is not None:
+		# incomplete rule, parse it for the error message
+		yield start, ''.join(text)
+	elif count == 0:
+		raise ParseException('', 0, 'Expected a ruleset with at least one rule')
+	elif not closed:
+		raise ParseException('', 0, 'Expected "}" at the end of ruleset')
+
+def parse_rule(ruleStr):
+	"""Parse the text of one rule: (ID, {'distribution': ..., 'parser_result': ...})"""
+	[ID, read, write, sort, time_interval, absolute] = rule.parseString(ruleStr, parseAll=True).asList()
+	time_interval = sorted([int(i) for i in time_interval])
+	disType = absolute[0].lower()
+	if disType == 'rate':
+		# rate(ops/sec) or rate(time: ops/sec, ...), total is derived from the rate profile
+		paras = [float(i) for point in absolute[1] for i in (point if isinstance(point, list) else [point])]
+		total = dist.rateTotal(time_interval[0], time_interval[1], *paras)
+	else:
 		paras = [float(i) for i in absolute[1][:-1]]
 		total = int(absolute[1][-1])
-		ruleset_dict.update({
-			ID: {
-				'distribution': {
-					'type': disType,
-					'time_period': time_interval,
-					'total': total,
-					'parameters': paras,
-				},
-				'parser_result':{
-					'read' : read,
-					'write': write,
-					'sort' : sort,
-				}
-			}
-		})
+	return ID, {
+		'distribution': {
+			'type': disType,
+			'time_period': time_interval,
+			'total': total,
+			'parameters': paras,
+		},
+		'parser_result':{
+			'read' : read,
+			'write': write,
+			'sort' : sort,
+		}
+	}
+
+def iter_ruleset(lines):
+	"""Parse a ruleset rule by rule: iterator of (ID, rule) in the order of the ruleset, see parse_rule()"""
+	for line_no, ruleStr in split_rules(lines):
+		try:
+			yield parse_rule(ruleStr)
+		except ParseException, e:
+			raise ParseException(e.pstr, e.loc, '%s, in the rule starting at line %d' % (e.msg, line_no))
+
+def parse_rulesetStr(rulesetStr):
+	return dict(iter_ruleset(rulesetStr.splitlines(True)))
+
+def grammar_hash():
+	"""Hash of the source of the parser and of distribution (rate totals), part of the key of parse_file()"""
+	h = hashlib.sha256()
+	for module in (__file__, dist.__file__):
+		with open(os.path.splitext(module)[0] + '.py', 'rb') as f:
+			h.update(f.read())
+	return h.hexdigest()
+
+def parse_file(file_name, cache_path=''):
+	"""Parse a ruleset file, rule by rule without reading the whole file at once.
+
+	If cache_path is given, the result is saved in cache_path as JSON, named by the
+	hash of the file and of the parser. A file which has been parsed before is loaded
+	from the cache instead. Strings loaded from the cache are unicode.
+
+	Returns:
+		{ID: rule}, see parse_rule()
+	"""
+	if cache_path == '':
+		with open(file_name, 'r') as f:
+			return dict(iter_ruleset(f))
+	h = hashlib.sha256(grammar_hash())
+	with open(file_name, 'rb') as f:
+		for block in iter(lambda: f.read(1 << 20), ''):
+			h.update(block)
+	cache_file = os.path.join(cache_path, h.hexdigest() + '.json')
+	if os.path.exists(cache_file):
+		with open(cache_file, 'r') as f:
+			return json.load(f)
+	with open(file_name, 'r') as f:
+		ruleset_dict = dict(iter_ruleset(f))
+	if not os.path.isdir(cache_path):
+		os.makedirs(cache_path)
+	temp_name = '%s.%d.tmp' % (cache_file, os.getpid())
+	with open(temp_name, 'w') as f:
+		json.dump(ruleset_dict, f)
+	os.rename(temp_name, cache_file)
 	return ruleset_dict
 
 
@@ -110,9 +219,7 @@ if __name__ == '__main__':
 	args = parser.parse_args()
 	all_ruleset_dict = {}
 	for files in args.infiles:
-		with open(files, 'r') as f:
-			rulesetStr = f.read()
-		new_ruleset = parse_rulesetStr(rulesetStr)
+		new_ruleset = parse_file(files)
 		override = filter(lambda x: x in all_ruleset_dict.keys(), new_ruleset.keys())
 		if override != []:
 			raise Exception('ID collision error: %r in [%s]' % (override, files))
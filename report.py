@@ -0,0 +1,201 @@
+#    Copyright 2016 Parinz Ameri, Haipeng Guan
+#
+#    This file is part of Nowog.
+#
+#    Nowog is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Nowog is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Nowog.  If not, see <http://www.gnu.org/licenses/>
+
+"""Report of workload schedule and execution
+
+Operations are counted in time bins of fixed width, so a report only keeps one
+number per bin for each series, no matter how many operations are counted.
+Each series (a session or an operation type) has a planned time line (scheduled
+operations) and, after execution, an actual time line (sent operations).
+
+A report is either displayed in a window by matplotlib.pyplot, or saved without
+any interactive backend as image (png, svg) and time series (csv, json) files:
+
+	<path>/<name>.png   planned (dashed) and actual (histogram) of each series
+	<path>/<name>.csv   time,<label> planned,<label> actual,...
+	<path>/<name>.json  {"title", "bin", "time": [...], "series": {label: {"planned", "actual"}},
+	                     "markers": [{"time", "label"}]}
+
+Markers (e.g. the end of warm-up) are drawn as vertical lines at their time.
+
+Example:
+	>>> r = Report('Workload schedule', 1.0)
+	>>> r.add('FIND', planned=binCounts(delays, 1.0))
+	>>> r.save('outputs/report', 'schedule', ['png', 'csv'])
+
+"""
+
+import csv
+import json
+import os
+from collections import OrderedDict
+import numpy as np
+
+FORMATS = ['png', 'svg', 'csv', 'json']
+
+def binCounts(times, bin_width, block=1 << 20):
+	"""[int]: amount of times (sec, not negative) in each bin of bin_width
+
+	times can be a memory mapped array, it is counted block by block.
+	"""
+	counts = np.zeros(0, dtype=np.int64)
+	for begin in xrange(0, len(times), block):
+		chunk = np.bincount((np.asarray(times[begin : begin + block]) / bin_width).astype(np.int64))
+		if len(chunk) > len(counts):
+			chunk[:len(counts)] += counts
+			counts = chunk
+		else:
+			counts[:len(chunk)] += chunk
+	return counts.tolist()
+
+def counterToList(counter):
+	"""[int]: values of a Counter {bin: count} as a list from bin 0 to the last bin"""
+	return [counter[i] for i in xrange(max(counter.keys() + [-1]) + 1)]
+
+def sumLines(lines):
+	"""[int]: sum of time lines of different lengths"""
+	total = np.zeros(max(len(line) for line in lines), dtype=np.int64)
+	for line in lines:
+		total[:len(line)] += np.asarray(line, dtype=np.int64)
+	return total.tolist()
+
+def parseFormats(formats):
+	"""[str]: formats from a comma separated str, e.g. 'png, csv'"""
+	res = filter(None, [x.strip().lower() for x in formats.split(',')])
+	for fmt in res:
+		if fmt not in FORMATS:
+			raise ValueError('Unknown report format: [%s]. Available formats include: {%s}' % (fmt, ', '.join(FORMATS)))
+	return res
+
+class Report(object):
+	"""Planned and actual amount of operations in each time bin of several series
+
+	Attributes:
+		title (str): title of the report
+		bin_width (float): width (sec) of each bin
+		histtype (str): histogram type of actual time lines: {'bar', 'barstacked', 'step', 'stepfilled'}
+		series {str: {'planned': [int], 'actual': [int]}}: time lines of each label in the order of add().
+			Missing time lines are None.
+		markers [(float, str)]: time (sec) and label of each marker
+	"""
+	def __init__(self, title, bin_width, histtype='step'):
+		self.title = title
+		self.bin_width = bin_width
+		self.histtype = histtype
+		self.series = OrderedDict()
+		self.markers = []
+
+	def addMarker(self, t, label):
+		self.markers.append((t, label))
+
+	def add(self, label, planned=None, actual=None):
+		self.series[label] = {'planned': planned, 'actual': actual}
+
+	def addSum(self, label, series):
+		"""Add the sum of several series ({'planned', 'actual'}), e.g. of all sessions of one operation type"""
+		res = {}
+		for key in ('planned', 'actual'):
+			lines = [x[key] for x in series if x[key] is not None]
+			res[key] = sumLines(lines) if lines else None
+		self.add(label, **res)
+
+	def bins(self):
+		"""Amount of bins of the longest time line"""
+		return max([len(line) for s in self.series.values() for line in s.values() if line is not None] + [0])
+
+	def padded(self, line):
+		return None if line is None else list(line) + [0] * (self.bins() - len(line))
+
+	def toDict(self):
+		n = self.bins()
+		return {
+			'title': self.title,
+			'bin': self.bin_width,
+			'time': [i * self.bin_width for i in xrange(n)],
+			'series': OrderedDict((label, {k: self.padded(line) for k, line in s.items()})
+									for label, s in self.series.items()),
+			'markers': [{'time': t, 'label': label} for t, label in self.markers],
+		}
+
+	def plot(self, fig):
+		"""Draw the report on a matplotlib Figure"""
+		ax = fig.add_subplot(111)
+		edges = np.arange(self.bins() + 1) * self.bin_width
+		centers = edges[:-1] + self.bin_width / 2.0
+		for i, (label, s) in enumerate(self.series.items()):
+			color = 'C%d' % (i % 10)
+			if s['actual'] is not None:
+				ax.hist(centers, edges, weights=self.padded(s['actual']), histtype=self.histtype, color=color, label=label)
+			if s['planned'] is not None:
+				planned = self.padded(s['planned'])
+				ax.step(edges, planned + planned[-1:], where='post', linestyle='--', color=color,
+						label=label + ' planned' if s['actual'] is not None else label)
+		labels = OrderedDict()
+		for t, label in self.markers:
+			labels.setdefault(t, []).append(label)
+		for t, label in labels.items():
+			ax.axvline(t, linestyle=':', color='gray')
+			ax.annotate(', '.join(label), (t, 1), xycoords=('data', 'axes fraction'), rotation=90,
+						va='top', ha='right', color='gray', fontsize='small')
+		ax.set_xlabel('time (sec)')
+		ax.set_ylabel('number of operations per %g sec' % self.bin_width)
+		ax.set_title(self.title)
+		if self.series:
+			ax.legend()
+
+	def show(self):
+		"""Display the report in a window"""
+		import matplotlib.pyplot as plt
+		self.plot(plt.figure())
+		plt.show()
+
+	def save(self, path, name, formats=FORMATS):
+		"""Save the report as path/name.<format> for each format, without interactive backend
+
+		Returns:
+			[str]: names of the saved files
+		"""
+		if not os.path.isdir(path):
+			os.makedirs(path)
+		files = []
+		for fmt in formats:
+			file_name = os.path.join(path, '%s.%s' % (name, fmt))
+			if fmt in ('png', 'svg'):
+				from matplotlib.figure import Figure
+				from matplotlib.backends.backend_agg import FigureCanvasAgg
+				fig = Figure(figsize=(12, 6))
+				FigureCanvasAgg(fig)
+				self.plot(fig)
+				fig.savefig(file_name, format=fmt)
+			elif fmt == 'csv':
+				self.saveCSV(file_name)
+			elif fmt == 'json':
+				with open(file_name, 'w') as f:
+					json.dump(self.toDict(), f, indent=4)
+			else:
+				raise ValueError('Unknown report format: [%s]' % fmt)
+			files.append(file_name)
+		return files
+
+	def saveCSV(self, file_name):
+		data = self.toDict()
+		columns = [(label, key) for label, s in data['series'].items() for key in ('planned', 'actual') if s[key] is not None]
+		with open(file_name, 'wb') as f:
+			writer = csv.writer(f)
+			writer.writerow(['time'] + ['%s %s' % column for column in columns])
+			for i, t in enumerate(data['time']):
+				writer.writerow([t] + [data['series'][label][key][i] for label, key in columns])
@@ -0,0 +1,157 @@
+#    Copyright 2016 Parinz Ameri, Haipeng Guan
+#
+#    This file is part of Nowog.
+#
+#    Nowog is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Nowog is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Nowog.  If not, see <http://www.gnu.org/licenses/>
+
+"""Error classification and retries
+
+Errors of commands are grouped into a few classes, e.g. duplicate_key, timeout,
+not_master or connection, by the server error code or the class of the raised
+exception. Exceptions are matched by class name, so pymongo is not imported.
+Transient errors (timeout, not_master, connection) can succeed when the command
+is sent again.
+
+A Retrier executes failed commands again after a backoff delay in its own
+threads, so neither waiting for nor executing a retry delays the schedule.
+
+Example:
+	>>> classify(pymongo.errors.AutoReconnect('primary stepped down'))
+	('connection', True)
+	>>> retrier = Retrier(run, threads=2)
+	>>> retrier.start()
+	>>> retrier.add(time.time() + backoff(0.1, 10, 0), ('FIND', cmd))
+	>>> retrier.stop() # after all retries, including retries of retries
+"""
+
+import heapq
+import threading
+import time
+from itertools import count
+
+# {server error code: (error class, transient)}
+ERROR_CODES = {
+	11000: ('duplicate_key', False),
+	11001: ('duplicate_key', False),
+	50: ('timeout', True), # MaxTimeMSExpired
+	64: ('timeout', True), # WriteConcernFailed, e.g. wtimeout
+	91: ('not_master', True), # ShutdownInProgress
+	189: ('not_master', True), # PrimarySteppedDown
+	10107: ('not_master', True), # NotMaster
+	11600: ('not_master', True), # InterruptedAtShutdown
+	11602: ('not_master', True), # InterruptedDueToReplStateChange
+	13435: ('not_master', True), # NotMasterNoSlaveOk
+	13436: ('not_master', True), # NotMasterOrSecondary
+}
+
+# {exception class name: (error class, transient)}, matched from the most specific class
+ERROR_CLASSES = {
+	'DuplicateKeyError': ('duplicate_key', False),
+	'ExecutionTimeout': ('timeout', True),
+	'WTimeoutError': ('timeout', True),
+	'NetworkTimeout': ('timeout', True),
+	'ServerSelectionTimeoutError': ('timeout', True),
+	'NotMasterError': ('not_master', True),
+	'NotPrimaryError': ('not_master', True),
+	'AutoReconnect': ('connection', True),
+	'ConnectionFailure': ('connection', True),
+	'WriteError': ('write_error', False),
+	'WriteConcernError': ('write_concern', False),
+	'OperationFailure': ('operation_failure', False),
+	'PyMongoError': ('driver_error', False),
+}
+
+def classify(exc):
+	"""(error class(str), transient(bool)) of an exception raised by a command.
+	Unknown exceptions are classified by their class name and are not transient."""
+	code = getattr(exc, 'code', None)
+	if code in ERROR_CODES:
+		return ERROR_CODES[code]
+	for cls in type(exc).__mro__:
+		if cls.__name__ in ERROR_CLASSES:
+			return ERROR_CLASSES[cls.__name__]
+	return type(exc).__name__, False
+
+def classifyWriteError(error, default='write_error'):
+	"""(error class, transient) of an item of writeErrors (or writeConcernError) in the result of
+	a write command. Unknown codes are classified as default"""
+	return ERROR_CODES.get(error.get('code'), (default, False))
+
+def backoff(base, limit, attempt):
+	"""Delay (sec) before retry attempt+1: base doubled for each previous attempt, at most limit"""
+	return min(base * (1 << attempt), limit)
+
+class Retrier(object):
+	"""Execute tasks again at a later time, in its own threads
+
+	Attributes:
+		run (callable): run(*task) executes a task, it may add() the task again.
+		threads (int): amount of threads executing tasks.
+		heap [(float, int, tuple)]: (due time (time.time()), sequence, task) of waiting tasks.
+		running (int): amount of tasks being executed.
+	"""
+	def __init__(self, run, threads=1):
+		self.run = run
+		self.threads = max(int(threads), 1)
+		self.heap = []
+		self.sequence = count()
+		self.cond = threading.Condition()
+		self.running = 0
+		self.closing = False
+		self.pool = []
+
+	def start(self):
+		self.closing = False
+		self.pool = [threading.Thread(target=self.loop, name='executor-retry-%d' % i) for i in xrange(self.threads)]
+		for th in self.pool:
+			th.daemon = True
+			th.start()
+
+	def add(self, due, task):
+		"""Execute task at due (time.time())"""
+		with self.cond:
+			heapq.heappush(self.heap, (due, next(self.sequence), task))
+			self.cond.notify()
+
+	def loop(self):
+		while True:
+			with self.cond:
+				while True:
+					if self.heap:
+						delay = self.heap[0][0] - time.time()
+						if delay <= 0:
+							break
+						self.cond.wait(delay)
+					elif self.closing and self.running == 0:
+						self.cond.notify_all()
+						return
+					else:
+						self.cond.wait()
+				_, _, task = heapq.heappop(self.heap)
+				self.running += 1
+			try:
+				self.run(*task)
+			finally:
+				with self.cond:
+					self.running -= 1
+					self.cond.notify_all()
+
+	def stop(self):
+		"""Wait until all tasks, including tasks added while waiting, are executed"""
+		with self.cond:
+			self.closing = True
+			self.cond.notify_all()
+		for th in self.pool:
+			th.join()
+		self.pool = []
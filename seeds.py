@@ -0,0 +1,85 @@
+#    Copyright 2016 Parinz Ameri, Haipeng Guan
+#
+#    This file is part of Nowog.
+#
+#    Nowog is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Nowog is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Nowog.  If not, see <http://www.gnu.org/licenses/>
+
+"""Seed sequences
+
+Independent random streams derived from one seed, in the style of
+numpy.random.SeedSequence (not available in numpy < 1.17). A SeedSequence is
+the root seed (entropy) and a key, i.e. its path from the root. spawn() adds
+keys to the path, and the seed of every path is a SHA-256 hash of entropy and
+path, so the streams of different paths are independent, and the seed of a path
+does not depend on which other paths are used or in which order.
+
+NoWog derives one stream per session, keyed by session ID, and in each session
+one stream for time stamps and one stream for values of each chunk of commands:
+
+	root = SeedSequence(777)
+	root.spawn('FIND', 'times')        # time stamps of session FIND
+	root.spawn('FIND', 'values', 0)    # values of the first chunk of FIND
+
+Example:
+	>>> times = SeedSequence(777).spawn('FIND', 'times')
+	>>> np.random.RandomState(stateWords(times.getSeed()))
+
+"""
+
+import hashlib
+import json
+import os
+
+# amount of 32 bit words of a derived seed
+SEED_WORDS = 4
+
+class SeedSequence(object):
+	"""Root seed and key of an independent random stream
+
+	Attributes:
+		entropy (int): the root seed. If None is given, 128 bits are drawn from os.urandom,
+			which can be logged to reproduce the result.
+		key (tuple): keys (str or int) of all spawn() from the root.
+	"""
+	def __init__(self, entropy=None, key=()):
+		if entropy is None:
+			entropy = int(os.urandom(16).encode('hex'), 16)
+		self.entropy = int(entropy)
+		self.key = tuple(key)
+
+	def spawn(self, *keys):
+		"""Child sequence of keys, e.g. spawn(ID) or spawn(ID, 'values', 0)"""
+		return SeedSequence(self.entropy, self.key + keys)
+
+	def generateState(self, n_words=SEED_WORDS):
+		"""[int]: n_words (at most 8) 32 bit words derived from entropy and key"""
+		digest = hashlib.sha256(json.dumps([self.entropy, list(self.key)])).hexdigest()
+		return [int(digest[i*8 : i*8+8], 16) for i in xrange(n_words)]
+
+	def getSeed(self):
+		"""Seed (int of 32*SEED_WORDS bits) of this stream, for random.seed() and stateWords()"""
+		res = 0
+		for word in reversed(self.generateState()):
+			res = (res << 32) | word
+		return res
+
+def stateWords(seed):
+	"""Split an int seed into 32 bit words, the seed of numpy.random.RandomState. The sign is ignored"""
+	seed = abs(int(seed))
+	words = [seed & 0xffffffff]
+	seed >>= 32
+	while seed:
+		words.append(seed & 0xffffffff)
+		seed >>= 32
+	return words
@@ -0,0 +1,291 @@
+#    Copyright 2016 Parinz Ameri, Haipeng Guan
+#
+#    This file is part of Nowog.
+#
+#    Nowog is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Nowog is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Nowog.  If not, see <http://www.gnu.org/licenses/>
+
+"""Binary session file
+
+Sessions (mapping result) are saved between the mapping and the execution stage
+in a compact binary file instead of JSON, which is read through mmap, so the
+size of sessions does not limit memory usage and commands are never parsed
+from text again.
+
+File layout (all integers and floats are little endian)::
+
+	MAGIC                                   8 bytes
+	for each session:
+		commands  BSON documents, one after another, padded to 8 bytes.
+		          Each BSON document starts with its own length (int32).
+		times     float64 * size, delay of each command in ascending order
+		offsets   int64 * (size+1), offset of each command from the first one.
+		          The last offset is the end of the last command.
+	index       JSON: {ID: {type, size, commands, times, offsets}}, values are
+	            the amount of commands and the file offset of each part
+	footer      uint64, file offset of index
+
+Commands are loaded by loadCommand(): only the top level document is decoded,
+all nested documents and arrays (query, update, documents) stay as raw BSON
+(RawBSONDocument) and are sent to MongoDB without being decoded and encoded
+again.
+
+Example:
+	>>> with open('temp.dat', 'wb') as f:
+	...     writer = SessionWriter(f)
+	...     writer.addSession('FIND', [0.0, 1.0], [cmd1, cmd2])
+	...     writer.close()
+	>>> session_file = SessionFile(open('temp.dat', 'rb'))
+	>>> list(session_file.iterSession('FIND'))
+	[(0.0, cmd1), (1.0, cmd2)]
+
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+from itertools import islice, izip
+import numpy as np
+from bson import BSON
+from bson.son import SON
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+
+MAGIC = 'NOWOGSF1'
+
+# amount of time stamps converted into python floats at once by iterSession(),
+# and amount of commands encoded at once by SessionWriter.addSession()
+CHUNK_SIZE = 65536
+
+FULL_DECODE = CodecOptions(document_class=SON)
+
+def loadCommand(raw):
+	"""Convert a BSON command into SON whose values are still raw BSON.
+
+	pymongo adds fields (e.g. $db) into the command when sending it, which is not
+	possible with a RawBSONDocument, so only the top level is decoded.
+	"""
+	return SON(RawBSONDocument(raw).items())
+
+def encodeCommand(cmd):
+	"""Encode all values of a command (SON) into raw BSON in advance, see loadCommand()"""
+	return loadCommand(BSON.encode(cmd))
+
+def encodeCommands(cmds):
+	"""Encode commands (SON) into BSON: (concatenated BSON, [length of each command])"""
+	blobs = [BSON.encode(cmd) for cmd in cmds]
+	return ''.join(blobs), [len(blob) for blob in blobs]
+
+def encodeChunks(cmds, size=CHUNK_SIZE):
+	"""Iterate over encodeCommands() of every size commands of iterable cmds"""
+	cmds = iter(cmds)
+	while True:
+		data, lengths = encodeCommands(islice(cmds, size))
+		if not lengths:
+			return
+		yield data, lengths
+
+def decodeCommand(cmd):
+	"""Fully decode a command which may contain raw BSON, e.g. for saving it as JSON"""
+	return BSON(BSON.encode(cmd)).decode(FULL_DECODE)
+
+class SessionWriter(object):
+	"""Write sessions into a binary session file
+
+	Attributes:
+		file (file): the file opened in binary write mode
+		index {str: dict}: the index of all written sessions
+	"""
+	def __init__(self, f):
+		self.file = f
+		self.index = {}
+		self.file.write(MAGIC)
+
+	def addSession(self, ID, times, cmds):
+		"""Write one session.
+
+		Args:
+			ID (str): session ID
+			times [float]: delay of each command in ascending order
+			cmds: iterable of SON, command of each time
+		"""
+		self.addEncodedSession(ID, times, encodeChunks(cmds))
+
+	def addEncodedSession(self, ID, times, chunks):
+		"""Write one session whose commands are already encoded into BSON.
+
+		Args:
+			ID (str): session ID
+			times [float]: delay of each command in ascending order
+			chunks: iterable of (concatenated BSON, [length of each command]) in the order
+					of times, see encodeCommands()
+		"""
+		commands_at = self.file.tell()
+		offsets = [0]
+		cmd_type = None
+		for data, lengths in chunks:
+			if cmd_type is None and lengths:
+				cmd_type = RawBSONDocument(data[:lengths[0]]).keys()[0]
+			self.file.write(data)
+			offsets.extend((np.cumsum(lengths) + offsets[-1]).tolist())
+		self.pad()
+		if len(offsets) != len(times) + 1:
+			raise ValueError('Session [%s] has %d times but %d commands' % (ID, len(times), len(offsets)-1))
+		times_at = self.file.tell()
+		self.file.write(np.asarray(times, dtype='<f8').tostring())
+		offsets_at = self.file.tell()
+		self.file.write(np.asarray(offsets, dtype='<i8').tostring())
+		self.index[ID] = {
+			'type': cmd_type,
+			'size': len(times),
+			'commands': commands_at,
+			'times': times_at,
+			'offsets': offsets_at,
+		}
+
+	def pad(self):
+		"""Align the next write to 8 bytes, so arrays can be mapped by numpy"""
+		self.file.write('\0' * (-self.file.tell() % 8))
+
+	def close(self):
+		"""Write index and footer, and close the file"""
+		index_at = self.file.tell()
+		self.file.write(json.dumps(self.index))
+		self.file.write(struct.pack('<Q', index_at))
+		self.file.close()
+
+class SessionFile(object):
+	"""Read sessions from a binary session file through mmap
+
+	Attributes:
+		file (file): the file opened in binary read mode
+		mm (mmap): read only memory map of the whole file
+		index {str: dict}: the index of all sessions, see SessionWriter
+	"""
+	def __init__(self, f):
+		self.file = f
+		self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		if self.mm[:len(MAGIC)] != MAGIC:
+			raise ValueError('[%s] is not a session file' % f.name)
+		index_at = struct.unpack('<Q', self.mm[-8:])[0]
+		self.index = json.loads(self.mm[index_at:-8])
+
+	def getSessionIDs(self):
+		return self.index.keys()
+
+	def getSize(self, ID):
+		return self.index[ID]['size']
+
+	def getType(self, ID):
+		return self.index[ID]['type']
+
+	def getTimes(self, ID):
+		"""numpy array of delays of session ID, mapped from file without copying"""
+		info = self.index[ID]
+		return np.frombuffer(self.mm, '<f8', info['size'], info['times'])
+
+	def getOffsets(self, ID):
+		info = self.index[ID]
+		return np.frombuffer(self.mm, '<i8', info['size'] + 1, info['offsets'])
+
+	def getRaw(self, ID, i):
+		"""BSON bytes of the i-th command of session ID"""
+		base = self.index[ID]['commands']
+		offsets = self.getOffsets(ID)
+		return self.mm[base + int(offsets[i]) : base + int(offsets[i+1])]
+
+	def getCommand(self, ID, i):
+		"""The i-th command of session ID, see loadCommand()"""
+		return loadCommand(self.getRaw(ID, i))
+
+	def iterSession(self, ID):
+		"""Iterate over (delay, cmd) of session ID in ascending order of delay, see loadCommand()"""
+		base = self.index[ID]['commands']
+		times = self.getTimes(ID)
+		offsets = self.getOffsets(ID)
+		mm = self.mm
+		for begin in xrange(0, len(times), CHUNK_SIZE):
+			chunk_times = times[begin : begin + CHUNK_SIZE].tolist()
+			chunk_offsets = (offsets[begin : begin + CHUNK_SIZE + 1] + base).tolist()
+			for i, t in enumerate(chunk_times):
+				yield t, loadCommand(mm[chunk_offsets[i] : chunk_offsets[i+1]])
+
+	def iterChunks(self, ID):
+		"""Iterate over the raw commands of session ID in chunks of (concatenated BSON,
+		[length of each command]), e.g. for SessionWriter.addEncodedSession()"""
+		base = self.index[ID]['commands']
+		offsets = self.getOffsets(ID)
+		for begin in xrange(0, self.getSize(ID), CHUNK_SIZE):
+			chunk_offsets = offsets[begin : begin + CHUNK_SIZE + 1]
+			yield self.mm[base + int(chunk_offsets[0]) : base + int(chunk_offsets[-1])], np.diff(chunk_offsets).tolist()
+
+	def getSession(self, ID):
+		"""Fully decoded session ID: ([delay], [cmd(SON)])"""
+		base = self.index[ID]['commands']
+		offsets = (self.getOffsets(ID) + base).tolist()
+		cmds = [BSON(self.mm[begin:end]).decode(FULL_DECODE) for begin, end in izip(offsets, offsets[1:])]
+		return self.getTimes(ID).tolist(), cmds
+
+	def close(self):
+		self.mm.close()
+		self.file.close()
+
+class SessionCache(object):
+	"""Content addressed cache of sessions (mapping result)
+
+	Each session is saved in its own session file in a directory, named by a hash
+	(key) of everything its mapping depends on, e.g. rule, value settings, seed and
+	the source of the generating modules.
+	A session whose key exists in the cache does not need to be mapped again.
+
+	Attributes:
+		path (str): directory of the cached session files
+	"""
+	def __init__(self, path):
+		self.path = path
+		if not os.path.isdir(path):
+			os.makedirs(path)
+
+	def key(self, *parts):
+		"""Key (hex str) of parts, which must be serializable as JSON"""
+		return hashlib.sha256(json.dumps([MAGIC] + list(parts), sort_keys=True)).hexdigest()
+
+	def fileName(self, key):
+		return os.path.join(self.path, key + '.dat')
+
+	def has(self, key):
+		return os.path.exists(self.fileName(key))
+
+	def load(self, key):
+		"""SessionFile of key"""
+		return SessionFile(open(self.fileName(key), 'rb'))
+
+	def save(self, key, ID, times, chunks):
+		"""Save session ID as key, see SessionWriter.addEncodedSession(), and return its SessionFile.
+
+		The session file is written under a temporary name and renamed when it is
+		complete, so an interrupted mapping never leaves a broken cache entry.
+		"""
+		temp_name = '%s.%d.tmp' % (self.fileName(key), os.getpid())
+		writer = SessionWriter(open(temp_name, 'wb'))
+		try:
+			writer.addEncodedSession(ID, times, chunks)
+			writer.close()
+		except:
+			writer.file.close()
+			os.remove(temp_name)
+			raise
+		os.rename(temp_name, self.fileName(key))
+		return self.load(key)
@@ -0,0 +1,283 @@
+#    Copyright 2016 Parinz Ameri, Haipeng Guan
+#
+#    This file is part of Nowog.
+#
+#    Nowog is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Nowog is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Nowog.  If not, see <http://www.gnu.org/licenses/>
+
+"""Live telemetry of execution
+
+Completed operations are counted, and their latency recorded in histograms, for
+each session and each operation type during an interval (default one second).
+At the end of every interval a background thread takes a snapshot of the
+interval and
+
+	- logs one compact line, e.g.
+		t=12s 1204 ops/s p50=1.2ms p99=8.1ms max=20.3ms late=0.1ms | find 800 ops/s, insert 404 ops/s | errors timeout 3
+	- appends the snapshot as one JSON line to a file (optional)
+	- serves the snapshot and totals over HTTP (optional, localhost only):
+		/metrics  Prometheus text format
+		/json     the last snapshot as JSON
+
+Recording one operation only adds it to two histograms under a lock, all
+formatting and writing is done by the background thread.
+
+Example:
+	>>> t = Telemetry(interval=1, path='outputs/telemetry.jsonl', port=9100)
+	>>> t.start(time.time())
+	>>> t.record('FIND', 'find', 0.0012, 0.0001)
+	>>> t.stop()
+
+"""
+
+import BaseHTTPServer
+import json
+import logging
+import threading
+import time
+from collections import Counter
+
+from histogram import Histogram
+
+class Telemetry(object):
+	"""Per interval throughput and latency of each session and operation type
+
+	Attributes:
+		interval (float): length (sec) of an interval. Default is 1.
+		path (str): If not empty, append each snapshot as one JSON line to this file. Default is ''.
+		port (int): If not 0, serve /metrics and /json on 127.0.0.1:port during execution. Default is 0.
+		worker (str): label of the process in snapshots and metrics, see setWorker(). Default is None.
+		current {(str, str): [Histogram, float]}: latency histogram and sum of lateness of the current
+												interval of each ('session', ID) and ('type', cmd_type).
+		totals {(str, str): [int, float]}: amount and sum of latency of all operations of each key.
+		errors Counter({str: int}): amount of failed operations of each error class in the current interval.
+		error_totals Counter({(str, str): int}): amount of failed operations of each (ID, error class).
+		last (dict): the last snapshot, see snapshot().
+		phase (callable): phase(t) is the label (str) of the phase of execution at t (sec from start),
+						e.g. 'warm-up', shown in each snapshot. Default is None.
+	"""
+	def __init__(self, interval=1.0, path='', port=0):
+		self.logger = logging.getLogger('executor')
+		self.interval = float(interval)
+		if self.interval <= 0:
+			raise ValueError('[telemetry_interval] must be greater than 0')
+		self.path = path
+		self.port = int(port)
+		self.worker = None
+		self.lock = threading.Lock()
+		self.current = {}
+		self.totals = {}
+		self.errors = Counter()
+		self.error_totals = Counter()
+		self.last = None
+		self.phase = None
+		self.start_time = None
+		self.interval_start = None
+		self.stopped = threading.Event()
+		self.thread = None
+		self.server = None
+		self.file = None
+
+	def setWorker(self, index):
+		"""Label snapshots of process index of several worker processes, and serve on port+index"""
+		self.worker = str(index)
+		if self.port:
+			self.port += index
+
+	def record(self, ID, cmd_type, latency, lateness):
+		"""Record one completed operation of session ID. Thread safe"""
+		with self.lock:
+			for key in (('session', ID), ('type', cmd_type)):
+				stats = self.current.get(key)
+				if stats is None:
+					stats = self.current[key] = [Histogram(), 0.0]
+				stats[0].record(latency)
+				stats[1] += lateness
+
+	def recordError(self, ID, error_class, n=1):
+		"""Record n failed operations of session ID. Thread safe"""
+		with self.lock:
+			self.errors[error_class] += n
+			self.error_totals[(ID, error_class)] += n
+
+	def start(self, start_time):
+		"""Start the background thread (and HTTP server).
+
+		Time is counted from start_time (time.time()), the first interval ends at
+		start_time + interval, so intervals are aligned with time bins of reports.
+		"""
+		self.start_time = start_time
+		self.interval_start = start_time
+		self.stopped.clear()
+		if self.path != '':
+			self.file = open(self.path, 'a')
+		if self.port:
+			self.startServer()
+		self.thread = threading.Thread(target=self.loop, name='executor-telemetry')
+		self.thread.daemon = True
+		self.thread.start()
+
+	def stop(self):
+		"""Stop the background thread and HTTP server, after emitting the last (partial) interval"""
+		self.stopped.set()
+		if self.thread:
+			self.thread.join()
+			self.thread = None
+		self.emit()
+		if self.server:
+			self.server.shutdown()
+			self.server.server_close()
+			self.server = None
+		if self.file:
+			self.file.close()
+			self.file = None
+
+	def loop(self):
+		while not self.stopped.wait(max(self.interval_start + self.interval - time.time(), 0)):
+			self.emit()
+
+	def emit(self):
+		"""Take a snapshot of the current interval, log it, write it and keep it for HTTP"""
+		snap = self.snapshot()
+		if snap['ops'] == 0 and not snap['errors'] and snap['interval'] <= 0:
+			return # stopped before the start
+		self.logger.info(self.line(snap))
+		if self.file:
+			self.file.write(json.dumps(snap, sort_keys=True) + '\n')
+			self.file.flush()
+
+	def snapshot(self):
+		"""Summary of the current interval, which is then reset
+
+		Returns:
+			dict: {time, interval, worker, phase, ops, rate, sessions: {ID: summary}, types: {cmd_type: summary},
+				errors: {error_class: amount}}, phase is the label of the middle of the interval.
+				summary: {count, rate, mean, p50, p90, p99, p99.9, max (latency in sec), lateness (mean sec)}
+		"""
+		now = time.time()
+		with self.lock:
+			current, self.current = self.current, {}
+			errors, self.errors = self.errors, Counter()
+			length = now - self.interval_start
+			self.interval_start = now
+			for key, (hist, _) in current.items():
+				total = self.totals.setdefault(key, [0, 0.0])
+				total[0] += hist.total
+				total[1] += hist.sum / 1000000.0
+		snap = {
+			'time': round(now - self.start_time, 3),
+			'interval': round(length, 3),
+			'worker': self.worker,
+			'phase': self.phase(now - self.start_time - length / 2.0) if self.phase else '',
+			'sessions': {},
+			'types': {},
+			'errors': dict(errors),
+		}
+		for (kind, name), (hist, lateness) in current.items():
+			summary = hist.summary()
+			summary['rate'] = hist.total / length if length > 0 else 0.0
+			summary['lateness'] = lateness / hist.total
+			snap['sessions' if kind == 'session' else 'types'][name] = summary
+		snap['ops'] = sum(s['count'] for s in snap['types'].values())
+		snap['rate'] = snap['ops'] / length if length > 0 else 0.0
+		all_ops = Histogram()
+		for kind, name in current:
+			if kind == 'type':
+				all_ops.merge(current[(kind, name)][0])
+		snap['all'] = all_ops.summary()
+		self.last = snap
+		return snap
+
+	def line(self, snap):
+		"""One compact line of a snapshot"""
+		res = 't=%gs %.0f ops/s' % (round(snap['time']), snap['rate'])
+		if snap['worker'] is not None:
+			res = '[worker %s] %s' % (snap['worker'], res)
+		if snap['phase']:
+			res = '%s [%s]' % (res, snap['phase'])
+		if snap['ops']:
+			s = snap['all']
+			lateness = sum(t['lateness'] * t['count'] for t in snap['types'].values()) / snap['ops']
+			res += ' p50=%.1fms p99=%.1fms max=%.1fms late=%.1fms' % (s['p50']*1000, s['p99']*1000, s['max']*1000, lateness*1000)
+			res += ' | ' + ', '.join('%s %.0f ops/s' % (t, snap['types'][t]['rate']) for t in sorted(snap['types']))
+		if snap['errors']:
+			res += ' | errors ' + ', '.join('%s %d' % (e, snap['errors'][e]) for e in sorted(snap['errors']))
+		return res
+
+	def prometheus(self):
+		"""Totals and the last snapshot in Prometheus text format"""
+		worker = '' if self.worker is None else ',worker="%s"' % self.worker
+		lines = [
+			'# HELP nowog_operations_total Completed operations.',
+			'# TYPE nowog_operations_total counter',
+		]
+		with self.lock:
+			totals = sorted(self.totals.items())
+			error_totals = sorted(self.error_totals.items())
+		for (kind, name), (count, _) in totals:
+			lines.append('nowog_operations_total{%s="%s"%s} %d' % (kind, name, worker, count))
+		lines += [
+			'# HELP nowog_latency_seconds_sum Sum of latency of completed operations.',
+			'# TYPE nowog_latency_seconds_sum counter',
+		]
+		for (kind, name), (_, latency_sum) in totals:
+			lines.append('nowog_latency_seconds_sum{%s="%s"%s} %f' % (kind, name, worker, latency_sum))
+		lines += [
+			'# HELP nowog_errors_total Failed operations, including retried ones.',
+			'# TYPE nowog_errors_total counter',
+		]
+		for (ID, error_class), n in error_totals:
+			lines.append('nowog_errors_total{session="%s",class="%s"%s} %d' % (ID, error_class, worker, n))
+		lines += [
+			'# HELP nowog_operations_per_second Completed operations per second in the last interval.',
+			'# TYPE nowog_operations_per_second gauge',
+			'# HELP nowog_latency_seconds Latency quantiles in the last interval.',
+			'# TYPE nowog_latency_seconds gauge',
+		]
+		snap = self.last
+		if snap:
+			for kind, group in (('session', snap['sessions']), ('type', snap['types'])):
+				for name in sorted(group):
+					lines.append('nowog_operations_per_second{%s="%s"%s} %f' % (kind, name, worker, group[name]['rate']))
+					for q in ('50', '90', '99', '99.9'):
+						lines.append('nowog_latency_seconds{%s="%s",quantile="0.%s"%s} %f'
+									% (kind, name, q.replace('.', ''), worker, group[name]['p' + q]))
+		return '\n'.join(lines) + '\n'
+
+	def startServer(self):
+		telemetry = self
+		class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+			def do_GET(self):
+				if self.path == '/metrics':
+					body, content_type = telemetry.prometheus(), 'text/plain; version=0.0.4'
+				elif self.path == '/json':
+					body, content_type = json.dumps(telemetry.last), 'application/json'
+				else:
+					self.send_error(404)
+					return
+				self.send_response(200)
+				self.send_header('Content-Type', content_type)
+				self.send_header('Content-Length', str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+			def log_message(self, *args):
+				pass
+		try:
+			self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', self.port), Handler)
+		except Exception, e:
+			self.logger.error('Unable to serve telemetry on port [%d]: %s' % (self.port, str(e)))
+			return
+		th = threading.Thread(target=self.server.serve_forever, name='executor-telemetry-http')
+		th.daemon = True
+		th.start()
+		self.logger.info('telemetry is served on http://127.0.0.1:%d/metrics' % self.port)
@@ -0,0 +1,232 @@
+#    Copyright 2016 Parinz Ameri, Haipeng Guan
+#
+#    This file is part of Nowog.
+#
+#    Nowog is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Nowog is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Nowog.  If not, see <http://www.gnu.org/licenses/>
+
+import random
+import unittest
+from bson.son import SON
+
+import backends
+import mapping
+import parser
+import retry
+from backends import OperationFailure
+
+DOCS = [
+	{'_id': 1, 'A1': 5, 'A2': 'abc', 'A3': True, 'A4': [1, 2, 3], 'A5': {'B1': 7, 'B2': ['x', 'y']}},
+	{'_id': 2, 'A1': -3, 'A2': 'xyz', 'A3': False, 'A4': [3, 4], 'A5': {'B1': 8, 'B2': ['y']}},
+	{'_id': 3, 'A1': 5.5, 'A2': 'abc', 'A4': [], 'A5': {'B1': 7}},
+	{'_id': 4, 'A1': '5', 'A3': True, 'A4': [10, 20], 'A6': [{'C1': 1}, {'C1': 9}]},
+]
+
+def insert(coll, docs, ordered=True):
+	return SON([('insert', coll), ('documents', docs), ('ordered', ordered)])
+
+def find(coll, query, sort=None):
+	cmd = SON([('find', coll), ('filter', query)])
+	if sort:
+		cmd['sort'] = sort
+	return cmd
+
+def update(coll, query, u, multi=True, upsert=False, ordered=True):
+	return SON([('update', coll), ('updates', [SON([('q', query), ('u', u), ('multi', multi), ('upsert', upsert)])]),
+				('ordered', ordered)])
+
+def delete(coll, query, limit=0):
+	return SON([('delete', coll), ('deletes', [SON([('q', query), ('limit', limit)])])])
+
+class MemoryBackendTest(unittest.TestCase):
+	def setUp(self):
+		self.db = backends.connect('memory', None, 'NoWog_test')
+		self.db.command(insert('c', DOCS))
+
+	def ids(self, query, sort=None):
+		return [doc['_id'] for doc in self.db.command(find('c', query, sort))['cursor']['firstBatch']]
+
+	def test_insert(self):
+		res = self.db.command(insert('d', [{'A1': 1}, {'A1': 2}]))
+		self.assertEqual((res['n'], 'writeErrors' in res), (2, False))
+		docs = self.db.command(find('d', {}))['cursor']['firstBatch']
+		self.assertEqual([d['A1'] for d in docs], [1, 2])
+		self.assertEqual(docs[0].keys()[0], '_id')
+		self.assertEqual(self.db.stats()['documents'], {'c': 4, 'd': 2})
+
+	def test_duplicate_key(self):
+		res = self.db.command(insert('c', [{'_id': 5}, {'_id': 1}, {'_id': 6}]))
+		self.assertEqual(res['n'], 1)
+		self.assertEqual([(e['index'], e['code']) for e in res['writeErrors']], [(1, 11000)])
+		self.assertEqual(retry.classifyWriteError(res['writeErrors'][0]), ('duplicate_key', False))
+		self.assertEqual(self.ids({'_id': 6}), [])
+
+	def test_unordered_write_errors(self):
+		res = self.db.command(insert('c', [{'_id': 1}, {'_id': 5}, {'_id': 2}, {'_id': 6}], ordered=False))
+		self.assertEqual(res['n'], 2)
+		self.assertEqual([(e['index'], e['code']) for e in res['writeErrors']], [(0, 11000), (2, 11000)])
+		self.assertEqual(self.ids({'_id': {'$in': [5, 6]}}), [5, 6])
+
+	def test_ordered_update_errors(self):
+		cmd = SON([('update', 'c'), ('updates', [
+				SON([('q', {'_id': 1}), ('u', {'$inc': {'A2': 1}})]), # not numeric
+				SON([('q', {'_id': 2}), ('u', {'$set': {'A9': 1}})]),
+			])])
+		res = self.db.command(cmd)
+		self.assertEqual(([e['index'] for e in res['writeErrors']], res['n']), ([0], 0))
+		cmd['ordered'] = False
+		res = self.db.command(cmd)
+		self.assertEqual(([e['index'] for e in res['writeErrors']], res['n']), ([0], 1))
+		self.assertEqual(self.ids({'A9': 1}), [2])
+
+	def test_equality(self):
+		self.assertEqual(self.ids({'A1': 5}), [1])
+		self.assertEqual(self.ids({'A1': 5.5}), [3])
+		self.assertEqual(self.ids({'A2': 'abc'}), [1, 3])
+		self.assertEqual(self.ids({'A3': True}), [1, 4])
+		self.assertEqual(self.ids({'A3': 1}), []) # booleans are not numbers
+		self.assertEqual(self.ids({'A4': 3}), [1, 2]) # element of an array
+		self.assertEqual(self.ids({'A4': [3, 4]}), [2]) # whole array
+		self.assertEqual(self.ids({'A5.B1': 7}), [1, 3])
+		self.assertEqual(self.ids({'A5.B2': 'y'}), [1, 2])
+		self.assertEqual(self.ids({'A6.C1': 9}), [4])
+		self.assertEqual(self.ids({'A1': 5, 'A2': 'abc'}), [1])
+
+	def test_operators(self):
+		self.assertEqual(self.ids({'A1': {'$gte': -3, '$lt': 5.5}}), [1, 2]) # range_op, not the string '5'
+		self.assertEqual(self.ids({'A1': {'$gt': 5}}), [3])
+		self.assertEqual(self.ids({'A1': {'$lte': 5}}), [1, 2])
+		self.assertEqual(self.ids({'A1': {'$eq': 5}}), [1])
+		self.assertEqual(self.ids({'A1': {'$ne': 5}}), [2, 3, 4])
+		self.assertEqual(self.ids({'A1': {'$in': [5, '5']}}), [1, 4])
+		self.assertEqual(self.ids({'A1': {'$nin': [5, '5']}}), [2, 3])
+		self.assertEqual(self.ids({'A3': {'$exists': False}}), [3])
+		self.assertEqual(self.ids({'A4': {'$all': [3, 1]}}), [1])
+		self.assertEqual(self.ids({'A4': {'$size': 2}}), [2, 4])
+		self.assertEqual(self.ids({'A4': {'$elemMatch': {'$gte': 4, '$lt': 11}}}), [2, 4]) # arr_read_op.range_op
+		self.assertEqual(self.ids({'A6': {'$elemMatch': {'C1': {'$gt': 5}}}}), [4])
+		self.assertEqual(self.ids({'$or': [{'A1': -3}, {'A2': 'abc'}]}), [1, 2, 3])
+		self.assertEqual(self.ids({'$and': [{'A3': True}, {'A4': 2}]}), [1])
+		self.assertEqual(self.ids({'$nor': [{'A3': True}, {'A4': 3}]}), [3])
+
+	def test_unsupported_operators(self):
+		geo = {'$near': {'$geometry': {'type': 'Point', 'coordinates': [0, 0]}, '$maxDistance': 50}}
+		for query, code in [({'A7': geo}, 291), ({'A1': {'$regex': 'a'}}, 2), ({'$where': 'true'}, 2)]:
+			try:
+				self.db.command(find('c', query))
+				self.fail('%r did not raise' % query)
+			except OperationFailure, e:
+				self.assertEqual(e.code, code)
+		self.assertRaises(OperationFailure, self.db.command, SON([('aggregate', 'c')]))
+
+	def test_sort(self):
+		self.assertEqual(self.ids({'A1': {'$exists': True}}, SON([('A1', -1)])), [4, 3, 1, 2])
+		self.assertEqual(self.ids({}, SON([('A2', 1), ('A1', -1)])), [4, 3, 1, 2])
+
+	def test_updates(self):
+		res = self.db.command(update('c', {'A2': 'abc'}, {'$set': {'A5.B3': 'new'}, '$inc': {'A1': 1}}))
+		self.assertEqual((res['n'], res['nModified']), (2, 2))
+		self.assertEqual(self.ids({'A5.B3': 'new', 'A1': {'$in': [6, 6.5]}}), [1, 3])
+		self.db.command(update('c', {'_id': 2}, {'$push': {'A4': 5}, '$unset': {'A3': ''}}))
+		self.assertEqual(self.ids({'A4': [3, 4, 5], 'A3': {'$exists': False}}), [2])
+		self.db.command(update('c', {'_id': 2}, {'$push': {'A4': {'$each': [6, 7]}}}))
+		self.db.command(update('c', {'_id': 2}, {'$pull': {'A4': {'$gte': 5}}}))
+		self.db.command(update('c', {'_id': 2}, {'$addToSet': {'A4': 3}}))
+		self.assertEqual(self.ids({'A4': [3, 4]}), [2])
+		res = self.db.command(update('c', {'A4': 20}, {'$set': {'A1': 0}}, multi=False))
+		self.assertEqual((res['n'], res['nModified']), (1, 1))
+		res = self.db.command(update('c', {'_id': 4}, {'$set': {'A1': 0}}))
+		self.assertEqual((res['n'], res['nModified']), (1, 0))
+
+	def test_update_errors(self):
+		for u, code in [({'$inc': {'A2': 1}}, 14), ({'$push': {'A1': 1}}, 2), ({'$set': {'A4.B1': 1}}, 28),
+						({'$rename': {'A1': 'A9'}}, 9), ({'$set': {'_id': 9}}, 66)]:
+			res = self.db.command(update('c', {'_id': 1}, u))
+			self.assertEqual(res['writeErrors'][0]['code'], code, u)
+
+	def test_upsert(self):
+		res = self.db.command(update('c', {'A1': 100, 'A2': {'$gte': 'a'}}, {'$set': {'A8': True}}, upsert=True))
+		self.assertEqual((res['n'], res['nModified'], res['upserted'][0]['index']), (1, 0, 0))
+		docs = self.db.command(find('c', {'A1': 100}))['cursor']['firstBatch']
+		self.assertEqual([(d['A1'], d['A8'], 'A2' in d) for d in docs], [(100, True, False)])
+		res = self.db.command(update('c', {'A1': 100}, {'$set': {'A8': False}}, upsert=True))
+		self.assertEqual((res['n'], 'upserted' in res), (1, False))
+
+	def test_delete(self):
+		self.assertEqual(self.db.command(delete('c', {'A2': 'abc'}, limit=1))['n'], 1)
+		self.assertEqual(self.db.command(delete('c', {'A3': True}))['n'], 1 if self.ids({'_id': 1}) == [] else 2)
+		self.assertEqual(self.db.command(delete('c', {}))['n'], len(DOCS) - 2)
+
+	def test_raw_bson(self):
+		import sessionfile
+		self.db.command(sessionfile.encodeCommand(insert('c', [{'_id': 7, 'A1': 5}])))
+		self.assertEqual(self.ids({'A1': 5}), [1, 7])
+
+class IndexTest(unittest.TestCase):
+	"""Index lookups give the same results as full scans"""
+	def execute(self, dbs, cmd):
+		results = []
+		for db in dbs:
+			try:
+				res = db.command(cmd)
+				res.get('cursor', {}).pop('id', None)
+				results.append(res)
+			except OperationFailure, e:
+				results.append(e.code)
+		self.assertEqual(results[0], results[1], cmd)
+		return results[0]
+
+	def test_generated_commands(self):
+		with open('inputs/all_cases.txt') as f:
+			rules = parser.parse_rulesetStr(f.read())
+		db_cmd = mapping.DBCommand(1, num_min=0, num_max=5, str_len_max=1, chars='ab', array_len_max=3)
+		cmds = []
+		for ID, rule in sorted(rules.items()):
+			result = rule['parser_result']
+			cmds += db_cmd.makeCommands(result['read'], result['write'], result['sort'], 100, 'c')
+		random.Random(1).shuffle(cmds)
+		fields = set()
+		for i, cmd in enumerate(cmds):
+			for doc in cmd.get('documents', []):
+				doc['_id'] = i # the same _id in both databases
+				fields.update(k for k in doc if k != '_id')
+		dbs = (backends.connect('memory', None, 'NoWog_test'),
+				backends.connect('memory', None, 'NoWog_test', sorted(fields) + ['A8.A4']))
+		for cmd in cmds:
+			self.execute(dbs, cmd)
+		self.assertEqual(dbs[0].stats(), dbs[1].stats())
+		# generated queries rarely match, query the values of the remaining documents
+		docs = dbs[0].getCollection('c').documents.values()[::4]
+		self.assertTrue(docs)
+		found = 0
+		for doc in docs:
+			for query in [{'A4': doc['A4']}, {'A3': {'$in': [doc['A3'], 'c']}, 'A1': True}, {'A5': doc['A5']},
+						{'A6': doc['A6'][0]} if doc['A6'] else {'A6': []}, {'A8.A4': doc['A8']['A4'], 'A4': {'$lt': 3}},
+						{'A7': {'$elemMatch': {'$gte': 1, '$lt': 3}}, 'A4': {'$in': [1, 2]}}]:
+				found += len(self.execute(dbs, find('c', query))['cursor']['firstBatch'])
+		self.assertTrue(found > len(docs))
+		self.assertTrue(dbs[1].getCollection('c').candidates({'A4': 1}) is not None)
+
+	def test_index_maintenance(self):
+		db = backends.connect('memory', None, 'NoWog_test', ['A4', 'A5.B1'])
+		db.command(insert('c', DOCS))
+		db.command(update('c', {'A4': 3}, {'$set': {'A4': [30]}, '$inc': {'A5.B1': 1}}))
+		db.command(delete('c', {'A4': 10}))
+		coll = db.getCollection('c')
+		for query in [{'A4': 3}, {'A4': 30}, {'A4': {'$in': [10, 30]}}, {'A5.B1': 8}, {'A5.B1': 9}, {'_id': 4}]:
+			self.assertTrue(coll.candidates(query) is not None, query)
+			self.assertEqual([d['_id'] for d in coll.find(query)],
+							[d['_id'] for _, d in coll.documents.items() if backends.match(d, query)], query)
+
+if __name__ == '__main__':
+	unittest.main()
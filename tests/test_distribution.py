@@ -0,0 +1,128 @@
+#    Copyright 2016 Parinz Ameri, Haipeng Guan
+#
+#    This file is part of Nowog.
+#
+#    Nowog is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Nowog is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Nowog.  If not, see <http://www.gnu.org/licenses/>
+
+import math
+import unittest
+import numpy as np
+
+import distribution
+from distribution import Distribution
+
+# (d_type, args) of every distribution type
+CASES = [
+	('uniform', ()),
+	('normal', (2.0,)),
+	('normal', (0.5, -100.0)), # far tail, CDF underflows
+	('normal', (1.0, 1000.0)),
+	('exponential', (3.0,)),
+	('exponential', (-3.0,)),
+	('exponential', (0.001,)),
+	('exponential', (-0.001,)),
+	('linear', (0, 1)),
+	('linear', (1, 0)),
+	('polynomial', (1, 0, 3)),
+	('poisson', ()),
+	('piecewise', (1, 0, 4)),
+	('burst', (1.0, 2.0, 10.0)),
+	('rate', (0, 10, 5, 100, 10, 0)),
+]
+
+class DistributionTest(unittest.TestCase):
+	def setUp(self):
+		self.dist = Distribution(7)
+
+	def test_range_and_order(self):
+		for d_type, args in CASES:
+			with np.errstate(over='raise', invalid='raise'):
+				x = np.asarray(self.dist.drawSamples(d_type, 10, 20, 5000, *args))
+			self.assertEqual(len(x), 5000, d_type)
+			self.assertTrue((x >= 10).all() and (x < 20).all(), (d_type, args, x.min(), x.max()))
+			self.assertTrue((np.diff(x) >= 0).all(), (d_type, args))
+
+	def test_empty(self):
+		for d_type, args in CASES:
+			self.assertEqual(len(self.dist.drawSamples(d_type, 0, 10, 0, *args)), 0, d_type)
+
+	def test_seed(self):
+		for d_type, args in CASES:
+			a = Distribution(3).drawSamples(d_type, 0, 10, 100, *args)
+			b = Distribution(3).drawSamples(d_type, 0, 10, 100, *args)
+			self.assertEqual(list(a), list(b), d_type)
+
+	def test_iter_samples(self):
+		chunk_size = distribution.CHUNK_SIZE
+		distribution.CHUNK_SIZE = 7
+		try:
+			for d_type, args in CASES:
+				x = list(Distribution(3).iterSamples(d_type, 10, 20, 100, *args))
+				self.assertEqual(x, list(Distribution(3).drawSamples(d_type, 10, 20, 100, *args)), d_type)
+				self.assertEqual(len(x), 100, d_type)
+				self.assertTrue(min(x) >= 10 and max(x) < 20 and x == sorted(x), (d_type, args))
+			# arguments are checked before the first sample
+			self.assertRaises(ValueError, Distribution(3).iterSamples, 'linear', 0, 10, 100, 0, 0)
+		finally:
+			distribution.CHUNK_SIZE = chunk_size
+
+	def test_sorted_uniform_chunks(self):
+		chunk_size = distribution.CHUNK_SIZE
+		distribution.CHUNK_SIZE = 100
+		try:
+			chunks = list(self.dist.iterSortedUniform(100050))
+		finally:
+			distribution.CHUNK_SIZE = chunk_size
+		self.assertEqual([len(c) for c in chunks], [100] * 1000 + [50])
+		u = np.concatenate(chunks)
+		self.assertTrue((u >= 0).all() and (u < 1).all() and (np.diff(u) > 0).all())
+		# the empirical CDF of sorted uniform samples is close to the identity
+		self.assertTrue(np.abs(u - np.arange(len(u)) / float(len(u))).max() < 0.01)
+		self.assertAlmostEqual(u[49999], 0.5, 2)
+
+	def test_exponential_mean(self):
+		# mean of exponential distribution with scale 5 truncated to [0, 10)
+		mean = 5 - 10 / math.expm1(2)
+		self.assertAlmostEqual(self.dist.drawSamples('exponential', 0, 10, 100000, 5.0).mean(), mean, 1)
+		self.assertAlmostEqual(self.dist.drawSamples('exponential', 0, 10, 100000, -5.0).mean(), 10 - mean, 1)
+
+	def test_exponential_overflow(self):
+		# exp((high - low) / scale) overflows for a long growing load
+		with np.errstate(over='raise', invalid='raise'):
+			x = self.dist.drawSamples('exponential', 0, 10000, 100000, -10.0)
+		self.assertTrue((x < 10000).all() and (np.diff(x) >= 0).all())
+		self.assertEqual(len(set(x.tolist())), 100000)
+		self.assertAlmostEqual(10000 - x.mean(), 10.0, 0)
+		x = self.dist.drawSamples('exponential', 0, 10000, 100000, 10.0)
+		self.assertAlmostEqual(x.mean(), 10.0, 0)
+
+	def test_normal_tail(self):
+		x = self.dist.drawSamples('normal', 0, 1, 10000, 0.01, 2.0)
+		self.assertTrue((x >= 0).all() and (x < 1).all())
+		# density near 1 is proportional to exp(-(1 - x) * 100), mean distance 0.0001
+		self.assertAlmostEqual((1 - x).mean() * 10000, 1.0, 1)
+
+	def test_rate_total(self):
+		self.assertEqual(distribution.rateTotal(0, 10, 5), 50)
+		self.assertEqual(distribution.rateTotal(0, 10, 0, 0, 10, 10), 50)
+
+	def test_errors(self):
+		for d_type, args in [('normal', ()), ('normal', (0,)), ('exponential', (0,)), ('linear', (0, 0)),
+							('linear', (-1, 1)), ('polynomial', ()), ('polynomial', (-1,)), ('piecewise', (0, 0)),
+							('burst', (0, 1, 1)), ('burst', (1, 1, 0.5)), ('rate', (1, 2, 3)), ('rate', (5, 1, 1, 1))]:
+			self.assertRaises(ValueError, self.dist.drawSamples, d_type, 0, 10, 10, *args)
+		self.assertRaises(KeyError, self.dist.drawSamples, 'zipf', 0, 10, 10)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,200 @@
+#    Copyright 2016 Parinz Ameri, Haipeng Guan
+#
+#    This file is part of Nowog.
+#
+#    Nowog is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Nowog is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Nowog.  If not, see <http://www.gnu.org/licenses/>
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from bson.son import SON
+
+from executor import Executor
+
+class SlowCollection(object):
+	def __init__(self, database, name):
+		self.database = database
+		self.name = name
+
+class SlowDatabase(object):
+	"""Executes every command in delay seconds, and keeps (sent time, command) of all of them"""
+	def __init__(self, delay=0.0):
+		self.delay = delay
+		self.commands = []
+		self.lock = threading.Lock()
+
+	def __getitem__(self, name):
+		return SlowCollection(self, name)
+
+	def command(self, cmd):
+		with self.lock:
+			self.commands.append((time.time(), cmd))
+		time.sleep(self.delay)
+		return {'ok': 1}
+
+def find(i):
+	return SON([('find', 'c'), ('filter', {'A1': i})])
+
+def insert(i):
+	return SON([('insert', 'c'), ('documents', [{'A1': i}])])
+
+class ExecutorTest(unittest.TestCase):
+	def execute(self, sessions, delay=0.0, **kwargs):
+		"""Execute sessions {ID: [(time, cmd)]} with SlowDatabase(delay), return the executor"""
+		self.db = SlowDatabase(delay)
+		exe = Executor(self.db['c'], telemetry_interval=0, keep_records=True, **kwargs)
+		for ID, ops in sorted(sessions.items()):
+			exe.addSession(ID, [t for t, _ in ops], [cmd for _, cmd in ops])
+		self.start = time.time() + 0.02
+		exe.execute(self.start)
+		return exe
+
+	def latencies(self, exe, ID):
+		"""Latency of each operation of session ID computed from records as in open and closed mode"""
+		return ([completed - scheduled for scheduled, _, completed in exe.records[ID]],
+				[completed - sent for _, sent, completed in exe.records[ID]])
+
+	def test_open_latency(self):
+		"""In open mode, latency is counted from the scheduled time, so waiting for a thread is included"""
+		exe = self.execute({'F': [(0.0, find(i)) for i in xrange(8)]}, 0.05, mode='open', threads=2)
+		from_scheduled, from_sent = self.latencies(exe, 'F')
+		self.assertEqual(len(from_scheduled), 8)
+		self.assertTrue(max(from_sent) < 0.09, from_sent)
+		self.assertTrue(max(from_scheduled) > 0.19, from_scheduled)
+		summary = exe.latency['F'].summary()
+		self.assertEqual(summary['count'], 8)
+		self.assertAlmostEqual(summary['max'], max(from_scheduled), 3)
+		# every operation is scheduled at start, none is sent before
+		self.assertTrue(all(abs(scheduled - self.start) < 1e-6 for scheduled, _, _ in exe.records['F']))
+		self.assertTrue(all(sent >= self.start for _, sent, _ in exe.records['F']))
+
+	def test_closed_latency(self):
+		"""In closed mode, latency is counted from the sent time, waiting is lateness"""
+		exe = self.execute({'F': [(0.0, find(i)) for i in xrange(8)]}, 0.05, mode='closed', threads=2)
+		from_scheduled, from_sent = self.latencies(exe, 'F')
+		summary = exe.latency['F'].summary()
+		self.assertAlmostEqual(summary['max'], max(from_sent), 3)
+		self.assertTrue(summary['max'] < 0.09, summary)
+		self.assertTrue(exe.lateness['F'].summary()['max'] > 0.14)
+
+	def test_open_schedule(self):
+		"""In open mode, a slow operation does not delay the following ones"""
+		ops = [(i * 0.02, find(i)) for i in xrange(10)]
+		exe = self.execute({'F': ops}, 0.1, mode='open', threads=10)
+		sent = sorted(t for t, _ in self.db.commands)
+		for (t, _), sent_at in zip(ops, sent):
+			self.assertTrue(0 <= sent_at - (self.start + t) < 0.05, (t, sent_at - self.start))
+
+	def test_batches(self):
+		"""Operations within batch_window are sent as one command of at most batch_size operations,
+		timing is recorded for each operation"""
+		times = [0.0, 0.01, 0.02, 0.03, 0.2, 0.21, 0.5]
+		exe = self.execute({'I': [(t, insert(i)) for i, t in enumerate(times)]}, 0.01,
+							batch_window=0.05, batch_size=3)
+		sent = [(t - self.start, cmd) for t, cmd in self.db.commands]
+		self.assertEqual([[d['A1'] for d in cmd['documents']] for _, cmd in sent], [[0, 1, 2], [3], [4, 5], [6]])
+		# a batch is sent at the scheduled time of its last operation
+		for (t, _), last in zip(sent, [0.02, 0.03, 0.21, 0.5]):
+			self.assertTrue(0 <= t - last < 0.03, (t, last))
+		records = exe.records['I']
+		self.assertEqual([round(scheduled - self.start, 6) for scheduled, _, _ in records], times)
+		# operations of a batch share sent and completed time
+		self.assertEqual(len(set((sent_at, completed) for _, sent_at, completed in records[:3])), 1)
+		self.assertEqual(exe.latency['I'].summary()['count'], 7)
+		self.assertEqual(sum(exe.target_count['I'].values()), 7)
+		self.assertEqual(sum(exe.achieved_count['I'].values()), 7)
+
+	def test_open_batch_latency(self):
+		"""In open mode, latency of an operation of a batch includes waiting for the batch"""
+		exe = self.execute({'I': [(t, insert(i)) for i, t in enumerate([0.0, 0.04, 0.08])]}, 0.0,
+							mode='open', threads=1, batch_window=0.1)
+		self.assertEqual(len(self.db.commands), 1)
+		from_scheduled, from_sent = self.latencies(exe, 'I')
+		self.assertTrue(from_scheduled[0] > 0.075 and from_scheduled[2] < 0.03, from_scheduled)
+		self.assertTrue(max(from_sent) < 0.03, from_sent)
+
+	def test_find_not_batched(self):
+		exe = self.execute({'F': [(0.0, find(i)) for i in xrange(5)]}, batch_window=1)
+		self.assertEqual(len(self.db.commands), 5)
+
+	def test_ordered(self):
+		ops = [(0.0, insert(i)) for i in xrange(4)]
+		self.execute({'I': ops}, batch_window=0.1)
+		self.assertEqual([cmd['ordered'] for _, cmd in self.db.commands], [True])
+		self.execute({'I': ops}, batch_window=0.1, ordered=False)
+		self.assertEqual([cmd['ordered'] for _, cmd in self.db.commands], [False])
+		self.assertEqual(len(self.db.commands[0][1]['documents']), 4)
+
+class WarmupTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def execute(self, times, cmd=find, **kwargs):
+		self.db = SlowDatabase()
+		exe = Executor(self.db['c'], telemetry_interval=0, report_bin=0.1, report_path=self.dir,
+						report_formats='json', **kwargs)
+		exe.addSession('S', times, [cmd(i) for i in xrange(len(times))])
+		exe.execute(time.time() + 0.02)
+		return exe
+
+	def test_warmup_time(self):
+		"""Operations scheduled before warmup are executed but not counted"""
+		times = [i * 0.02 for i in xrange(20)] # 0.2, 0.22, ... are measured
+		exe = self.execute(times, warmup=0.195, windows='all:0-1, early:0-0.1')
+		self.assertEqual(len(self.db.commands), 20)
+		self.assertEqual(exe.warmup_count['S'], 10)
+		self.assertEqual(exe.latency['S'].summary()['count'], 10)
+		self.assertEqual(exe.lateness['S'].summary()['count'], 10)
+		self.assertEqual(exe.type_latency['find'].summary()['count'], 10)
+		for counter in (exe.target_count, exe.sent_count, exe.achieved_count):
+			self.assertEqual(sum(counter['S'].values()), 10)
+			self.assertTrue(min(counter['S']) >= 1, counter)
+		rate = exe.get_rate()
+		self.assertEqual(sum(rate['target']) * rate['bin'], 10)
+		self.assertEqual(rate['target'][:2], [0.0, 0.0])
+		result = exe.get_latency()
+		self.assertEqual(result['warmup'], {'time': 0.195, 'ops': 0, 'excluded': 10})
+		all_window, early = result['windows']['all'], result['windows']['early']
+		self.assertEqual((all_window['scheduled'], all_window['completed']), (10, 10))
+		self.assertEqual((early['scheduled'], early['completed'], early['completions']), (0, 0, 0))
+		exe.show_exec_time()
+		with open(os.path.join(self.dir, 'execution_session.json')) as f:
+			series = json.load(f)['series']['S']
+		self.assertEqual((sum(series['planned']), sum(series['actual'])), (10, 10))
+
+	def test_warmup_ops(self):
+		"""The first warmup_ops operations, also within batches, are not counted"""
+		exe = self.execute([0.0] * 5 + [0.1] * 5, insert, warmup_ops=3, batch_window=0.05)
+		self.assertEqual(len(self.db.commands), 2)
+		self.assertEqual(exe.warmup_count['S'], 3)
+		self.assertEqual(exe.latency['S'].summary()['count'], 7)
+		self.assertEqual(dict(exe.target_count['S']), {0: 2, 1: 5})
+		self.assertEqual(sum(exe.achieved_count['S'].values()), 7)
+
+	def test_only_warmup(self):
+		exe = self.execute([0.0, 0.01], warmup=1)
+		self.assertEqual((exe.warmup_count['S'], exe.latency['S'].summary()['count']), (2, 0))
+		self.assertEqual(sum(exe.get_rate()['target']), 0)
+		exe.show_exec_time()
+		self.assertEqual(os.listdir(self.dir), [])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,74 @@
+#    Copyright 2016 Parinz Ameri, Haipeng Guan
+#
+#    This file is part of Nowog.
+#
+#    Nowog is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Nowog is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Nowog.  If not, see <http://www.gnu.org/licenses/>
+
+import doctest
+import random
+import unittest
+
+import histogram
+from histogram import Histogram
+
+class HistogramTest(unittest.TestCase):
+	def test_doctest(self):
+		self.assertEqual(doctest.testmod(histogram).failed, 0)
+
+	def test_bucket_range(self):
+		h = Histogram()
+		for value in [0, 1, 127, 128, 129, 255, 256, 1000, 123456, 3600*1000*1000]:
+			low, high = h.bucket_range(h.index(value))
+			self.assertTrue(low <= value <= high, (value, low, high))
+
+	def test_percentile_error_bound(self):
+		rnd = random.Random(1)
+		values = sorted(rnd.lognormvariate(-6, 1.5) for _ in xrange(20000))
+		h = Histogram()
+		for x in values:
+			h.record(x)
+		bound = 2.0 ** (1 - h.sub_bits)
+		for p in [50, 90, 99, 99.9]:
+			exact = int(values[max(int(round(len(values) * p / 100.0)), 1) - 1] * 1000000) / 1000000.0
+			self.assertTrue(abs(h.percentile(p) - exact) <= exact * bound + 1e-6, (p, h.percentile(p), exact))
+		self.assertEqual(h.percentile(100), int(values[-1] * 1000000) / 1000000.0)
+
+	def test_summary(self):
+		h = Histogram()
+		self.assertEqual(h.summary()['count'], 0)
+		self.assertEqual(h.percentile(50), None)
+		for x in [0.001, 0.002, 0.003, -1]:
+			h.record(x)
+		s = h.summary()
+		self.assertEqual((s['count'], s['min'], s['max']), (4, 0.0, 0.003))
+		self.assertAlmostEqual(s['mean'], 0.0015)
+
+	def test_overflow(self):
+		h = Histogram(max_value=1000000)
+		h.record(5)
+		self.assertEqual(h.summary()['max'], 5)
+		self.assertTrue(1 <= h.percentile(100) <= 1 + 2.0 ** (1 - h.sub_bits))
+
+	def test_merge(self):
+		a, b, both = Histogram(), Histogram(), Histogram()
+		for i in xrange(1000):
+			x = i / 10000.0
+			(a if i % 3 else b).record(x)
+			both.record(x)
+		a.merge(b)
+		self.assertEqual(a.summary(), both.summary())
+		self.assertRaises(ValueError, a.merge, Histogram(sub_bits=5))
+
+if __name__ == '__main__':
+	unittest.main()
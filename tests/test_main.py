@@ -0,0 +1,113 @@
+#    Copyright 2016 Parinz Ameri, Haipeng Guan
+#
+#    This file is part of Nowog.
+#
+#    Nowog is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Nowog is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Nowog.  If not, see <http://www.gnu.org/licenses/>
+
+import os
+import shutil
+import tempfile
+import unittest
+from bson import BSON
+
+import main
+import parser
+import seeds
+import sessionfile
+
+class MongoLikeCollection(object):
+	def __init__(self, database, name):
+		self.database = database
+		self.name = name
+
+class MongoLikeDatabase(object):
+	"""Like pymongo Database: any attribute or item is a (not callable) collection"""
+	def __getattr__(self, name):
+		return MongoLikeCollection(self, name)
+
+	def __getitem__(self, name):
+		return MongoLikeCollection(self, name)
+
+class StubExecutor(object):
+	threads = 0
+	def __init__(self):
+		self.calls = []
+
+	def setCollection(self, collection):
+		self.calls.append(('setCollection', collection.name))
+
+	def try_run(self):
+		self.calls.append('try_run')
+
+	def run(self):
+		self.calls.append('run')
+
+class ExecuteSessionsTest(unittest.TestCase):
+	def setUp(self):
+		self.connectDB = main.connectDB
+
+	def tearDown(self):
+		main.connectDB = self.connectDB
+
+	def connection(self, backend):
+		return {'backend': backend, 'URL': '', 'db_name': 'NoWog_test', 'memory_indexes': ''}
+
+	def test_mongodb(self):
+		main.connectDB = lambda connection, **kwargs: MongoLikeDatabase()
+		exe = StubExecutor()
+		main.executeSessions(exe, True, True, 1, self.connection('mongodb'), 'c')
+		self.assertEqual(exe.calls, [('setCollection', 'c'), 'try_run', 'run'])
+
+	def test_null(self):
+		exe = StubExecutor()
+		main.executeSessions(exe, False, True, 1, self.connection('null'), 'c')
+		self.assertEqual(exe.calls, [('setCollection', 'c'), 'run'])
+
+class StreamTest(unittest.TestCase):
+	"""Sessions made with and without [--stream] are the same"""
+	def setUp(self):
+		self.chunk_size = main.MAPPING_CHUNK_SIZE
+		main.MAPPING_CHUNK_SIZE = 7
+		self.dir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		main.MAPPING_CHUNK_SIZE = self.chunk_size
+		shutil.rmtree(self.dir)
+
+	def test_stream(self):
+		with open('inputs/all_cases.txt') as f:
+			sessions = parser.parse_rulesetStr(f.read())
+		for i, ID in enumerate(sorted(sessions)):
+			sessions[ID]['distribution'].update(total=20 + i, type='normal', parameters=[10])
+		values_kwargs = {'array_len_max': '3', 'str_len_max': '4'}
+		path = os.path.join(self.dir, 'sessions')
+		writer = sessionfile.SessionWriter(open(path, 'wb'))
+		main.mapSessions(sessions, seeds.SeedSequence(5), writer, values_kwargs, 'c', processes=1)
+		writer.close()
+		session_file = sessionfile.SessionFile(open(path, 'rb'))
+		try:
+			for ID in sorted(sessions):
+				stream = list(main.makeStream(sessions[ID]['distribution'], sessions[ID]['parser_result'],
+												seeds.SeedSequence(5).spawn(ID), values_kwargs, 'c'))
+				size = session_file.getSize(ID)
+				self.assertEqual(len(stream), size, ID)
+				self.assertEqual([t for t, _ in stream], session_file.getTimes(ID).tolist(), ID)
+				# the same BSON, including the order of keys
+				self.assertEqual([BSON.encode(cmd) for _, cmd in stream],
+								[session_file.getRaw(ID, i) for i in xrange(size)], ID)
+		finally:
+			session_file.close()
+
+if __name__ == '__main__':
+	unittest.main()
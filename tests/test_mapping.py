@@ -0,0 +1,137 @@
+#    Copyright 2016 Parinz Ameri, Haipeng Guan
+#
+#    This file is part of Nowog.
+#
+#    Nowog is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Nowog is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Nowog.  If not, see <http://www.gnu.org/licenses/>
+
+import unittest
+
+import mapping
+import parser
+from mapping import DBCommand, Template, makeSON, unpack
+
+# rules of every operation type, including duplicate update operators and nested documents
+RULES = open('inputs/all_cases.txt').read().rstrip().rstrip('}') + """
+	UPDATE_MERGE: {
+		{(A1: num_match)(A2: (B1: text_read)(B2: range_op))},
+		{(A1: num_match)(A2: arr_add_op.Num)(A3: text_write)(A4: arr_add_op.Text)(A5: (B1: Array.Bool)(B2: arr_remove_op.Num))},
+		NULL,
+		0 - 60 = uniform(1)
+	};
+}
+"""
+
+def ordered(value):
+	"""value with every document replaced by the list of its items and every
+	scalar by (type, value), so comparing also compares the order of keys and types"""
+	if isinstance(value, dict):
+		return [(k, ordered(v)) for k, v in value.items()]
+	if isinstance(value, list):
+		return [ordered(v) for v in value]
+	return (type(value), value)
+
+def mappingPairs(db_cmd, parser_result):
+	"""[(SON, dictionary)] mapped for one command of a rule, as in DBCommand"""
+	read, write = parser_result['read'], parser_result['write']
+	pairs = []
+	if read != [] and read[0] != 'ALL':
+		pairs.append((makeSON(unpack(read)), db_cmd.query_dict))
+	if db_cmd.isUpdate(read, write):
+		pairs.append((makeSON(unpack(write)), db_cmd.update_dict))
+	elif db_cmd.isInsert(read, write):
+		pairs.append((makeSON(write), db_cmd.document_dict))
+	return pairs
+
+class TemplateTest(unittest.TestCase):
+	def setUp(self):
+		self.rules = parser.parse_rulesetStr(RULES)
+
+	def test_types(self):
+		db_cmd = DBCommand(1)
+		types = set()
+		for rule in self.rules.values():
+			result = rule['parser_result']
+			types.add(db_cmd.makeCommands(result['read'], result['write'], result['sort'], 1, 'c')[0].keys()[0])
+		self.assertEqual(types, set(['find', 'insert', 'update', 'delete']))
+
+	def test_make(self):
+		"""Template.make() gives the same result as mapping(), and consumes the same random values"""
+		for ID, rule in sorted(self.rules.items()):
+			expected, actual = DBCommand(3), DBCommand(3)
+			pairs = zip(mappingPairs(expected, rule['parser_result']), mappingPairs(actual, rule['parser_result']))
+			self.assertTrue(pairs, ID)
+			for (data, dictionary), (_, template_dictionary) in pairs:
+				template = Template(data, template_dictionary)
+				for _ in xrange(20):
+					self.assertEqual(ordered(template.make()), ordered(mapping.mapping(data, dictionary)), ID)
+			self.assertEqual(actual.values.rand.random(), expected.values.rand.random(), ID)
+
+	def test_merge(self):
+		"""duplicate update operators are merged into one document"""
+		db_cmd = DBCommand(3)
+		_, (data, dictionary) = mappingPairs(db_cmd, self.rules['UPDATE_MERGE']['parser_result'])
+		update = Template(data, dictionary).make()
+		self.assertEqual(update.keys(), ['$set', '$push'])
+		self.assertEqual(sorted(update['$set']), ['A1', 'A3', 'A5.B1'])
+		self.assertEqual(sorted(update['$push']), ['A2', 'A4', 'A5.B2'])
+
+class TemplateBatchTest(unittest.TestCase):
+	def setUp(self):
+		self.rules = parser.parse_rulesetStr(RULES)
+
+	def structure(self, value):
+		"""value without random values: keys in order, types and lengths of arrays within settings"""
+		if isinstance(value, dict):
+			# geo_op is a constant
+			return [(k, v if k == '$near' else self.structure(v)) for k, v in value.items()]
+		if isinstance(value, list):
+			self.assertTrue(1 <= len(value) <= 3, value)
+			return ['array'] + sorted(set(self.structure(v) for v in value))
+		if isinstance(value, (int, long)) and not isinstance(value, bool):
+			self.assertTrue(-5 <= value <= 5, value)
+		if isinstance(value, str):
+			self.assertTrue(1 <= len(value) <= 2 and set(value) <= set('ab'), value)
+		return type(value).__name__
+
+	def test_make_batch(self):
+		"""makeBatch(n) has the structure of make(), and is reproducible for a fixed seed"""
+		settings = {'num_min': '-5', 'num_max': '5', 'str_len_max': '2', 'array_len_max': '3', 'chars': 'ab'}
+		for ID, rule in sorted(self.rules.items()):
+			a, b = DBCommand(3, **settings), DBCommand(3, **settings)
+			for (data, dictionary), (_, other_dictionary) in zip(mappingPairs(a, rule['parser_result']),
+																	mappingPairs(b, rule['parser_result'])):
+				template, other = Template(data, dictionary), Template(data, other_dictionary)
+				batch = template.makeBatch(200)
+				self.assertEqual(len(batch), 200)
+				self.assertEqual(ordered(batch), ordered(other.makeBatch(200)), ID)
+				single = set(repr(self.structure(template.make())) for _ in xrange(200))
+				self.assertEqual(set(repr(self.structure(doc)) for doc in batch), single, ID)
+				self.assertEqual(ordered(template.makeBatch(5)), ordered(other.makeBatch(5)), ID)
+				# documents of a batch are independent objects
+				if batch[0]:
+					self.assertFalse(batch[0] is batch[1])
+				self.assertEqual(template.makeBatch(0), [])
+
+	def test_commands(self):
+		"""makeCommands() is reproducible for a fixed seed, after seeding again and with iterCommands()"""
+		for ID, rule in sorted(self.rules.items()):
+			result = rule['parser_result']
+			a, b = DBCommand(3), DBCommand(3)
+			cmds = a.makeCommands(result['read'], result['write'], result['sort'], 50, 'c')
+			self.assertEqual(ordered(cmds), ordered(b.makeCommands(result['read'], result['write'], result['sort'], 50, 'c')), ID)
+			a.values.seed(3)
+			self.assertEqual(ordered(cmds), ordered(a.makeCommands(result['read'], result['write'], result['sort'], 50, 'c')), ID)
+
+if __name__ == '__main__':
+	unittest.main()
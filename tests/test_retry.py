@@ -0,0 +1,83 @@
+#    Copyright 2016 Parinz Ameri, Haipeng Guan
+#
+#    This file is part of Nowog.
+#
+#    Nowog is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Nowog is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Nowog.  If not, see <http://www.gnu.org/licenses/>
+
+import threading
+import time
+import unittest
+from pymongo import errors
+
+import retry
+
+class RetryTest(unittest.TestCase):
+	def test_classify(self):
+		for exc, expected in [
+				(errors.DuplicateKeyError('E11000', 11000), ('duplicate_key', False)),
+				(errors.OperationFailure('exceeded time limit', 50), ('timeout', True)),
+				(errors.OperationFailure('not master', 10107), ('not_master', True)),
+				(errors.OperationFailure('unknown', 2), ('operation_failure', False)),
+				(errors.OperationFailure('no code'), ('operation_failure', False)),
+				(errors.ExecutionTimeout('timeout', 50), ('timeout', True)),
+				(errors.NetworkTimeout('timed out'), ('timeout', True)),
+				(errors.ServerSelectionTimeoutError('no server'), ('timeout', True)),
+				(errors.NotMasterError('not master'), ('not_master', True)),
+				(errors.AutoReconnect('primary stepped down'), ('connection', True)),
+				(errors.ConnectionFailure('refused'), ('connection', True)),
+				(errors.WriteError('write', 2), ('write_error', False)),
+				(errors.InvalidOperation('invalid'), ('driver_error', False)),
+				(ValueError('bad value'), ('ValueError', False)),
+			]:
+			self.assertEqual(retry.classify(exc), expected, repr(exc))
+
+	def test_classify_write_error(self):
+		self.assertEqual(retry.classifyWriteError({'code': 11000, 'errmsg': 'E11000'}), ('duplicate_key', False))
+		self.assertEqual(retry.classifyWriteError({'code': 64}, 'write_concern'), ('timeout', True))
+		self.assertEqual(retry.classifyWriteError({'code': 2}), ('write_error', False))
+		self.assertEqual(retry.classifyWriteError({}, 'write_concern'), ('write_concern', False))
+
+	def test_backoff(self):
+		self.assertEqual([retry.backoff(0.1, 1, i) for i in xrange(6)], [0.1, 0.2, 0.4, 0.8, 1, 1])
+
+	def test_retrier(self):
+		"""stop() returns after all tasks, including tasks added by tasks, are executed"""
+		done = []
+		lock = threading.Lock()
+		def run(name, attempt):
+			with lock:
+				done.append((name, attempt))
+			if attempt < 3:
+				retrier.add(time.time() + 0.01, (name, attempt + 1))
+		retrier = retry.Retrier(run, threads=3)
+		retrier.start()
+		for i in xrange(5):
+			retrier.add(time.time() + 0.02 * (4 - i), ('task%d' % i, 0))
+		retrier.stop()
+		self.assertEqual(sorted(done), sorted(('task%d' % i, a) for i in xrange(5) for a in xrange(4)))
+		self.assertEqual((retrier.heap, retrier.running, retrier.pool), ([], 0, []))
+
+	def test_retrier_order(self):
+		done = []
+		retrier = retry.Retrier(lambda name: done.append(name), threads=1)
+		now = time.time()
+		retrier.add(now + 0.03, ('c',))
+		retrier.add(now + 0.01, ('a',))
+		retrier.add(now + 0.02, ('b',))
+		retrier.start()
+		retrier.stop()
+		self.assertEqual(done, ['a', 'b', 'c'])
+
+if __name__ == '__main__':
+	unittest.main()
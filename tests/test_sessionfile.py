@@ -0,0 +1,95 @@
+#    Copyright 2016 Parinz Ameri, Haipeng Guan
+#
+#    This file is part of Nowog.
+#
+#    Nowog is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Nowog is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Nowog.  If not, see <http://www.gnu.org/licenses/>
+
+import os
+import shutil
+import tempfile
+import unittest
+from bson.son import SON
+
+import sessionfile
+from sessionfile import SessionWriter, SessionFile
+
+def makeCommands(n):
+	return [SON([
+			('update', 'c'),
+			('updates', [SON([('q', SON([('A1', i), ('A2', {'$gte': -i, '$lt': i})])),
+							('u', {'$set': {'B1': 'x' * (i % 7), 'B2': [i, 1.5, True, None]}}),
+							('multi', True)])]),
+		]) for i in xrange(n)]
+
+class SessionFileTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.path = os.path.join(self.dir, 'temp.dat')
+		self.chunk_size = sessionfile.CHUNK_SIZE
+		sessionfile.CHUNK_SIZE = 4 # several chunks in each session
+
+	def tearDown(self):
+		sessionfile.CHUNK_SIZE = self.chunk_size
+		shutil.rmtree(self.dir)
+
+	def write(self, sessions):
+		writer = SessionWriter(open(self.path, 'wb'))
+		for ID, times, cmds in sessions:
+			writer.addSession(ID, times, cmds)
+		writer.close()
+		return SessionFile(open(self.path, 'rb'))
+
+	def test_round_trip(self):
+		cmds = makeCommands(10)
+		times = [i * 0.25 for i in xrange(10)]
+		f = self.write([('UPDATE', times, cmds), ('EMPTY', [], [])])
+		try:
+			self.assertEqual(sorted(f.getSessionIDs()), ['EMPTY', 'UPDATE'])
+			self.assertEqual((f.getSize('UPDATE'), f.getType('UPDATE')), (10, 'update'))
+			self.assertEqual(f.getSession('UPDATE'), (times, cmds))
+			self.assertEqual(f.getSession('EMPTY'), ([], []))
+			loaded = list(f.iterSession('UPDATE'))
+			self.assertEqual([t for t, _ in loaded], times)
+			self.assertEqual([sessionfile.decodeCommand(cmd) for _, cmd in loaded], cmds)
+			self.assertEqual(sessionfile.decodeCommand(f.getCommand('UPDATE', 9)), cmds[9])
+			self.assertEqual(f.getTimes('UPDATE').tolist(), times)
+		finally:
+			f.close()
+
+	def test_encoded_session(self):
+		cmds = makeCommands(9)
+		f = self.write([('UPDATE', range(9), cmds)])
+		copy_path = os.path.join(self.dir, 'copy.dat')
+		writer = SessionWriter(open(copy_path, 'wb'))
+		writer.addEncodedSession('COPY', f.getTimes('UPDATE'), f.iterChunks('UPDATE'))
+		writer.close()
+		f.close()
+		copy = SessionFile(open(copy_path, 'rb'))
+		self.assertEqual(copy.getSession('COPY'), (range(9), cmds))
+		copy.close()
+
+	def test_encode_command(self):
+		cmd = makeCommands(3)[2]
+		self.assertEqual(sessionfile.decodeCommand(sessionfile.encodeCommand(cmd)), cmd)
+
+	def test_errors(self):
+		writer = SessionWriter(open(self.path, 'wb'))
+		self.assertRaises(ValueError, writer.addSession, 'FIND', [0.0, 1.0], makeCommands(3))
+		writer.file.close()
+		with open(self.path, 'wb') as f:
+			f.write('NOTASESSIONFILE' + '\0' * 8)
+		self.assertRaises(ValueError, SessionFile, open(self.path, 'rb'))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,107 @@
+#    Copyright 2016 Parinz Ameri, Haipeng Guan
+#
+#    This file is part of Nowog.
+#
+#    Nowog is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Nowog is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Nowog.  If not, see <http://www.gnu.org/licenses/>
+
+import unittest
+
+import values
+from values import Values
+
+SETTINGS = {'num_min': '-5', 'num_max': '5', 'str_len_min': '2', 'str_len_max': '4',
+			'array_len_min': '1', 'array_len_max': '3', 'chars': 'xyz'}
+
+# (single value method, batch method, kind of value)
+METHODS = [
+	('randInt', 'randIntBatch', 'int'),
+	('randStr', 'randStrBatch', 'str'),
+	('randBool', 'randBoolBatch', 'bool'),
+	('randFloat', 'randFloatBatch', 'float'),
+	('randNum', 'randNumBatch', 'num'),
+	('randRangeDict', 'randRangeDictBatch', 'range'),
+	('randIntArray', 'randIntArrayBatch', ['int']),
+	('randNumArray', 'randNumArrayBatch', ['num']),
+	('randStrArray', 'randStrArrayBatch', ['str']),
+	('randBoolArray', 'randBoolArrayBatch', ['bool']),
+]
+
+class ValuesTest(unittest.TestCase):
+	def check(self, value, kind):
+		"""Assert that value is a valid value of kind with SETTINGS, return a summary of it"""
+		if isinstance(kind, list):
+			self.assertEqual(type(value), list)
+			self.assertTrue(1 <= len(value) <= 3, value)
+			for v in value:
+				self.check(v, kind[0])
+			return len(value)
+		if kind == 'num':
+			self.assertTrue(type(value) in (int, float), value)
+			kind = type(value).__name__
+		if kind == 'range':
+			self.assertEqual(sorted(value), ['$gte', '$lt'])
+			self.check(value['$gte'], 'int')
+			self.check(value['$lt'], 'int')
+			self.assertTrue(value['$gte'] <= value['$lt'], value)
+			return value['$lt'] - value['$gte']
+		self.assertEqual(type(value).__name__, kind)
+		if kind == 'int':
+			self.assertTrue(-5 <= value <= 5, value)
+		elif kind == 'float':
+			self.assertTrue(-5 <= value <= 5, value)
+			return 'float'
+		elif kind == 'str':
+			self.assertTrue(2 <= len(value) <= 4 and set(value) <= set('xyz'), value)
+			return len(value)
+		return value
+
+	def test_batch(self):
+		"""Batches have the same types, ranges and lengths as single values"""
+		v = Values(5, **SETTINGS)
+		for single, batch, kind in METHODS:
+			batch_values = getattr(v, batch)(2000)
+			self.assertEqual(len(batch_values), 2000, batch)
+			seen_batch = set(self.check(x, kind) for x in batch_values)
+			seen_single = set(self.check(getattr(v, single)(), kind) for _ in xrange(2000))
+			# both cover all values (e.g. both bounds of integers and lengths)
+			if kind != 'num':
+				self.assertEqual(seen_batch, seen_single, batch)
+
+	def test_bounds(self):
+		v = Values(5, **SETTINGS)
+		self.assertEqual(set(v.randIntBatch(1000)), set(xrange(-5, 6)))
+		self.assertEqual(set(len(s) for s in v.randStrBatch(1000)), set([2, 3, 4]))
+		self.assertEqual(set(len(a) for a in v.randIntArrayBatch(1000)), set([1, 2, 3]))
+		self.assertEqual(set(type(x) for x in v.randNumBatch(1000)), set([int, float]))
+		self.assertEqual([v.randIntBatch(0), v.randStrBatch(0), v.randStrArrayBatch(0)], [[], [], []])
+
+	def test_seed(self):
+		"""Batches and single values are reproducible for a fixed seed, and independent of each other"""
+		for single, batch, _ in METHODS:
+			a, b, c = Values(7, **SETTINGS), Values(7, **SETTINGS), Values(7, **SETTINGS)
+			self.assertEqual(getattr(a, batch)(100), getattr(b, batch)(100), batch)
+			self.assertEqual(getattr(a, batch)(10), getattr(b, batch)(10), batch)
+			# drawing batches does not change single values
+			self.assertEqual([getattr(a, single)() for _ in xrange(10)], [getattr(c, single)() for _ in xrange(10)], single)
+			a.seed(7)
+			self.assertEqual(getattr(a, batch)(100), getattr(Values(7, **SETTINGS), batch)(100), batch)
+		self.assertNotEqual(Values(7).randStrBatch(100), Values(8).randStrBatch(100))
+
+	def test_split(self):
+		self.assertEqual(values.split('abcdef', [1, 0, 2, 3]), ['a', '', 'bc', 'def'])
+		self.assertEqual(values.split([1, 2, 3], [3]), [[1, 2, 3]])
+		self.assertEqual(values.split([], []), [])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,84 @@
+#    Copyright 2016 Parinz Ameri, Haipeng Guan
+#
+#    This file is part of Nowog.
+#
+#    Nowog is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Nowog is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Nowog.  If not, see <http://www.gnu.org/licenses/>
+
+import doctest
+import unittest
+
+import windows
+from windows import parseWindows, Window
+
+class WindowsTest(unittest.TestCase):
+	def test_doctest(self):
+		self.assertEqual(doctest.testmod(windows).failed, 0)
+
+	def test_parse(self):
+		ws = parseWindows(' ramp : 0-60, steady:60-600,tail:600- ,')
+		self.assertEqual([(w.label, w.begin, w.end) for w in ws],
+						[('ramp', 0, 60), ('steady', 60, 600), ('tail', 600, None)])
+		self.assertEqual(parseWindows(''), [])
+
+	def test_parse_errors(self):
+		for text in ['steady', 'steady:60', 'steady:a-b', 'a:b:1-2', 'steady:60-30', 'steady:60-60',
+					'steady:-5-10', 'a:0-1, a:1-2']:
+			self.assertRaises(ValueError, parseWindows, text)
+
+	def test_contains(self):
+		w, tail = Window('w', 10, 20), Window('tail', 20)
+		self.assertEqual([w.contains(t) for t in (9.99, 10, 19.99, 20)], [False, True, True, False])
+		self.assertEqual([tail.contains(t) for t in (19.99, 20, 1e9)], [False, True, True])
+
+	def test_rates(self):
+		"""achieved rate counts completions within the window, not completions of its scheduled operations"""
+		w = Window('w', 10, 20)
+		for i in xrange(100):
+			t = 10 + i * 0.1
+			w.scheduled += 1
+			w.record('find', t, 1.0 + i * 0.1, 0.0) # completed at 11 + i * 0.2
+			if w.contains(11 + i * 0.2):
+				w.complete(11 + i * 0.2)
+		s = w.summary()
+		self.assertEqual((s['scheduled'], s['completed'], s['completions']), (100, 100, 45))
+		self.assertAlmostEqual(s['target_rate'], 10.0)
+		self.assertAlmostEqual(s['achieved_rate'], 4.5)
+		self.assertEqual(s['types']['find']['count'], 100)
+
+	def test_open_window(self):
+		w = Window('tail', 10)
+		self.assertEqual((w.summary()['target_rate'], w.summary()['achieved_rate']), (None, None))
+		for i in xrange(11):
+			w.scheduled += 1
+			w.record('insert', 10 + i, 0.5, 0.0)
+			w.complete(10.5 + i)
+		s = w.summary()
+		self.assertAlmostEqual(s['target_rate'], 1.1)
+		self.assertAlmostEqual(s['achieved_rate'], 11 / 10.5)
+
+	def test_merge(self):
+		a, b = Window('w', 0, 10), Window('w', 0, 10)
+		a.scheduled, b.scheduled = 3, 5
+		a.record('find', 1, 0.001, 0.0)
+		b.record('update', 9, 0.002, 0.0)
+		a.complete(2)
+		b.complete(9.5)
+		a.merge(b)
+		s = a.summary()
+		self.assertEqual((s['scheduled'], s['completed'], s['completions']), (8, 2, 2))
+		self.assertEqual((a.last, a.last_completed), (9, 9.5))
+		self.assertEqual(sorted(s['types']), ['find', 'update'])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -23,11 +23,21 @@ of random range in MongoDB (e.g. {"$gte": 0, "$lt": 10}), as well as random
 array of integer, string, boolean, float point.Several internal parameters
 limit the range of output numbers, characters of stringsand length of arrays.
 
+Every type of value can also be generated in batches, e.g. randIntBatch(n)
+returns a list of n random integers. Batches are drawn from a seeded
+numpy.random.RandomState with a few vectorized calls instead of one call of
+Random per value (or per character), which is much faster for large amount of
+values. Batches and single values use independent random states.
+
 """
 
 
 import random
 import string
+from itertools import chain, izip
+import numpy as np
+
+import seeds
 
 ## --------------- default values ----------------
 DEFAULT = {
@@ -45,7 +55,8 @@ class Values(object):
 
 	Attributes:
 
-		rand (Random): a Random instance used for generating all values
+		rand (Random): a Random instance used for generating single values
+		np_rand (RandomState): a numpy RandomState instance used for generating batches of values
 		num_min (int): Lower boundary of all output number (integer and float).
 				All number generated will be greater than or equal to num_min, including those in array.
 				The default value is -1000.
@@ -61,6 +72,7 @@ class Values(object):
 	def __init__(self, seed=None, **kwargs):
 		"""Able to set seed and change parameters in initialization"""
 		self.rand = random.Random()
+		self.np_rand = np.random.RandomState()
 		self.seed(seed)
 		self.set_parameters(**kwargs)
 
@@ -84,8 +96,9 @@ class Values(object):
 		self.chars = kwargs.get('chars', DEFAULT['chars'])
 
 	def seed(self, seed=None):
-		"""Initialize internal seed of Random instance"""
+		"""Initialize internal seed of Random and RandomState instance"""
 		self.rand.seed(seed)
+		self.np_rand.seed(None if seed is None else seeds.stateWords(seed))
 
 	def randInt(self):
 		return self.rand.randint(self.num_min, self.num_max)
@@ -128,6 +141,63 @@ class Values(object):
 		array_len = self.rand.randint(self.array_len_min, self.array_len_max)
 		return [self.randBool() for _ in xrange(array_len)]
 
+	# ----------------------- batches ------------------------
+	def randIntBatch(self, n):
+		return self.np_rand.randint(self.num_min, self.num_max+1, n).tolist()
+
+	def randStrBatch(self, n):
+		"""Generate n random strings, all characters are drawn at once"""
+		lengths = self.np_rand.randint(self.str_len_min, self.str_len_max+1, n)
+		chars = np.array(list(self.chars))[self.np_rand.randint(0, len(self.chars), lengths.sum())]
+		return split(''.join(chars.tolist()), lengths)
+
+	def randBoolBatch(self, n):
+		return self.np_rand.randint(0, 2, n).astype(bool).tolist()
+
+	def randFloatBatch(self, n):
+		return self.np_rand.uniform(self.num_min, self.num_max, n).tolist()
+
+	def randNumBatch(self, n):
+		"""generate n random numbers, each of them is either a integer or a float point"""
+		is_int = self.randBoolBatch(n)
+		ints = self.randIntBatch(n)
+		floats = self.randFloatBatch(n)
+		return [i if b else f for b, i, f in izip(is_int, ints, floats)]
+
+	def randRangeDictBatch(self, n):
+		a = self.np_rand.randint(self.num_min, self.num_max+1, n)
+		b = self.np_rand.randint(self.num_min, self.num_max+1, n)
+		return [{"$gte": small, "$lt": large}
+			for small, large in izip(np.minimum(a, b).tolist(), np.maximum(a, b).tolist())]
+
+	def arrayLengths(self, n):
+		return self.np_rand.randint(self.array_len_min, self.array_len_max+1, n)
+
+	def randIntArrayBatch(self, n):
+		"""Generate n arrays of random integer with random length"""
+		lengths = self.arrayLengths(n)
+		return split(self.randIntBatch(lengths.sum()), lengths)
+
+	def randNumArrayBatch(self, n):
+		"""Generate n arrays of random number with random length"""
+		lengths = self.arrayLengths(n)
+		return split(self.randNumBatch(lengths.sum()), lengths)
+
+	def randStrArrayBatch(self, n):
+		"""Generate n arrays of random string with random length"""
+		lengths = self.arrayLengths(n)
+		return split(self.randStrBatch(lengths.sum()), lengths)
+
+	def randBoolArrayBatch(self, n):
+		"""Generate n arrays of random boolean with random length"""
+		lengths = self.arrayLengths(n)
+		return split(self.randBoolBatch(lengths.sum()), lengths)
+
+def split(seq, lengths):
+	"""Split a sequence (list or str) into consecutive pieces of given lengths"""
+	ends = np.cumsum(lengths).tolist()
+	return [seq[begin:end] for begin, end in izip(chain([0], ends), ends)]
+
 # Create one instance, seeded from current time, and export its methods
 # as module-level functions. The functions share state across all uses.
 
@@ -144,3 +214,13 @@ randIntArray  = _inst.randIntArray
 randNumArray  = _inst.randNumArray
 randStrArray  = _inst.randStrArray
 randBoolArray = _inst.randBoolArray
+randIntBatch   = _inst.randIntBatch
+randStrBatch   = _inst.randStrBatch
+randBoolBatch  = _inst.randBoolBatch
+randFloatBatch = _inst.randFloatBatch
+randNumBatch   = _inst.randNumBatch
+randRangeDictBatch = _inst.randRangeDictBatch
+randIntArrayBatch  = _inst.randIntArrayBatch
+randNumArrayBatch  = _inst.randNumArrayBatch
+randStrArrayBatch  = _inst.randStrArrayBatch
+randBoolArrayBatch = _inst.randBoolArrayBatch
@@ -0,0 +1,139 @@
+#    Copyright 2016 Parinz Ameri, Haipeng Guan
+#
+#    This file is part of Nowog.
+#
+#    Nowog is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Nowog is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Nowog.  If not, see <http://www.gnu.org/licenses/>
+
+"""Measurement windows
+
+A measurement window is a labeled time range of execution, in seconds from the
+start. Operations scheduled within the range are recorded in the histograms of
+the window, and operations completed within the range are counted as its
+achieved throughput, so e.g. ramp-up and steady state are reported separately:
+
+	ramp:0-60, steady:60-600, tail:600-
+
+An open end (e.g. "600-") lasts until the end of execution. Windows may overlap,
+an operation is recorded in every window containing its scheduled time, and
+counted as completed in every window containing its completion time.
+
+Example:
+	>>> ws = parseWindows('ramp:0-60, steady:60-')
+	>>> ws[1].record('find', 60.5, 0.002, 0.0001)
+	>>> ws[1].complete(60.502)
+	>>> ws[1].summary()['latency']['p99']
+	0.002
+"""
+
+from histogram import Histogram
+
+def parseWindows(text):
+	"""[Window] of a comma separated list of label:begin-end, see the module docstring"""
+	res = []
+	for item in filter(None, [x.strip() for x in text.split(',')]):
+		try:
+			label, span = [x.strip() for x in item.split(':')]
+			begin, end = [x.strip() for x in span.split('-')]
+			window = Window(label, float(begin), float(end) if end != '' else None)
+		except ValueError:
+			raise ValueError('Invalid measurement window: [%s]. Expected label:begin-end, e.g. steady:60-600' % item)
+		if label in [w.label for w in res]:
+			raise ValueError('Duplicate measurement window: [%s]' % label)
+		res.append(window)
+	return res
+
+class Window(object):
+	"""Statistics of operations scheduled within [begin, end) seconds from the start
+
+	Attributes:
+		label (str): name of the window
+		begin (float): begin (sec from start)
+		end (float): end (sec from start), None means the end of execution
+		latency (Histogram): latency of all operations
+		lateness (Histogram): delay between scheduled and sent time of all operations
+		type_latency {str: Histogram}: latency of operations of each type
+		scheduled (int): amount of scheduled operations
+		last (float): the latest scheduled time of a recorded operation, the end of an open window
+					for the target rate
+		completions (int): amount of operations completed within the window, wherever they are scheduled
+		last_completed (float): the latest completion time counted, the end of an open window for the
+					achieved rate
+	"""
+	def __init__(self, label, begin, end=None):
+		if begin < 0 or (end is not None and end <= begin):
+			raise ValueError('Invalid range of measurement window [%s]: %s-%s' % (label, begin, end))
+		self.label = label
+		self.begin = float(begin)
+		self.end = None if end is None else float(end)
+		self.latency = Histogram()
+		self.lateness = Histogram()
+		self.type_latency = {}
+		self.scheduled = 0
+		self.last = None
+		self.completions = 0
+		self.last_completed = None
+
+	def contains(self, t):
+		return self.begin <= t and (self.end is None or t < self.end)
+
+	def record(self, cmd_type, t, latency, lateness):
+		"""Record one completed operation scheduled at t (sec from start)"""
+		self.latency.record(latency)
+		self.lateness.record(lateness)
+		self.type_latency.setdefault(cmd_type, Histogram()).record(latency)
+		if self.last is None or t > self.last:
+			self.last = t
+
+	def complete(self, t):
+		"""Count one operation completed at t (sec from start) within the window"""
+		self.completions += 1
+		if self.last_completed is None or t > self.last_completed:
+			self.last_completed = t
+
+	def merge(self, other):
+		"""Add the statistics of the same window of another executor"""
+		self.latency.merge(other.latency)
+		self.lateness.merge(other.lateness)
+		for cmd_type, hist in other.type_latency.items():
+			self.type_latency.setdefault(cmd_type, Histogram()).merge(hist)
+		self.scheduled += other.scheduled
+		if other.last is not None and (self.last is None or other.last > self.last):
+			self.last = other.last
+		self.completions += other.completions
+		if other.last_completed is not None and (self.last_completed is None or other.last_completed > self.last_completed):
+			self.last_completed = other.last_completed
+
+	def length(self, last):
+		"""Length (sec) of the window, of an open window until last (sec from start)"""
+		end = self.end if self.end is not None else last
+		return max(end - self.begin, 0.0) if end is not None else 0.0
+
+	def summary(self):
+		"""dict of range, amount of operations, target (scheduled) and achieved (completed within the window)
+		operations/sec, and summary of latency and lateness, see Histogram.summary().
+		completed is the amount of operations scheduled within the window which completed, wherever they completed"""
+		target_length = self.length(self.last)
+		achieved_length = self.length(self.last_completed)
+		return {
+			'begin': self.begin,
+			'end': self.end,
+			'scheduled': self.scheduled,
+			'completed': self.latency.total,
+			'completions': self.completions,
+			'target_rate': self.scheduled / target_length if target_length > 0 else None,
+			'achieved_rate': self.completions / achieved_length if achieved_length > 0 else None,
+			'latency': self.latency.summary(),
+			'lateness': self.lateness.summary(),
+			'types': {cmd_type: hist.summary() for cmd_type, hist in self.type_latency.items()},
+		}